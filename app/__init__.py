@@ -1,6 +1,10 @@
+import logging
 from flask import Flask
+from app.middleware import compress_response
+from app.models.database import close_request_connection
 from app.routes.recommendation import recommendation_bp
 from app.routes.csv_recommendation import csv_recommendation_bp
+from app.routes.catalog import catalog_bp
 from app.tasks.scheduled_tasks import start_scheduler
 
 
@@ -8,8 +12,19 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object("app.config.Config")
 
+    # Modules log under the app logger (compaction reports, catalog evictions)
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+
     app.register_blueprint(recommendation_bp, url_prefix="/api")
     app.register_blueprint(csv_recommendation_bp, url_prefix="/api/csv")
+    app.register_blueprint(catalog_bp, url_prefix="/api/catalogs")
+
+    # Compress JSON responses for clients that accept it
+    app.after_request(compress_response)
+
+    # Return each request's database connection to the pool
+    app.teardown_appcontext(close_request_connection)
 
     # Start the scheduler for periodic tasks
     with app.app_context():
@@ -0,0 +1,167 @@
+"""
+ASGI serving mode.
+
+Serves the same routes as the Flask app. The database-backed product
+recommendation endpoint queries the database through an async engine and
+runs the scoring in a thread pool, so the event loop never waits on the
+database or on numpy. The async routes share the admission limits of the
+Flask routes. Every other route is served by the Flask app through
+Starlette's WSGI adapter.
+
+Needs the packages in requirements-async.txt. Run with ``python run_asgi.py``
+or ``uvicorn app.asgi:app``.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # a2wsgi is optional, Starlette still ships its own adapter
+    from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from app import create_app
+from app.config import Config
+from app.middleware import admission_controller
+from app.models import async_database
+from app.models.recommendation.attribute_index import parse_filters
+from app.models.recommendation.projection import parse_fields
+from app.services.admission import AdmissionRejected, DeadlineExceeded
+from app.services.recommendation_service import RecommendationService
+
+flask_app = create_app()
+
+# CPU-bound scoring runs here, off the event loop
+scoring_executor = ThreadPoolExecutor(
+    max_workers=Config.ASYNC_SCORING_WORKERS or os.cpu_count() or 1,
+    thread_name_prefix="scoring",
+)
+
+
+def json_response(content, status_code=200, headers=None):
+    """Serialize with Flask's jsonify (same separators and key order), so both modes return the same bodies"""
+    body = flask_app.json.response(content).get_data()
+    return Response(body, status_code, headers, media_type=flask_app.json.mimetype)
+
+
+async def run_scoring(fn, *args):
+    """Run a CPU-bound call in the scoring thread pool, with the request's admission deadline"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(scoring_executor, partial(context.run, fn, *args))
+
+
+def admission_control(endpoint_class):
+    """
+    Run an async route under the admission limits of its endpoint class,
+    like the Flask routes' admission_control.
+    """
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(request):
+            if not Config.ADMISSION_ENABLED:
+                return await endpoint(request)
+            try:
+                async with admission_controller.admit_async(endpoint_class):
+                    return await endpoint(request)
+            except AdmissionRejected as e:
+                return json_response({"error": str(e)}, e.status, {"Retry-After": str(e.retry_after)})
+        return wrapper
+    return decorator
+
+
+@admission_control("light")
+async def recommend(request):
+    """Async version of GET /api/recommend"""
+    try:
+        product_id = request.query_params.get("product_id")
+        num_recommendations = int(request.query_params.get("num", 5))
+
+        if not product_id:
+            return json_response({"error": "Product ID is required"}, 400)
+
+        try:
+            filters = parse_filters(request.query_params)
+        except ValueError:
+            return json_response({"error": "min_star must be a number"}, 400)
+
+        # Check if product exists in database
+        product = await async_database.get_product_by_id(product_id)
+        if not product:
+            return json_response({"error": f"Product with ID {product_id} not found in database"}, 404)
+
+        recommendations = await run_scoring(
+            RecommendationService.score_product, product_id, num_recommendations,
+            parse_fields(request.query_params.get("fields")), filters
+        )
+
+        if isinstance(recommendations, dict) and "error" in recommendations:
+            return json_response(recommendations, 404)
+
+        return json_response({"data": recommendations})
+
+    except Exception as e:
+        return json_response({"error": f"Error generating recommendations: {str(e)}"}, 500)
+
+
+def member_endpoint(kind, get_recommendations):
+    """Async version of GET /api/recommend/category and /api/recommend/group"""
+    id_param = f"{kind}_id"
+
+    @admission_control("heavy")
+    async def endpoint(request):
+        try:
+            key = request.query_params.get(id_param)
+            num_recommendations = int(request.query_params.get("num", 5))
+
+            if not key:
+                return json_response({"error": f"{kind.capitalize()} ID is required"}, 400)
+
+            # Served from the membership index; models trained before it fall back to the database
+            recommendations = await run_scoring(
+                get_recommendations, key, num_recommendations,
+                parse_fields(request.query_params.get("fields"))
+            )
+
+            if isinstance(recommendations, dict) and "error" in recommendations:
+                return json_response(recommendations, 404)
+
+            return json_response({"recommendations": recommendations})
+
+        except DeadlineExceeded:
+            # Answered by admission control with 503
+            raise
+        except Exception as e:
+            return json_response({"error": f"Error generating {kind} recommendations: {str(e)}"}, 500)
+
+    return endpoint
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_database.dispose_async_engine()
+    scoring_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/recommend", recommend, methods=["GET"]),
+        Route("/api/recommend/category", member_endpoint(
+            "category", RecommendationService.get_category_recommendations
+        ), methods=["GET"]),
+        Route("/api/recommend/group", member_endpoint(
+            "group", RecommendationService.get_group_recommendations
+        ), methods=["GET"]),
+        # Everything else is served by the Flask app
+        Mount("/", WSGIMiddleware(flask_app)),
+    ],
+    # Compresses the async routes; Flask responses are already encoded and left as they are
+    middleware=[Middleware(GZipMiddleware, minimum_size=Config.COMPRESSION_MIN_SIZE, compresslevel=Config.GZIP_LEVEL)],
+    lifespan=lifespan,
+)
@@ -0,0 +1,138 @@
+import functools
+import gzip
+import zlib
+from flask import request, jsonify
+from app.config import Config
+from app.services.admission import AdmissionController, AdmissionRejected, EndpointLimiter
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Admission limits of the recommendation endpoints (ADMISSION_ENABLED)
+admission_controller = AdmissionController([
+    EndpointLimiter(
+        "light", Config.ADMISSION_LIGHT_CONCURRENCY, Config.ADMISSION_LIGHT_QUEUE,
+        Config.ADMISSION_LIGHT_DEADLINE_MS,
+    ),
+    EndpointLimiter(
+        "heavy", Config.ADMISSION_HEAVY_CONCURRENCY, Config.ADMISSION_HEAVY_QUEUE,
+        Config.ADMISSION_HEAVY_DEADLINE_MS,
+    ),
+])
+
+
+def _choose_encoding():
+    """Pick the best content encoding the client accepts"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def _tag_encoding(response, encoding):
+    """Give each content encoding of a representation its own strong ETag"""
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+
+def is_not_modified(etag):
+    """Check the request's If-None-Match against an ETag and its encoded variants"""
+    if_none_match = request.if_none_match
+    if not etag or not if_none_match:
+        return False
+    return if_none_match.star_tag or any(
+        if_none_match.contains(tag) for tag in (etag, f"{etag}-gzip", f"{etag}-br")
+    )
+
+
+def compress_stream(chunks):
+    """
+    Compress a streamed response body chunk by chunk.
+
+    Args:
+        chunks (iterable): Body chunks as bytes
+
+    Returns:
+        tuple: (chunks, encoding) where encoding is None if the client does
+            not accept a supported encoding
+    """
+    encoding = _choose_encoding()
+    if encoding is None:
+        return chunks, None
+
+    def compressed():
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=Config.BROTLI_QUALITY)
+            process, finish = compressor.process, compressor.finish
+        else:
+            # wbits=31 writes a gzip container
+            compressor = zlib.compressobj(Config.GZIP_LEVEL, zlib.DEFLATED, 31)
+            process, finish = compressor.compress, compressor.flush
+        for chunk in chunks:
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
+
+    return compressed(), encoding
+
+
+def compress_response(response):
+    """Compress JSON responses with brotli or gzip when the client accepts it"""
+    response.vary.add("Accept-Encoding")
+
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+    ):
+        return response
+
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        data = brotli.compress(data, quality=Config.BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=Config.GZIP_LEVEL)
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    _tag_encoding(response, encoding)
+    return response
+
+
+def admission_control(endpoint_class):
+    """
+    Run a view under the admission limits of its endpoint class.
+
+    Shed requests get 429 (queue full) or 503 (deadline passed while queued
+    or while working) with a Retry-After header.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not Config.ADMISSION_ENABLED:
+                return view(*args, **kwargs)
+            try:
+                with admission_controller.admit(endpoint_class):
+                    return view(*args, **kwargs)
+            except AdmissionRejected as e:
+                response = jsonify({"error": str(e)})
+                response.status_code = e.status
+                response.headers["Retry-After"] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
@@ -0,0 +1,74 @@
+"""Async access to the product database, used by the ASGI serving mode (app/asgi.py)"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.config import Config
+from app.models.database import (
+    as_id, engine_options, index_products, attach_related,
+    PRODUCT_BY_ID_QUERY, CATEGORIES_BY_PRODUCTS_QUERY, IMAGES_BY_PRODUCTS_QUERY,
+)
+
+# Async driver used in place of the synchronous driver of DB_URL
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+# Created on first use, so the async driver is only needed in async mode
+async_engine = None
+
+
+def async_db_url(db_url):
+    """
+    Get the async driver URL of a database URL.
+
+    Raises:
+        ValueError: If there is no known async driver for the database
+    """
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend}, set ASYNC_DB_URL")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def get_async_engine():
+    """Get the async engine, creating it on first use"""
+    global async_engine
+    if async_engine is None:
+        url = Config.ASYNC_DB_URL or async_db_url(Config.DB_URL)
+        async_engine = create_async_engine(url, **engine_options(url))
+    return async_engine
+
+
+async def dispose_async_engine():
+    """Close the async engine's pooled connections"""
+    global async_engine
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+
+
+async def _fetch_products(connection, statement, params):
+    """Fetch products with one query and add their categories and images"""
+    result = await connection.execute(statement, params)
+    columns = list(result.keys())
+    products = [dict(zip(columns, row)) for row in result]
+
+    by_id = index_products(products)
+    if by_id:
+        related_params = {"product_ids": list(by_id)}
+        attach_related(
+            by_id,
+            await connection.execute(CATEGORIES_BY_PRODUCTS_QUERY, related_params),
+            await connection.execute(IMAGES_BY_PRODUCTS_QUERY, related_params),
+        )
+    return products
+
+
+async def get_product_by_id(product_id):
+    """Get a specific product by ID, None if it does not exist or is inactive"""
+    product_id = as_id(product_id)
+    if product_id is None:
+        return None
+
+    async with get_async_engine().connect() as connection:
+        products = await _fetch_products(connection, PRODUCT_BY_ID_QUERY, {"product_id": product_id})
+    return products[0] if products else None
+
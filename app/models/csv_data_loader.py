@@ -1,71 +1,255 @@
+import hashlib
+import json
 import pandas as pd
 import os
+from app.config import Config
 from app.models.text_preprocessing import preprocess_text
 
+try:
+    import pyarrow
+except ImportError:  # Optional: Feather cache files
+    pyarrow = None
+
+# Parsed CSV data is cached in this directory next to the CSV file
+CACHE_DIR_NAME = ".cache"
+# Part of the cache file names; bump it when the parsing or the columns change
+CACHE_FORMAT_VERSION = 1
+
 def get_price_range(price):
     """Convert price to a categorical range for better recommendation"""
     # Since we don't have price in the CSV, we'll use a default value
     return "medium"
 
-def load_csv_data(csv_path="app/data/product_data.csv"):
+def load_csv_data(csv_path="app/data/product_data.csv", use_cache=None, chunk_size=None):
     """
     Load product data from CSV file
 
+    The whole catalog is held at once; training reads it with iter_csv_data.
+
     Args:
         csv_path (str): Path to the CSV file
+        use_cache (bool): Read and write the parsed cache, defaults to CSV_CACHE_ENABLED
+        chunk_size (int): Rows parsed at a time, defaults to CSV_CHUNK_SIZE
 
     Returns:
         pandas.DataFrame: DataFrame containing product data
     """
     try:
-        # Check if file exists
-        if not os.path.exists(csv_path):
-            print(f"CSV file not found at {csv_path}")
+        chunks = list(iter_csv_data(csv_path, use_cache, chunk_size))
+        if not chunks:
             return None
+        return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+    except Exception as e:
+        print(f"Error loading CSV data: {str(e)}")
+        return None
+
+def iter_csv_data(csv_path="app/data/product_data.csv", use_cache=None, chunk_size=None):
+    """
+    Get the product data of a CSV file chunk by chunk.
+
+    The parsed data (with the content column) is cached next to the CSV file,
+    keyed by its modification time, size and content hash, so the file is only
+    parsed again when it changes. A current cache is read back and split into
+    chunks; otherwise the file is parsed chunk by chunk, and the chunks are only
+    joined into one frame to write the cache once the file has been read.
+
+    Args:
+        csv_path (str): Path to the CSV file
+        use_cache (bool): Read and write the parsed cache, defaults to CSV_CACHE_ENABLED
+        chunk_size (int): Rows per chunk, defaults to CSV_CHUNK_SIZE
 
-        # Load CSV data
-        df = pd.read_csv(csv_path)
+    Yields:
+        pandas.DataFrame: Product data of each chunk, with the content column
+    """
+    # Check if file exists
+    if not os.path.exists(csv_path):
+        print(f"CSV file not found at {csv_path}")
+        return
+
+    if use_cache is None:
+        use_cache = Config.CSV_CACHE_ENABLED
+    chunk_size = chunk_size or Config.CSV_CHUNK_SIZE
 
-        # Add ID column if not exists
-        if 'id' not in df.columns:
-            df['id'] = range(1, len(df) + 1)
+    cache = CSVCache(csv_path) if use_cache else None
+    if cache is not None:
+        df = cache.load()
+        if df is not None:
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size].reset_index(drop=True)
+            return
 
-        # Rename columns to match expected format
-        column_mapping = {
-            'Tên sản phẩm': 'name',
-            'Số sao': 'star',
-            'Xuất xứ': 'cityName',
-            'Loại sản phẩm': 'groupName',
-            'Hệ thống phân phối': 'distribution',
-            'Từ khóa': 'keywords',
-            'Trang Web': 'website',
-            'Mô tả': 'description'
-        }
+    chunks = [] if cache is not None else None
+    for df in iter_csv_chunks(csv_path, chunk_size):
+        if chunks is not None:
+            chunks.append(df)
+        yield df
 
-        df = df.rename(columns=column_mapping)
+    if chunks:
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        del chunks
+        cache.save(df)
 
-        # Add missing columns with default values
-        if 'price' not in df.columns:
-            df['price'] = 100000  # Default price
+def iter_csv_chunks(csv_path="app/data/product_data.csv", chunk_size=None):
+    """
+    Parse a product CSV file chunk by chunk, building the features of each chunk.
 
-        if 'categories' not in df.columns:
-            # Extract categories from groupName if available
-            df['categories'] = df['groupName'].apply(lambda x: [x] if pd.notna(x) else [])
+    Args:
+        csv_path (str): Path to the CSV file
+        chunk_size (int): Rows per chunk, defaults to CSV_CHUNK_SIZE
+
+    Yields:
+        pandas.DataFrame: Product data of each chunk, with the content column
+    """
+    first_id = 1
+    for df in pd.read_csv(csv_path, chunksize=chunk_size or Config.CSV_CHUNK_SIZE):
+        df = prepare_chunk(df, first_id)
+        first_id += len(df)
+        yield df
 
-        # Add additional fields for compatibility with the recommendation system
-        df['quantity'] = 100  # Default quantity
-        df['isActive'] = True
-        df['groupProductId'] = 1  # Default group ID
-        df['cityId'] = 1  # Default city ID
+def prepare_chunk(df, first_id=1):
+    """
+    Map the CSV columns of a chunk and add the default fields
+
+    Args:
+        df (pandas.DataFrame): Raw CSV rows
+        first_id (int): ID of the first row when the file has no id column
+
+    Returns:
+        pandas.DataFrame: Product data with the content column
+    """
+    # Add ID column if not exists
+    if 'id' not in df.columns:
+        df['id'] = range(first_id, first_id + len(df))
 
-        # Prepare content features for recommendation
-        df = prepare_content_features(df)
+    # Rename columns to match expected format
+    column_mapping = {
+        'Tên sản phẩm': 'name',
+        'Số sao': 'star',
+        'Xuất xứ': 'cityName',
+        'Loại sản phẩm': 'groupName',
+        'Hệ thống phân phối': 'distribution',
+        'Từ khóa': 'keywords',
+        'Trang Web': 'website',
+        'Mô tả': 'description'
+    }
 
+    df = df.rename(columns=column_mapping)
+
+    # Add missing columns with default values
+    if 'price' not in df.columns:
+        df['price'] = 100000  # Default price
+
+    if 'categories' not in df.columns:
+        # Extract categories from groupName if available
+        df['categories'] = df['groupName'].apply(lambda x: [x] if pd.notna(x) else [])
+
+    # Add additional fields for compatibility with the recommendation system
+    df['quantity'] = 100  # Default quantity
+    df['isActive'] = True
+    df['groupProductId'] = 1  # Default group ID
+    df['cityId'] = 1  # Default city ID
+
+    # Prepare content features for recommendation
+    return prepare_content_features(df)
+
+class CSVCache:
+    """
+    Parsed product data cached next to its CSV file.
+
+    The cache file is named after the CSV content hash and CACHE_FORMAT_VERSION,
+    so files written by an older parser are not read back. A small metadata
+    file remembers the modification time and size the hash was computed for,
+    so an unchanged file is recognized without reading it. Feather is used
+    when pyarrow is installed, pickle otherwise.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), CACHE_DIR_NAME)
+        self.name = os.path.splitext(os.path.basename(csv_path))[0]
+        self.meta_path = os.path.join(self.cache_dir, f"{self.name}.json")
+
+    def _data_path(self, digest):
+        extension = "feather" if pyarrow is not None else "pkl"
+        return os.path.join(self.cache_dir, f"{self.name}-v{CACHE_FORMAT_VERSION}-{digest}.{extension}")
+
+    def _file_key(self):
+        stat = os.stat(self.csv_path)
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    def _digest(self):
+        sha1 = hashlib.sha1()
+        with open(self.csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+        return sha1.hexdigest()[:16]
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_meta(self, digest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.meta_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({**self._file_key(), "sha1": digest}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def load(self):
+        """Get the cached data of the current CSV file, or None"""
+        meta = self._read_meta()
+        key = self._file_key()
+        if meta.get("mtime_ns") == key["mtime_ns"] and meta.get("size") == key["size"]:
+            digest = meta.get("sha1")
+        else:
+            # Touched or changed file: the content hash decides
+            digest = self._digest()
+
+        data_path = self._data_path(digest)
+        if not os.path.exists(data_path):
+            return None
+
+        try:
+            if pyarrow is not None:
+                df = pd.read_feather(data_path)
+                # Feather returns list columns as arrays
+                df['categories'] = df['categories'].map(list)
+            else:
+                df = pd.read_pickle(data_path)
+        except Exception as e:
+            print(f"Ignoring unreadable CSV cache {data_path}: {str(e)}")
+            return None
+
+        if meta.get("sha1") != digest or meta.get("mtime_ns") != key["mtime_ns"]:
+            self._write_meta(digest)
         return df
 
-    except Exception as e:
-        print(f"Error loading CSV data: {str(e)}")
-        return None
+    def save(self, df):
+        """Cache the parsed data of the current CSV file"""
+        try:
+            digest = self._digest()
+            data_path = self._data_path(digest)
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            tmp_path = f"{data_path}.tmp{os.getpid()}"
+            if pyarrow is not None:
+                df.to_feather(tmp_path)
+            else:
+                df.to_pickle(tmp_path)
+            os.replace(tmp_path, data_path)
+            self._write_meta(digest)
+
+            # Drop the caches of older versions of the file
+            for entry in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, entry)
+                if entry.startswith(f"{self.name}-") and path != data_path:
+                    os.remove(path)
+        except Exception as e:
+            print(f"Could not write CSV cache: {str(e)}")
 
 def prepare_content_features(products_df):
     """Prepare content features from product data"""
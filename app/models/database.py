@@ -1,13 +1,99 @@
-from sqlalchemy import create_engine, text
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import g, has_app_context
+from sqlalchemy import bindparam, create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import Config
 import json
 
+
+def engine_options(db_url):
+    """Connection pool settings for an engine"""
+    options = {
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+    }
+    url = make_url(db_url)
+    # In-memory SQLite keeps one connection per thread and takes no pool sizing
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    if url.get_driver_name() == "aiosqlite":
+        # aiosqlite defaults to no pooling: a new connection and thread per checkout
+        options["poolclass"] = AsyncAdaptedQueuePool
+    options.update(
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+    )
+    return options
+
+
 # Create database engine
-engine = create_engine(Config.DB_URL)
+engine = create_engine(Config.DB_URL, **engine_options(Config.DB_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+class PoolStats:
+    """Connection pool counters, updated from pool events and checkouts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "wait_seconds_total": self.wait_seconds,
+                "wait_seconds_avg": self.wait_seconds / self.waits if self.waits else 0.0,
+                "wait_seconds_max": self.max_wait_seconds,
+            }
+
+
+pool_stats = PoolStats()
+event.listen(engine, "connect", lambda *args: pool_stats.count("connects"))
+event.listen(engine, "checkout", lambda *args: pool_stats.count("checkouts"))
+event.listen(engine, "checkin", lambda *args: pool_stats.count("checkins"))
+event.listen(engine, "invalidate", lambda *args: pool_stats.count("invalidations"))
+
+
+def get_pool_status():
+    """Get the pool configuration, its current state and the counters since startup"""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__, "pre_ping": Config.DB_POOL_PRE_PING}
+    # QueuePool reports its size; other pools do not have these methods
+    for name in ["size", "checkedin", "checkedout", "overflow"]:
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    status.update(pool_stats.snapshot())
+    return status
+
+
 def get_db_session():
     """Get a database session"""
     db = SessionLocal()
@@ -17,206 +103,248 @@ def get_db_session():
         db.close()
 
 
-def execute_query(query, params=None):
-    """Execute a raw SQL query and return results"""
+def _checkout():
+    """Check a connection out of the pool, recording the time spent waiting"""
+    start = time.perf_counter()
+    connection = engine.connect()
+    pool_stats.record_wait(time.perf_counter() - start)
+    return connection
+
+
+@contextmanager
+def connection_scope():
+    """
+    Get a connection for a group of queries.
+
+    Inside a Flask request every query shares one connection, returned to
+    the pool by close_request_connection when the request ends. Outside a
+    request (training, scheduled tasks) the connection is returned on exit.
+    """
+    if not has_app_context():
+        with _checkout() as connection:
+            yield connection
+        return
+
+    connection = g.get("db_connection")
+    if connection is None:
+        connection = g.db_connection = _checkout()
+    yield connection
+
+
+def close_request_connection(exception=None):
+    """Return the request's connection to the pool (app teardown handler)"""
+    connection = g.pop("db_connection", None)
+    if connection is not None:
+        connection.close()
+
+
+@lru_cache(maxsize=256)
+def _text(query):
+    """Build a text() statement once per distinct SQL string"""
+    return text(query)
+
+
+def _execute(connection, statement, params=None):
+    """Execute a statement, rolling back so the connection stays usable after an error"""
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text(query), params or {})
-            # Convert each row to a dictionary with proper key handling
-            return [dict(zip(result.keys(), row)) for row in result.fetchall()]
-    except Exception as e:
-        print(f"SQL execution error: {str(e)}")
-        print(f"Query: {query}")
-        print(f"Params: {params}")
-        return []
+        return connection.execute(statement, params or {})
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def execute_query(query, params=None):
+    """
+    Execute a SQL query and return its rows as dicts.
+
+    Args:
+        query (str | sqlalchemy.TextClause): SQL text or a prepared text() statement
+        params (dict): Bound parameters
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError: If the query fails
+    """
+    statement = _text(query) if isinstance(query, str) else query
+    with connection_scope() as connection:
+        result = _execute(connection, statement, params)
+        return [dict(row) for row in result.mappings()]
+
+
+# Active products with their group and city names
+PRODUCTS_QUERY = """
+SELECT
+    p."id", p."name", p."description", p."price", p."star", p."quantity",
+    p."groupProductId", p."cityId", p."isActive", p."createdAt", p."updatedAt",
+    g."name" as "groupName", c."name" as "cityName"
+FROM
+    "Product" p
+LEFT JOIN
+    "GroupProduct" g ON p."groupProductId" = g."id"
+LEFT JOIN
+    "City" c ON p."cityId" = c."id"
+WHERE
+    p."isActive" = true
+    AND p."deletedAt" IS NULL
+"""
+
+# Fixed product queries, built once so their compiled form is reused
+PRODUCT_BY_ID_QUERY = text(PRODUCTS_QUERY + """    AND p."id" = :product_id
+""")
+
+PRODUCTS_BY_IDS_QUERY = text(PRODUCTS_QUERY + """    AND p."id" IN :product_ids
+""").bindparams(bindparam("product_ids", expanding=True))
+
+PRODUCTS_BY_GROUP_QUERY = text(PRODUCTS_QUERY + """    AND p."groupProductId" = :group_id
+""")
+
+PRODUCT_IDS_BY_CATEGORY_QUERY = text("""
+SELECT "B" as "product_id"
+FROM "_CategoryToProduct"
+WHERE "A" = :category_id
+""")
+
+# Categories and images of a batch of products
+CATEGORIES_BY_PRODUCTS_QUERY = text("""
+SELECT cp."B" as "productId", cat."id", cat."name"
+FROM "Category" cat
+JOIN "_CategoryToProduct" cp ON cat."id" = cp."A"
+WHERE cp."B" IN :product_ids
+""").bindparams(bindparam("product_ids", expanding=True))
+
+IMAGES_BY_PRODUCTS_QUERY = text("""
+SELECT "productId", "publicUrl"
+FROM "Image"
+WHERE "productId" IN :product_ids
+""").bindparams(bindparam("product_ids", expanding=True))
+
+
+def index_products(products):
+    """Give products empty categories, category IDs and images, keyed by product ID"""
+    by_id = {}
+    for product in products:
+        product["categories"] = []
+        product["categoryIds"] = []
+        product["images"] = []
+        by_id[product["id"]] = product
+    return by_id
+
+
+def attach_related(by_id, category_rows, image_rows):
+    """Fill products with the rows of CATEGORIES_BY_PRODUCTS_QUERY and IMAGES_BY_PRODUCTS_QUERY"""
+    for product_id, category_id, name in category_rows:
+        by_id[product_id]["categories"].append(name)
+        by_id[product_id]["categoryIds"].append(category_id)
+
+    for product_id, public_url in image_rows:
+        by_id[product_id]["images"].append(public_url)
+
+
+def add_categories_and_images(connection, products):
+    """Attach categories, category IDs and images to a batch of products with two queries"""
+    by_id = index_products(products)
+    if not by_id:
+        return products
+
+    params = {"product_ids": list(by_id)}
+    attach_related(
+        by_id,
+        _execute(connection, CATEGORIES_BY_PRODUCTS_QUERY, params),
+        _execute(connection, IMAGES_BY_PRODUCTS_QUERY, params),
+    )
+    return products
+
+
+def _fetch_products(statement, params):
+    """Fetch products with one query and add their categories and images"""
+    with connection_scope() as connection:
+        result = _execute(connection, statement, params)
+        columns = list(result.keys())
+        products = [dict(zip(columns, row)) for row in result]
+        return add_categories_and_images(connection, products)
+
+
+def iter_product_chunks(chunk_size=None):
+    """
+    Stream all active products in chunks with a server-side cursor.
+
+    Only one chunk of rows is held at a time, and the categories and images
+    of each chunk are fetched with one query each.
+
+    Args:
+        chunk_size (int): Products per chunk, defaults to DB_CHUNK_SIZE
+
+    Yields:
+        list: Product dicts of one chunk, with categories, categoryIds and images
+    """
+    chunk_size = chunk_size or Config.DB_CHUNK_SIZE
+
+    # A dedicated connection: the cursor stays open while the chunks are consumed,
+    # so the categories and images of each chunk are fetched on a second one
+    with _checkout() as connection, _checkout() as related_connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(_text(PRODUCTS_QUERY))
+        columns = list(result.keys())
+
+        for rows in result.partitions(chunk_size):
+            products = [dict(zip(columns, row)) for row in rows]
+            yield add_categories_and_images(related_connection, products)
 
 
 def get_all_products():
     """Get all active products from the database"""
-    try:
-        # First, get basic product information
-        base_query = """
-        SELECT
-            p."id", p."name", p."description", p."price", p."star", p."quantity",
-            p."groupProductId", p."cityId", p."isActive", p."createdAt", p."updatedAt",
-            g."name" as "groupName", c."name" as "cityName"
-        FROM
-            "Product" p
-        LEFT JOIN
-            "GroupProduct" g ON p."groupProductId" = g."id"
-        LEFT JOIN
-            "City" c ON p."cityId" = c."id"
-        WHERE
-            p."isActive" = true
-            AND p."deletedAt" IS NULL
-        """
-        products = execute_query(base_query)
-
-        # If no products found, return empty list
-        if not products:
-            return []
-
-        # For each product, get its categories and images
-        for product in products:
-            product_id = product["id"]
-
-            # Get categories
-            categories_query = """
-            SELECT cat."name"
-            FROM "Category" cat
-            JOIN "_CategoryToProduct" cp ON cat."id" = cp."A"
-            WHERE cp."B" = :product_id
-            """
-            categories = execute_query(categories_query, {"product_id": product_id})
-            product["categories"] = [cat["name"] for cat in categories] if categories else []
-
-            # Get images
-            images_query = """
-            SELECT "publicUrl"
-            FROM "Image"
-            WHERE "productId" = :product_id
-            """
-            images = execute_query(images_query, {"product_id": product_id})
-            product["images"] = [img["publicUrl"] for img in images] if images else []
+    products = []
+    for chunk in iter_product_chunks():
+        products.extend(chunk)
+    return products
 
-        return products
-    except Exception as e:
-        print(f"Error fetching products: {str(e)}")
-        return []
+
+def as_id(value):
+    """Read an integer ID from a request value, None if it is not one (some drivers do not cast strings)"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 def get_product_by_id(product_id):
-    """Get a specific product by ID"""
-    try:
-        # First, get basic product information
-        base_query = """
-        SELECT
-            p."id", p."name", p."description", p."price", p."star", p."quantity",
-            p."groupProductId", p."cityId", p."isActive", p."createdAt", p."updatedAt",
-            g."name" as "groupName", c."name" as "cityName"
-        FROM
-            "Product" p
-        LEFT JOIN
-            "GroupProduct" g ON p."groupProductId" = g."id"
-        LEFT JOIN
-            "City" c ON p."cityId" = c."id"
-        WHERE
-            p."id" = :product_id
-            AND p."isActive" = true
-            AND p."deletedAt" IS NULL
-        """
-        products = execute_query(base_query, {"product_id": product_id})
-
-        # If product not found, return None
-        if not products:
-            return None
-
-        product = products[0]
-
-        # Get categories
-        categories_query = """
-        SELECT cat."name"
-        FROM "Category" cat
-        JOIN "_CategoryToProduct" cp ON cat."id" = cp."A"
-        WHERE cp."B" = :product_id
-        """
-        categories = execute_query(categories_query, {"product_id": product_id})
-        product["categories"] = [cat["name"] for cat in categories] if categories else []
-
-        # Get images
-        images_query = """
-        SELECT "publicUrl"
-        FROM "Image"
-        WHERE "productId" = :product_id
-        """
-        images = execute_query(images_query, {"product_id": product_id})
-        product["images"] = [img["publicUrl"] for img in images] if images else []
-
-        return product
-    except Exception as e:
-        print(f"Error fetching product {product_id}: {str(e)}")
+    """Get a specific product by ID, None if it does not exist or is inactive"""
+    product_id = as_id(product_id)
+    if product_id is None:
         return None
 
+    products = _fetch_products(PRODUCT_BY_ID_QUERY, {"product_id": product_id})
+    return products[0] if products else None
+
+
+def order_by_ids(products, product_ids):
+    """Sort products in the order of a list of product IDs"""
+    position = {product_id: i for i, product_id in enumerate(product_ids)}
+    return sorted(products, key=lambda product: position[product["id"]])
+
 
 def get_products_by_category(category_id):
     """Get products by category"""
-    try:
-        # First, get product IDs in this category
-        product_ids_query = """
-        SELECT "B" as "product_id"
-        FROM "_CategoryToProduct"
-        WHERE "A" = :category_id
-        """
-        product_ids_result = execute_query(product_ids_query, {"category_id": category_id})
-
-        if not product_ids_result:
-            return []
-
-        product_ids = [item["product_id"] for item in product_ids_result]
-
-        # Then get full product data for these IDs
-        products = []
-        for pid in product_ids:
-            product = get_product_by_id(pid)
-            if product:
-                products.append(product)
+    category_id = as_id(category_id)
+    if category_id is None:
+        return []
 
-        return products
-    except Exception as e:
-        print(f"Error fetching products for category {category_id}: {str(e)}")
+    with connection_scope() as connection:
+        product_ids = [
+            row[0] for row in _execute(connection, PRODUCT_IDS_BY_CATEGORY_QUERY, {"category_id": category_id})
+        ]
+    if not product_ids:
         return []
 
+    products = _fetch_products(PRODUCTS_BY_IDS_QUERY, {"product_ids": product_ids})
+
+    return order_by_ids(products, product_ids)
+
 
 def get_products_by_group(group_id):
     """Get products by group"""
-    try:
-        # Get basic product information
-        base_query = """
-        SELECT
-            p."id", p."name", p."description", p."price", p."star", p."quantity",
-            p."groupProductId", p."cityId", p."isActive", p."createdAt", p."updatedAt",
-            g."name" as "groupName", c."name" as "cityName"
-        FROM
-            "Product" p
-        LEFT JOIN
-            "GroupProduct" g ON p."groupProductId" = g."id"
-        LEFT JOIN
-            "City" c ON p."cityId" = c."id"
-        WHERE
-            p."groupProductId" = :group_id
-            AND p."isActive" = true
-            AND p."deletedAt" IS NULL
-        """
-        products = execute_query(base_query, {"group_id": group_id})
-
-        # If no products found, return empty list
-        if not products:
-            return []
-
-        # For each product, get its categories and images
-        for product in products:
-            product_id = product["id"]
-
-            # Get categories
-            categories_query = """
-            SELECT cat."name"
-            FROM "Category" cat
-            JOIN "_CategoryToProduct" cp ON cat."id" = cp."A"
-            WHERE cp."B" = :product_id
-            """
-            categories = execute_query(categories_query, {"product_id": product_id})
-            product["categories"] = [cat["name"] for cat in categories] if categories else []
-
-            # Get images
-            images_query = """
-            SELECT "publicUrl"
-            FROM "Image"
-            WHERE "productId" = :product_id
-            """
-            images = execute_query(images_query, {"product_id": product_id})
-            product["images"] = [img["publicUrl"] for img in images] if images else []
-
-        return products
-    except Exception as e:
-        print(f"Error fetching products for group {group_id}: {str(e)}")
+    group_id = as_id(group_id)
+    if group_id is None:
         return []
+
+    return _fetch_products(PRODUCTS_BY_GROUP_QUERY, {"group_id": group_id})
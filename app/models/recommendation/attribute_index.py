@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from app.models.recommendation.membership_index import MembershipIndex
+from app.models.text_preprocessing import preprocess_text
+
+# Supported recommendation filters
+FILTERS = ["city", "group", "min_star", "price_range", "category"]
+
+
+def normalize_value(value):
+    """Normalize an attribute value so filters match regardless of case or Unicode form"""
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return None
+    return preprocess_text(str(value)).strip()
+
+
+def _categories(value):
+    if isinstance(value, (list, tuple)):
+        return value
+    return []
+
+
+class AttributeIndex:
+    """
+    Membership indexes per attribute value, built once per model.
+
+    Each filter resolves to a sorted array of candidate rows, and several
+    filters are intersected, so a filtered request only ranks its candidates.
+    """
+
+    def __init__(self, items_df, price_range_fn):
+        """
+        Args:
+            items_df (pandas.DataFrame): Product data the model was trained on
+            price_range_fn (callable): Maps a price to its range name
+        """
+        self.num_rows = len(items_df)
+
+        def column(name, default=None):
+            if name in items_df.columns:
+                return items_df[name].tolist()
+            return [default] * self.num_rows
+
+        self.city = MembershipIndex.from_values([normalize_value(v)] for v in column("cityName"))
+        self.group = MembershipIndex.from_values([normalize_value(v)] for v in column("groupName"))
+        self.price_range = MembershipIndex.from_values(
+            [price_range_fn(v if pd.notna(v) else 0)] for v in column("price", 0)
+        )
+        self.category = MembershipIndex.from_values(
+            [normalize_value(cat) for cat in _categories(v)] for v in column("categories")
+        )
+
+        # Rows with star >= level for every level present in the data
+        stars = pd.to_numeric(pd.Series(column("star", 0)), errors="coerce").fillna(0).to_numpy()
+        self.star_levels = np.unique(stars)
+        self.rows_with_min_star = [
+            np.flatnonzero(stars >= level).astype(np.int32) for level in self.star_levels
+        ]
+
+    def _min_star_rows(self, min_star):
+        position = np.searchsorted(self.star_levels, min_star, side="left")
+        if position >= len(self.star_levels):
+            return np.empty(0, dtype=np.int32)
+        return self.rows_with_min_star[position]
+
+    def candidates(self, filters):
+        """
+        Get the rows that match every filter.
+
+        Args:
+            filters (dict|tuple): Filter name -> value (or (name, value) pairs), see FILTERS
+
+        Returns:
+            numpy.ndarray: Sorted matching rows, or None when nothing is filtered
+        """
+        if not filters:
+            return None
+
+        matches = []
+        for name, value in dict(filters).items():
+            if name == "min_star":
+                matches.append(self._min_star_rows(float(value)))
+            elif name == "price_range":
+                matches.append(self.price_range.rows(str(value).strip().lower()))
+            else:
+                matches.append(getattr(self, name).rows(normalize_value(value)))
+
+        # Intersect the smallest arrays first
+        matches.sort(key=len)
+        rows = matches[0]
+        for other in matches[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+
+def parse_filters(args):
+    """
+    Read recommendation filters from request arguments.
+
+    Args:
+        args (Mapping): Request query arguments
+
+    Returns:
+        tuple: Sorted (name, value) pairs usable as a cache or batch key, or
+            None when no filter is given
+
+    Raises:
+        ValueError: If min_star is not a number
+    """
+    filters = {}
+    for name in FILTERS:
+        value = args.get(name)
+        if value is None or value == "":
+            continue
+        filters[name] = float(value) if name == "min_star" else value
+    return tuple(sorted(filters.items())) or None
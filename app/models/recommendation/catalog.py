@@ -0,0 +1,538 @@
+import logging
+import os
+import pickle
+import shutil
+import numpy as np
+import scipy.sparse as sp
+from app.config import Config
+from app.models.recommendation.attribute_index import AttributeIndex
+from app.models.recommendation.compaction import compact_model, format_report
+from app.models.recommendation.delta_index import DeltaIndex, ServedRecords
+from app.models.recommendation.footprint import (
+    fit_to_budget, model_footprint, build_manifest, save_manifest, load_manifest
+)
+from app.models.recommendation.membership_index import build_membership_indexes
+from app.models.recommendation.projection import build_item_records
+from app.models.recommendation.scoring import (
+    build_id_index, lookup_row, similarity_scores, top_k_indices, build_recommendations,
+    build_ranked_recommendations
+)
+from app.models.recommendation.sharding import build_scorer
+from app.models.recommendation.suggest_index import SuggestIndex
+from app.models.recommendation.versioning import model_version
+
+logger = logging.getLogger(__name__)
+
+# Arrays of a memory-mapped CSR matrix
+MATRIX_ARRAYS = ["data", "indices", "indptr", "shape"]
+
+
+def save_mapped_matrix(matrix, directory):
+    """Write the arrays of a CSR matrix as .npy files that can be memory-mapped"""
+    tmp_directory = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(tmp_directory, exist_ok=True)
+    arrays = [matrix.data, matrix.indices, matrix.indptr, np.array(matrix.shape, dtype=np.int64)]
+    for name, array in zip(MATRIX_ARRAYS, arrays):
+        np.save(os.path.join(tmp_directory, f"{name}.npy"), array)
+
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another worker wrote the same version first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+
+def load_mapped_matrix(directory):
+    """Open a matrix written by save_mapped_matrix without reading it into memory"""
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        for name in MATRIX_ARRAYS
+    }
+    return sp.csr_matrix(
+        (arrays["data"], arrays["indices"], arrays["indptr"]),
+        shape=tuple(int(size) for size in arrays["shape"]), copy=False
+    )
+
+
+class CatalogFiles:
+    """Where a catalog's trained model lives, and how to load and save it"""
+
+    def __init__(self, name, vectorizer_path, matrix_path, items_path, price_range_fn,
+                 mmap_dir=None, membership_path=None, manifest_path=None, suggest_path=None,
+                 label=None):
+        """
+        Args:
+            name (str): Catalog name
+            vectorizer_path (str): Pickled vectorizer
+            matrix_path (str): Pickled TF-IDF matrix
+            items_path (str): Pickled product data
+            price_range_fn (callable): Maps a price to its range name
+            mmap_dir (str): Directory for memory-mapped matrix copies, None
+                keeps the matrix in memory
+            membership_path (str): Pickled category and group indexes, None
+                for catalogs without them
+            manifest_path (str): Bundle manifest (JSON), None for catalogs without one
+            suggest_path (str): Pickled suggestion index, None for catalogs without one
+            label (str): Where products are looked up, for error messages
+                (e.g. "in CSV data")
+        """
+        self.name = name
+        self.vectorizer_path = vectorizer_path
+        self.matrix_path = matrix_path
+        self.items_path = items_path
+        self.price_range_fn = price_range_fn
+        self.mmap_dir = mmap_dir
+        self.membership_path = membership_path
+        self.manifest_path = manifest_path
+        self.suggest_path = suggest_path
+        self.label = label
+
+    def version(self):
+        return model_version(self.items_path)
+
+    def _load_matrix(self):
+        """Load the matrix, memory-mapped when possible"""
+        if self.mmap_dir is None:
+            with open(self.matrix_path, 'rb') as f:
+                return pickle.load(f), False
+
+        directory = os.path.join(self.mmap_dir, f"{self.name}-{model_version(self.matrix_path)}")
+        if not os.path.isdir(directory):
+            with open(self.matrix_path, 'rb') as f:
+                save_mapped_matrix(pickle.load(f).tocsr(), directory)
+            # Older copies of this catalog are no longer loaded (mappings held elsewhere stay valid)
+            for entry in os.listdir(self.mmap_dir):
+                path = os.path.join(self.mmap_dir, entry)
+                if entry.startswith(f"{self.name}-") and path != directory and ".tmp" not in entry:
+                    shutil.rmtree(path, ignore_errors=True)
+        return load_mapped_matrix(directory), True
+
+    def _load_optional(self, path):
+        """Load an optional pickle, None if it was not saved"""
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError):
+            return None
+
+    def build_model(self, vectorizer, matrix, items_df, version=None, mapped=False,
+                    membership_indexes=None, suggest_index=None, manifest=None, id_index=None,
+                    attribute_index=None):
+        """Build a CatalogModel of this catalog, deriving the indexes it keeps when they are not given"""
+        if self.membership_path and membership_indexes is None:
+            membership_indexes = build_membership_indexes(items_df)
+        if self.suggest_path and suggest_index is None:
+            suggest_index = SuggestIndex.from_model(vectorizer, matrix, items_df)
+
+        return CatalogModel(
+            self.name, vectorizer, matrix, items_df, self.price_range_fn, version, mapped,
+            membership_indexes, suggest_index, manifest, self.label, id_index, attribute_index,
+        )
+
+    def load(self):
+        """
+        Load the catalog model.
+
+        Raises:
+            FileNotFoundError: If the catalog has not been trained
+        """
+        version = self.version()
+        with open(self.vectorizer_path, 'rb') as f:
+            vectorizer = pickle.load(f)
+        with open(self.items_path, 'rb') as f:
+            items_df = pickle.load(f)
+        matrix, mapped = self._load_matrix()
+
+        # Models saved before an index existed get it built on load
+        return self.build_model(
+            vectorizer, matrix, items_df, version, mapped,
+            membership_indexes=self._load_optional(self.membership_path),
+            suggest_index=self._load_optional(self.suggest_path),
+            manifest=load_manifest(self.manifest_path) if self.manifest_path else None,
+        )
+
+    def save(self, model):
+        """Save a trained or folded model and stamp it with the version of the saved files"""
+        with open(self.vectorizer_path, 'wb') as f:
+            pickle.dump(model.vectorizer, f)
+        with open(self.matrix_path, 'wb') as f:
+            pickle.dump(model.matrix, f)
+        if self.membership_path and model.membership_indexes is not None:
+            with open(self.membership_path, 'wb') as f:
+                pickle.dump(model.membership_indexes, f)
+        if self.suggest_path and model.suggest_index is not None:
+            with open(self.suggest_path, 'wb') as f:
+                pickle.dump(model.suggest_index, f)
+        if self.manifest_path and model.manifest is not None:
+            save_manifest(model.manifest, self.manifest_path)
+        # The items file is written last, its version marks a complete model
+        with open(self.items_path, 'wb') as f:
+            pickle.dump(model.items_df, f)
+        model.version = self.version()
+
+    def fold(self, model):
+        """
+        Merge the upserted and deleted products of a model into a new model.
+
+        The folded model is checked against the training memory budget like
+        a trained one, and gets a new manifest.
+
+        Returns:
+            CatalogModel: The folded model, not saved nor served yet
+
+        Raises:
+            ModelBudgetExceeded: If the model is over MODEL_TRAIN_BUDGET_MB
+        """
+        # Weights pruned to fit the budget at training stay pruned, for the new rows too
+        trained_threshold = (model.manifest or {}).get("prune_threshold") or 0.0
+        prune_threshold = max(Config.TFIDF_PRUNE_THRESHOLD, trained_threshold)
+        matrix, items_df = model.delta_index.fold(model.matrix, model.items_df, prune_threshold)
+        return self._build_within_budget(model.vectorizer, matrix, items_df, prune_threshold)
+
+    def train(self, vectorizer, matrix, products_df):
+        """
+        Compact a freshly fitted model, check it against the training memory
+        budget and build it.
+
+        Args:
+            vectorizer: Fitted vectorizer
+            matrix (scipy.sparse.spmatrix): Fitted TF-IDF matrix
+            products_df (pandas.DataFrame): Product data used for training
+
+        Returns:
+            CatalogModel: The model, not saved nor served yet
+
+        Raises:
+            ModelBudgetExceeded: If the model is over MODEL_TRAIN_BUDGET_MB
+        """
+        # Compact the model: float32/int32 matrix, no content column, categorical strings
+        matrix, products_df, report = compact_model(matrix, products_df, Config.TFIDF_PRUNE_THRESHOLD)
+        logger.info(format_report(report))
+
+        return self._build_within_budget(vectorizer, matrix, products_df, Config.TFIDF_PRUNE_THRESHOLD)
+
+    def _build_within_budget(self, vectorizer, matrix, products_df, prune_threshold):
+        """Check a compacted model against the training memory budget and build it with its manifest"""
+        # Every lookup structure the model keeps resident counts towards the budget,
+        # they are built once here and handed to the model
+        id_index = build_id_index(products_df)
+        attribute_index = AttributeIndex(products_df, self.price_range_fn)
+        memberships = build_membership_indexes(products_df) if self.membership_path else None
+        suggestions = SuggestIndex.from_model(vectorizer, matrix, products_df) if self.suggest_path else None
+
+        budget_bytes = int(Config.MODEL_TRAIN_BUDGET_MB * 1024 * 1024)
+        extra = {
+            name: value for name, value in (
+                ("id_index", id_index), ("attribute_index", attribute_index),
+                ("membership", memberships), ("suggest_index", suggestions),
+            ) if value is not None
+        }
+        fitted_matrix = matrix
+        matrix, footprint, prune_threshold = fit_to_budget(
+            vectorizer, matrix, products_df, budget_bytes,
+            Config.MODEL_BUDGET_ACTION, prune_threshold, extra
+        )
+        if suggestions is not None and matrix is not fitted_matrix:
+            # Document frequencies of the pruned matrix
+            suggestions = SuggestIndex.from_model(vectorizer, matrix, products_df)
+
+        return self.build_model(
+            vectorizer, matrix, products_df,
+            membership_indexes=memberships, suggest_index=suggestions,
+            manifest=build_manifest(len(products_df), prune_threshold, footprint, budget_bytes),
+            id_index=id_index, attribute_index=attribute_index,
+        )
+
+
+class CatalogModel:
+    """
+    A loaded catalog: one recommender interface whatever the catalog.
+
+    Products upserted or deleted since training are kept in a delta index and
+    served alongside the main matrix until they are folded into a new model.
+    Scoring is sharded when SCORING_SHARDS > 1.
+    """
+
+    def __init__(self, name, vectorizer, matrix, items_df, price_range_fn, version=None,
+                 mapped=False, membership_indexes=None, suggest_index=None, manifest=None, label=None,
+                 id_index=None, attribute_index=None):
+        self.name = name
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.items_df = items_df
+        self.price_range_fn = price_range_fn
+        self.version = version
+        self.mapped = mapped
+        self.membership_indexes = membership_indexes
+        self.suggest_index = suggest_index
+        self.manifest = manifest
+        self.label = label
+        self.id_index = id_index if id_index is not None else build_id_index(items_df)
+        self.item_records = build_item_records(items_df)
+        if attribute_index is None:
+            attribute_index = AttributeIndex(items_df, price_range_fn)
+        self.attribute_index = attribute_index
+        self.sharded_scorer = build_scorer(matrix, Config.SCORING_SHARDS, Config.SCORING_SHARD_BACKEND)
+        # A new main model starts with an empty delta
+        self.delta_index = DeltaIndex(len(items_df), self.id_index, price_range_fn)
+
+        # Resident heap memory; a memory-mapped matrix is paged in and out by the OS
+        footprint = self.footprint()
+        self.mapped_bytes = footprint["matrix"]["bytes"] if mapped else 0
+        self.resident_bytes = footprint["total_bytes"] - self.mapped_bytes
+        self.num_items = len(items_df)
+        self.load_seconds = None
+
+    @property
+    def has_pending_changes(self):
+        """True while upserts or deletes are waiting to be folded (they are not saved)"""
+        return not self.delta_index.state.is_empty
+
+    def generation(self):
+        """
+        Get the generation of the served results: it increases on every
+        live product update, and every new model starts a newer one
+        """
+        return self.delta_index.state.generation
+
+    def served_records(self):
+        """
+        Get the records of the products served now, upserted and deleted ones included.
+
+        Returns:
+            tuple: (ServedRecords, version of the list) where the version
+                changes with the model files and with every live product update
+        """
+        state = self.delta_index.state
+        version = self.version if state.is_empty else f"{self.version}-{state.tag}"
+        return ServedRecords(self.item_records, state), version
+
+    def _not_found(self, product_id):
+        location = f" {self.label}" if self.label else ""
+        return {"error": f"Product with ID {product_id} not found{location}"}
+
+    def recommend_batch(self, product_ids, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for several products with one sparse matrix product"""
+        delta = self.delta_index.state
+        if not delta.is_empty:
+            return self._recommend_batch_with_delta(delta, product_ids, num_recommendations, fields, filters)
+
+        # Find the row of each product in the model
+        results = [None] * len(product_ids)
+        positions, rows = [], []
+        for position, product_id in enumerate(product_ids):
+            idx = lookup_row(self.id_index, product_id)
+            if idx is None:
+                results[position] = self._not_found(product_id)
+            else:
+                positions.append(position)
+                rows.append(idx)
+
+        if not rows:
+            return results
+
+        # Rows matching the filters (None when unfiltered)
+        candidates = self.attribute_index.candidates(filters)
+
+        if self.sharded_scorer is not None:
+            ranked = self.sharded_scorer.top_k(self.matrix[rows], num_recommendations, rows, candidates)
+            for position, (sim_indices, scores) in zip(positions, ranked):
+                results[position] = build_ranked_recommendations(self.item_records, sim_indices, scores, fields)
+            return results
+
+        # Calculate cosine similarity between the products and all other products
+        sim_scores = similarity_scores(self.matrix[rows], self.matrix)
+
+        for position, idx, scores in zip(positions, rows, sim_scores):
+            # Get indices of top similar products (excluding the product itself)
+            sim_indices = top_k_indices(scores, num_recommendations, exclude=idx, candidates=candidates)
+            results[position] = build_recommendations(self.item_records, scores, sim_indices, fields)
+
+        return results
+
+    def _recommend_batch_with_delta(self, delta, product_ids, num_recommendations, fields, filters):
+        """Generate recommendations from the main model and the upserted products"""
+        results = [None] * len(product_ids)
+        positions, locations = [], []
+        for position, product_id in enumerate(product_ids):
+            location = delta.lookup(self.id_index, product_id)
+            if location is None:
+                results[position] = self._not_found(product_id)
+            else:
+                positions.append(position)
+                locations.append(location)
+
+        if not locations:
+            return results
+
+        ranked = delta.rank(
+            delta.query_vectors(self.matrix, locations), self.matrix, self.item_records,
+            self.attribute_index.candidates(filters), num_recommendations, fields, filters, locations
+        )
+        for position, recommendations in zip(positions, ranked):
+            results[position] = recommendations
+
+        return results
+
+    def recommend(self, product_id, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for a given product"""
+        return self.recommend_batch([product_id], num_recommendations, fields, filters)[0]
+
+    def recommend_keywords_batch(self, keywords_list, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for several keyword queries with one sparse matrix product"""
+        # Transform keywords to TF-IDF vectors
+        keywords_vectors = self.vectorizer.transform(list(keywords_list))
+        candidates = self.attribute_index.candidates(filters)
+
+        delta = self.delta_index.state
+        if not delta.is_empty:
+            return delta.rank(
+                keywords_vectors, self.matrix, self.item_records, candidates, num_recommendations, fields, filters
+            )
+
+        if self.sharded_scorer is not None:
+            return [
+                build_ranked_recommendations(self.item_records, sim_indices, scores, fields)
+                for sim_indices, scores in self.sharded_scorer.top_k(
+                    keywords_vectors, num_recommendations, candidates=candidates
+                )
+            ]
+
+        # Calculate cosine similarity between the keywords and all products
+        sim_scores = similarity_scores(keywords_vectors, self.matrix)
+
+        # Get the top similar products of each query with their similarity scores
+        return [
+            build_recommendations(
+                self.item_records, scores, top_k_indices(scores, num_recommendations, candidates=candidates), fields
+            )
+            for scores in sim_scores
+        ]
+
+    def recommend_keywords(self, keywords, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations based on keywords"""
+        return self.recommend_keywords_batch([keywords], num_recommendations, fields, filters)[0]
+
+    def member_rows(self, kind, key):
+        """
+        Get the model rows of a category or group from the membership index.
+
+        Args:
+            kind (str): "category" or "group"
+            key: Category or group ID
+
+        Returns:
+            numpy.ndarray: Member rows (empty if unknown), or None if the
+                model has no index for this kind
+        """
+        index = self.membership_indexes.get(kind) if self.membership_indexes else None
+        if index is None:
+            return None
+
+        try:
+            return index.rows(int(key))
+        except (TypeError, ValueError):
+            return index.rows(None)
+
+    def lookup_rows(self, product_ids):
+        """Get the model rows of the given products, skipping unknown products"""
+        rows = [lookup_row(self.id_index, product_id) for product_id in product_ids]
+        return np.array([idx for idx in rows if idx is not None], dtype=np.int32)
+
+    def recommend_for_rows(self, member_rows, num_recommendations=5, fields=None, before_chunk=None):
+        """
+        Merge the recommendations of several products (e.g. a category) into one list.
+
+        Each member gets its top recommendations like in ``recommend``, and
+        a product recommended by several members keeps its best score.
+        ``before_chunk`` is called before each chunk of members is scored and
+        may raise to abort the work (e.g. check_deadline).
+        """
+        best_scores = np.full(self.matrix.shape[0], -np.inf)
+        live_rows = self.delta_index.state.live_rows
+        chunk_size = Config.MEMBER_SCORING_CHUNK_SIZE
+
+        for start in range(0, len(member_rows), chunk_size):
+            if before_chunk is not None:
+                before_chunk()
+            chunk = member_rows[start:start + chunk_size]
+            sim_scores = similarity_scores(self.matrix[chunk], self.matrix)
+
+            for idx, scores in zip(chunk, sim_scores):
+                sim_indices = top_k_indices(scores, num_recommendations, exclude=idx, candidates=live_rows)
+                np.maximum.at(best_scores, sim_indices, scores[sim_indices])
+
+        sim_indices = top_k_indices(best_scores, num_recommendations)
+        sim_indices = sim_indices[np.isfinite(best_scores[sim_indices])]
+        return build_recommendations(self.item_records, best_scores, sim_indices, fields)
+
+    def iter_neighbors(self, num_neighbors, start_row=0, chunk_size=None, delta=None):
+        """
+        Compute the top neighbors of every product of the model, a chunk of rows at a time.
+
+        Neighbors are ranked like ``recommend`` ranks them without filters.
+        Products deleted through the delta are left out; upserted products
+        are only included once the delta is folded.
+
+        Args:
+            num_neighbors (int): Neighbors per product
+            start_row (int): First model row, to resume an interrupted run
+            chunk_size (int): Rows scored per matrix product
+            delta (DeltaState): Delta state to rank with (the current one when None)
+
+        Yields:
+            tuple: (next_row, product_ids, rows) where rows are
+                (product_id, rank, neighbor_id, score) tuples of the chunk
+        """
+        matrix, ids = self.matrix, self.items_df['id'].to_numpy()
+        delta = delta or self.delta_index.state
+        chunk_size = chunk_size or Config.MEMBER_SCORING_CHUNK_SIZE
+
+        for start in range(start_row, matrix.shape[0], chunk_size):
+            # One row per product: the row the id index serves, and not deleted
+            chunk = [row for row in range(start, min(start + chunk_size, matrix.shape[0]))
+                     if not delta.tombstones[row] and self.id_index.get(int(ids[row])) == row]
+            product_ids, rows = [], []
+            if chunk:
+                sim_scores = similarity_scores(matrix[chunk], matrix)
+                for idx, scores in zip(chunk, sim_scores):
+                    product_id = int(ids[idx])
+                    product_ids.append(product_id)
+                    sim_indices = top_k_indices(scores, num_neighbors, exclude=idx, candidates=delta.live_rows)
+                    rows.extend(
+                        (product_id, rank, int(ids[neighbor]), float(scores[neighbor]))
+                        for rank, neighbor in enumerate(sim_indices, 1)
+                    )
+            yield min(start + chunk_size, matrix.shape[0]), product_ids, rows
+
+    def suggest(self, prefix, limit=10):
+        """Complete a search prefix, None if the catalog has no suggestion index"""
+        if self.suggest_index is None:
+            return None
+        return self.suggest_index.suggest(prefix, limit)
+
+    def footprint(self):
+        """Per-component byte breakdown of the model, see model_footprint"""
+        return model_footprint(self.vectorizer, self.matrix, self.items_df, {
+            "id_index": self.id_index,
+            "item_records": self.item_records,
+            "attribute_index": self.attribute_index,
+            "membership": self.membership_indexes,
+            "suggest_index": self.suggest_index,
+            # Thread shards are views of the matrix, counted there
+            "delta": self.delta_index,
+        })
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "items": self.num_items,
+            "resident_bytes": self.resident_bytes,
+            "mapped_bytes": self.mapped_bytes,
+            "memory_mapped": self.mapped,
+            "pending_changes": len(self.delta_index),
+            "load_seconds": self.load_seconds,
+        }
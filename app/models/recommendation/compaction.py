@@ -0,0 +1,109 @@
+import numpy as np
+from sklearn.preprocessing import normalize
+
+# Repeated string columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = ["cityName", "groupName", "categories"]
+
+
+def compact_matrix(matrix, prune_threshold=0.0):
+    """
+    Downcast a TF-IDF matrix to float32 data with int32 indices.
+
+    Args:
+        matrix (scipy.sparse.spmatrix): Fitted TF-IDF matrix
+        prune_threshold (float): Weights below this value are dropped and the
+            rows are renormalized (0 disables pruning)
+
+    Returns:
+        scipy.sparse.csr_matrix: Compacted matrix
+    """
+    matrix = matrix.tocsr().astype(np.float32)
+
+    if prune_threshold and prune_threshold > 0:
+        matrix.data[matrix.data < prune_threshold] = 0
+        matrix.eliminate_zeros()
+        matrix = normalize(matrix, norm="l2", copy=False)
+
+    # int32 indices are enough as long as the number of stored weights fits
+    if matrix.nnz < np.iinfo(np.int32).max:
+        matrix.indices = matrix.indices.astype(np.int32)
+        matrix.indptr = matrix.indptr.astype(np.int32)
+
+    return matrix
+
+
+def compact_items(items_df):
+    """
+    Drop the fitted content column and dictionary-encode repeated strings.
+
+    Args:
+        items_df (pandas.DataFrame): Product data used for training
+
+    Returns:
+        pandas.DataFrame: Compacted product data
+    """
+    items_df = items_df.drop(columns=["content"], errors="ignore")
+
+    for column in CATEGORICAL_COLUMNS:
+        if column not in items_df.columns:
+            continue
+        values = items_df[column]
+        if column == "categories":
+            # Lists are not hashable, tuples serialize the same way in responses
+            values = values.astype(object).map(lambda x: tuple(x) if isinstance(x, (list, tuple)) else ())
+        items_df[column] = values.astype("category")
+
+    return items_df
+
+
+def matrix_bytes(matrix):
+    """Get the number of bytes held by a sparse matrix"""
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def memory_report(matrix, items_df):
+    """Get the in-memory size of a trained model"""
+    num_items = max(len(items_df), 1)
+    matrix_size = matrix_bytes(matrix)
+    items_size = int(items_df.memory_usage(index=True, deep=True).sum())
+
+    return {
+        "items": len(items_df),
+        "nnz": int(matrix.nnz),
+        "matrix_bytes": matrix_size,
+        "items_bytes": items_size,
+        "bytes_per_item": (matrix_size + items_size) / num_items,
+    }
+
+
+def compact_model(matrix, items_df, prune_threshold=0.0):
+    """
+    Compact a freshly trained model.
+
+    Args:
+        matrix (scipy.sparse.spmatrix): Fitted TF-IDF matrix
+        items_df (pandas.DataFrame): Product data used for training
+        prune_threshold (float): Minimum TF-IDF weight to keep
+
+    Returns:
+        tuple: (matrix, items_df, report) where report holds the memory
+            usage before and after compaction
+    """
+    before = memory_report(matrix, items_df)
+
+    matrix = compact_matrix(matrix, prune_threshold)
+    items_df = compact_items(items_df)
+
+    after = memory_report(matrix, items_df)
+    return matrix, items_df, {"before": before, "after": after}
+
+
+def format_report(report):
+    """Format a compaction report for logging"""
+    before, after = report["before"], report["after"]
+    return (
+        f"Model compaction: {before['bytes_per_item']:.0f} -> {after['bytes_per_item']:.0f} bytes per item "
+        f"(matrix {before['matrix_bytes']} -> {after['matrix_bytes']} bytes, "
+        f"items {before['items_bytes']} -> {after['items_bytes']} bytes, "
+        f"nnz {before['nnz']} -> {after['nnz']})"
+    )
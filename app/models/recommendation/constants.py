@@ -1,11 +1,18 @@
 import os
 
-# Path to save/load model files
-MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "models")
+# Path to save/load model files (MODEL_DIR overrides it, e.g. for benchmarks)
+MODEL_DIR = os.getenv("MODEL_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 TFIDF_MODEL_PATH = os.path.join(MODEL_DIR, "tfidf_vectorizer.pkl")
 MATRIX_PATH = os.path.join(MODEL_DIR, "tfidf_matrix.pkl")
 ITEMS_PATH = os.path.join(MODEL_DIR, "items.pkl")
+MEMBERSHIP_PATH = os.path.join(MODEL_DIR, "membership_index.pkl")
+MANIFEST_PATH = os.path.join(MODEL_DIR, "model_manifest.json")
+CSV_TFIDF_MODEL_PATH = os.path.join(MODEL_DIR, "csv_tfidf_vectorizer.pkl")
+CSV_MATRIX_PATH = os.path.join(MODEL_DIR, "csv_tfidf_matrix.pkl")
+CSV_ITEMS_PATH = os.path.join(MODEL_DIR, "csv_items.pkl")
+CSV_MANIFEST_PATH = os.path.join(MODEL_DIR, "csv_model_manifest.json")
+CSV_SUGGEST_PATH = os.path.join(MODEL_DIR, "csv_suggest_index.pkl")
 
 # Price range categories
 PRICE_RANGES = {
@@ -1,35 +1,10 @@
-import pickle
+import itertools
 import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from app.models.recommendation.constants import (
-    TFIDF_MODEL_PATH, MATRIX_PATH, ITEMS_PATH,
-    PRICE_RANGES, TFIDF_PARAMS, CONTENT_FEATURES
-)
+from app.models.recommendation.constants import PRICE_RANGES, TFIDF_PARAMS, CONTENT_FEATURES
+from app.models.recommendation.compaction import compact_items
+from app.models.recommendation.vectorizer import fit_vectorizer, fit_vectorizer_chunks
 from app.models.text_preprocessing import preprocess_text
 
-# Global variables to store models
-tfidf_vectorizer = None
-tfidf_matrix = None
-items_df = None
-
-
-def load_models():
-    """Load pre-trained models if they exist"""
-    global tfidf_vectorizer, tfidf_matrix, items_df
-
-    try:
-        with open(TFIDF_MODEL_PATH, 'rb') as f:
-            tfidf_vectorizer = pickle.load(f)
-        with open(MATRIX_PATH, 'rb') as f:
-            tfidf_matrix = pickle.load(f)
-        with open(ITEMS_PATH, 'rb') as f:
-            items_df = pickle.load(f)
-        return True
-    except (FileNotFoundError, EOFError):
-        return False
-
 
 def get_price_range(price):
     """Convert price to a categorical range for better recommendation"""
@@ -56,76 +31,92 @@ def prepare_content_features(products_df):
     return products_df
 
 
+def fit_content_frames(frames):
+    """
+    Fit a content-based model from chunks of product rows with their content.
+
+    The content of each chunk is turned into term counts as it arrives and the
+    chunk is compacted without it, so memory follows the size of the model
+    rather than the size of the raw product rows.
+
+    Args:
+        frames (iterable): DataFrames of products with the content column
+
+    Returns:
+        tuple: (vectorizer, tfidf_matrix, products_df), None if there were no products
+    """
+    frames = (chunk_df for chunk_df in frames if len(chunk_df))
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return None
+
+    compacted = []
+
+    def content_chunks():
+        for chunk_df in itertools.chain([first_frame], frames):
+            # Compact each chunk so the kept product columns stay small
+            compacted.append(compact_items(chunk_df))
+            yield chunk_df['content'].tolist()
+
+    vectorizer, matrix = fit_vectorizer_chunks(content_chunks(), TFIDF_PARAMS)
+    products_df = pd.concat(compacted, ignore_index=True)
+    del compacted
+
+    return vectorizer, matrix, products_df
+
+
 class ContentBasedRecommender:
-    """Content-based recommendation model using TF-IDF and cosine similarity"""
+    """
+    Content-based features of the database catalog: TF-IDF over product text.
 
-    @staticmethod
-    def load_models():
-        """Load pre-trained models if they exist"""
-        return load_models()
+    The fitted model is built, served and scored as the "db" CatalogModel.
+    """
 
     @staticmethod
-    def train(products):
-        """Train a content-based recommendation model"""
-        global tfidf_vectorizer, tfidf_matrix, items_df
+    def fit(products):
+        """
+        Fit a content-based model.
 
+        Args:
+            products (list|pandas.DataFrame): Products from the database
+
+        Returns:
+            tuple: (vectorizer, tfidf_matrix, products_df)
+        """
         # Convert products to DataFrame if it's not already
         if not isinstance(products, pd.DataFrame):
-            items_df = pd.DataFrame(products)
+            products_df = pd.DataFrame(products)
         else:
-            items_df = products
+            products_df = products
 
         # Prepare content features
-        items_df = prepare_content_features(items_df)
+        products_df = prepare_content_features(products_df)
 
         # Create TF-IDF matrix
-        tfidf_vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
-
-        tfidf_matrix = tfidf_vectorizer.fit_transform(items_df['content'])
-
-        # Save models
-        with open(TFIDF_MODEL_PATH, 'wb') as f:
-            pickle.dump(tfidf_vectorizer, f)
-        with open(MATRIX_PATH, 'wb') as f:
-            pickle.dump(tfidf_matrix, f)
-        with open(ITEMS_PATH, 'wb') as f:
-            pickle.dump(items_df, f)
+        vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
 
-        return True
+        return vectorizer, matrix, products_df
 
     @staticmethod
-    def recommend(product_id, num_recommendations=5):
-        """Generate recommendations for a given product"""
-        global tfidf_matrix, items_df
+    def fit_chunks(product_chunks):
+        """
+        Fit a content-based model from chunks of products.
 
-        if tfidf_matrix is None or items_df is None:
-            if not load_models():
-                return {"error": "Recommendation model not trained yet"}
+        Each chunk is turned into features as it arrives, see fit_content_frames.
 
-        # Find the index of the product in the dataframe
-        try:
-            product_id = int(product_id)  # Ensure product_id is an integer
-            idx = items_df[items_df['id'] == product_id].index[0]
-        except (IndexError, KeyError, ValueError):
-            return {"error": f"Product with ID {product_id} not found"}
+        Args:
+            product_chunks (iterable): Lists of product dicts (e.g. from iter_product_chunks)
 
-        # Calculate cosine similarity between the product and all other products
-        sim_scores = cosine_similarity(tfidf_matrix[idx], tfidf_matrix).flatten()
+        Returns:
+            tuple: (vectorizer, tfidf_matrix, products_df), None if there were no products
+        """
+        product_chunks = (products for products in product_chunks if products)
+        return fit_content_frames(prepare_content_features(pd.DataFrame(products)) for products in product_chunks)
 
-        # Get indices of top similar products (excluding the product itself)
-        sim_indices = sim_scores.argsort()[::-1]
-        sim_indices = sim_indices[sim_indices != idx][:num_recommendations]
-
-        # Get the products with similarity scores
-        recommended_products = []
-        for i, idx in enumerate(sim_indices):
-            product = items_df.iloc[idx].to_dict()
-            product['similarity_score'] = float(sim_scores[idx])
-
-            # Remove content field as it's not needed in the response
-            if 'content' in product:
-                del product['content']
-
-            recommended_products.append(product)
-
-        return recommended_products
+    @staticmethod
+    def prepare_products(products):
+        """Build the product rows, with their content, of new or changed products"""
+        # Products sent without categories get an empty list, like database rows
+        return prepare_content_features(
+            pd.DataFrame([{'categories': [], **product} for product in products])
+        )
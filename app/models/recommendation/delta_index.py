@@ -0,0 +1,333 @@
+import heapq
+import uuid
+from itertools import count, islice
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from app.models.recommendation.attribute_index import AttributeIndex
+from app.models.recommendation.compaction import compact_matrix, compact_items
+from app.models.recommendation.projection import build_item_records
+from app.models.recommendation.scoring import (
+    build_id_index, lookup_row, similarity_scores, top_k_indices, build_recommendations
+)
+
+# Where a product lives
+MAIN = "main"
+DELTA = "delta"
+
+# Generation numbers of delta states, increasing across every model of the process
+_generations = count(1)
+# Tells the generations of this process from those of another process or an earlier run
+_PROCESS_TAG = uuid.uuid4().hex[:8]
+
+
+def normalize_products(payload):
+    """
+    Read the products of an upsert request.
+
+    Args:
+        payload: A product dict, a list of them, or {"products": [...]}
+
+    Returns:
+        list: Product dicts with integer IDs
+
+    Raises:
+        ValueError: If there is no product or a product has no integer ID
+    """
+    if isinstance(payload, dict) and isinstance(payload.get("products"), list):
+        payload = payload["products"]
+    products = payload if isinstance(payload, list) else [payload]
+
+    if not products:
+        raise ValueError("No products given")
+
+    normalized = []
+    for product in products:
+        if not isinstance(product, dict):
+            raise ValueError("Products must be JSON objects")
+        try:
+            product_id = int(product.get("id"))
+        except (TypeError, ValueError):
+            raise ValueError("Every product needs an integer id")
+        normalized.append({**product, "id": product_id})
+
+    return normalized
+
+
+def merge_recommendations(first, second, num_recommendations):
+    """Merge two recommendation lists sorted by descending score"""
+    merged = heapq.merge(first, second, key=lambda product: -product['similarity_score'])
+    return list(islice(merged, num_recommendations))
+
+
+class ServedRecords:
+    """
+    Records of the products served with a delta state: the main rows not
+    deleted or replaced, in model order, then the upserted products.
+
+    Slicing reads only the requested records, the main records are not copied.
+    """
+
+    def __init__(self, main_records, state):
+        self.main_records = main_records
+        self.live_rows = state.live_rows
+        self.delta_records = state.records
+        self.num_main = len(main_records) if self.live_rows is None else len(self.live_rows)
+
+    def __len__(self):
+        return self.num_main + len(self.delta_records)
+
+    def _main(self, start, stop):
+        if self.live_rows is None:
+            return self.main_records[start:stop]
+        return [self.main_records[row] for row in self.live_rows[start:stop]]
+
+    def __getitem__(self, index):
+        """Get a slice of the records"""
+        start, stop, _ = index.indices(len(self))
+        records = self._main(start, min(stop, self.num_main)) if start < self.num_main else []
+        if stop > self.num_main:
+            records = records + self.delta_records[max(start - self.num_main, 0):stop - self.num_main]
+        return records
+
+    def __iter__(self):
+        if self.live_rows is None:
+            yield from self.main_records
+        else:
+            for row in self.live_rows:
+                yield self.main_records[row]
+        yield from self.delta_records
+
+
+class DeltaState:
+    """
+    One version of the delta: the upserted rows and the tombstoned main rows.
+
+    A state is never modified once built, so queries can keep using the
+    state they started with while a change builds the next one. Each state
+    gets a generation number larger than every state built before it.
+    """
+
+    def __init__(self, items_df, matrix, tombstones, price_range_fn):
+        """
+        Args:
+            items_df (pandas.DataFrame): Upserted products, None when empty
+            matrix (scipy.sparse.csr_matrix): TF-IDF rows of the upserted products
+            tombstones (numpy.ndarray): True for every deleted or replaced main row
+            price_range_fn (callable): Maps a price to its range name
+        """
+        self.items_df = items_df
+        self.matrix = matrix
+        self.tombstones = tombstones
+        self.price_range_fn = price_range_fn
+        self.generation = next(_generations)
+
+        if items_df is not None and len(items_df):
+            self.id_index = build_id_index(items_df)
+            self.records = build_item_records(items_df)
+            self.attribute_index = AttributeIndex(items_df, price_range_fn)
+        else:
+            self.id_index = {}
+            self.records = []
+            self.attribute_index = None
+
+        # Main rows still served, None when nothing is tombstoned
+        self.live_rows = np.flatnonzero(~tombstones).astype(np.int32) if tombstones.any() else None
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def is_empty(self):
+        return len(self) == 0 and self.live_rows is None
+
+    @property
+    def tag(self):
+        """Identifies this state in versions of the served products, across processes and restarts"""
+        return f"{_PROCESS_TAG}.{self.generation}"
+
+    def lookup(self, main_id_index, product_id):
+        """
+        Find the current version of a product.
+
+        Returns:
+            tuple: (MAIN or DELTA, row), or None if the product is unknown or deleted
+        """
+        row = lookup_row(self.id_index, product_id)
+        if row is not None:
+            return DELTA, row
+
+        row = lookup_row(main_id_index, product_id)
+        if row is not None and not self.tombstones[row]:
+            return MAIN, row
+        return None
+
+    def query_vectors(self, main_matrix, locations):
+        """Stack the TF-IDF rows of products found with ``lookup``"""
+        return sp.vstack([
+            main_matrix[row] if source == MAIN else self.matrix[row]
+            for source, row in locations
+        ], format="csr")
+
+    def main_candidates(self, candidates):
+        """Leave the tombstoned rows out of the main candidate rows"""
+        if self.live_rows is None:
+            return candidates
+        if candidates is None:
+            return self.live_rows
+        return candidates[~self.tombstones[candidates]]
+
+    def rank(self, query_vectors, main_matrix, main_records, main_candidates,
+             num_recommendations, fields=None, filters=None, locations=None):
+        """
+        Score queries against the main and delta matrices and merge the results.
+
+        Args:
+            query_vectors (scipy.sparse.csr_matrix): One TF-IDF row per query
+            main_matrix (scipy.sparse.csr_matrix): TF-IDF matrix of the main model
+            main_records (list): Precomputed product records of the main model
+            main_candidates (numpy.ndarray): Main rows matching the filters, None when unfiltered
+            num_recommendations (int): Number of recommendations per query
+            fields (tuple): Fields to return, None returns every field
+            filters (tuple): Recommendation filters, applied to the delta rows
+            locations (list): Location of each query product, left out of its results
+
+        Returns:
+            list: One recommendation list per query
+        """
+        main_candidates = self.main_candidates(main_candidates)
+        main_scores = similarity_scores(query_vectors, main_matrix)
+        if len(self):
+            delta_scores = similarity_scores(query_vectors, self.matrix)
+            delta_candidates = self.attribute_index.candidates(filters)
+
+        results = []
+        for position in range(query_vectors.shape[0]):
+            source, row = locations[position] if locations else (None, None)
+
+            scores = main_scores[position]
+            sim_indices = top_k_indices(
+                scores, num_recommendations,
+                exclude=row if source == MAIN else None, candidates=main_candidates
+            )
+            recommendations = build_recommendations(main_records, scores, sim_indices, fields)
+
+            if len(self):
+                scores = delta_scores[position]
+                sim_indices = top_k_indices(
+                    scores, num_recommendations,
+                    exclude=row if source == DELTA else None, candidates=delta_candidates
+                )
+                recommendations = merge_recommendations(
+                    recommendations,
+                    build_recommendations(self.records, scores, sim_indices, fields),
+                    num_recommendations,
+                )
+
+            results.append(recommendations)
+
+        return results
+
+
+class DeltaIndex:
+    """
+    Products upserted or deleted since the model was trained.
+
+    Upserted products are vectorized with the model's vectorizer into a small
+    delta matrix, and the main rows they replace or delete are tombstoned, so
+    changes are served within seconds without rebuilding the main matrix.
+    ``fold`` merges the delta into a new main model. Every change swaps in a
+    new DeltaState; callers serialize changes.
+    """
+
+    def __init__(self, num_main_rows, main_id_index, price_range_fn):
+        """
+        Args:
+            num_main_rows (int): Number of rows of the main model
+            main_id_index (dict): Product ID -> row of the main model
+            price_range_fn (callable): Maps a price to its range name
+        """
+        self.main_id_index = main_id_index
+        self.state = DeltaState(None, None, np.zeros(num_main_rows, dtype=bool), price_range_fn)
+
+    def __len__(self):
+        return len(self.state)
+
+    def _without(self, product_ids):
+        """Get the delta rows and tombstones of the current state minus the given products"""
+        state = self.state
+        tombstones = state.tombstones.copy()
+        for product_id in product_ids:
+            row = lookup_row(self.main_id_index, product_id)
+            if row is not None:
+                tombstones[row] = True
+
+        if state.items_df is None:
+            return None, None, tombstones
+
+        keep = np.flatnonzero(~state.items_df['id'].isin(product_ids).to_numpy())
+        return state.items_df.iloc[keep], state.matrix[keep], tombstones
+
+    def upsert(self, products_df, matrix):
+        """
+        Add or replace products.
+
+        Args:
+            products_df (pandas.DataFrame): Product data without the content column
+            matrix (scipy.sparse.csr_matrix): TF-IDF rows of the products, same order
+
+        Returns:
+            int: Number of products in the delta
+        """
+        # The last version of a product sent twice wins
+        keep = np.flatnonzero(~products_df['id'].duplicated(keep="last").to_numpy())
+        products_df, matrix = products_df.iloc[keep], matrix[keep]
+
+        items_df, delta_matrix, tombstones = self._without(products_df['id'].tolist())
+        if items_df is not None:
+            products_df = pd.concat([items_df, products_df], ignore_index=True)
+            matrix = sp.vstack([delta_matrix, matrix], format="csr")
+
+        self.state = DeltaState(
+            products_df.reset_index(drop=True), matrix, tombstones, self.state.price_range_fn
+        )
+        return len(self.state)
+
+    def delete(self, product_id):
+        """
+        Delete a product.
+
+        Returns:
+            bool: False if the product is unknown or already deleted
+        """
+        if self.state.lookup(self.main_id_index, product_id) is None:
+            return False
+
+        items_df, matrix, tombstones = self._without([int(product_id)])
+        self.state = DeltaState(items_df, matrix, tombstones, self.state.price_range_fn)
+        return True
+
+    def fold(self, main_matrix, main_items_df, prune_threshold=0.0):
+        """
+        Merge the delta into the main model.
+
+        Args:
+            main_matrix (scipy.sparse.csr_matrix): TF-IDF matrix of the main model
+            main_items_df (pandas.DataFrame): Product data of the main model
+            prune_threshold (float): See compact_matrix
+
+        Returns:
+            tuple: (matrix, items_df) of the new main model
+        """
+        state = self.state
+        live_rows = np.flatnonzero(~state.tombstones)
+
+        matrices = [main_matrix[live_rows]]
+        frames = [main_items_df.iloc[live_rows]]
+        if len(state):
+            matrices.append(state.matrix)
+            frames.append(state.items_df)
+
+        matrix = compact_matrix(sp.vstack(matrices, format="csr"), prune_threshold)
+        items_df = compact_items(pd.concat(frames, ignore_index=True))
+        return matrix, items_df
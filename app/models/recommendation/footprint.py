@@ -0,0 +1,219 @@
+import json
+import sys
+import types
+from datetime import datetime, timezone
+import numpy as np
+import scipy.sparse as sp
+from app.models.recommendation.compaction import compact_matrix, matrix_bytes
+from app.models.recommendation.projection import build_item_records
+
+# Budget actions when a trained model is too large
+REFUSE_ACTION = "refuse"
+PRUNE_ACTION = "prune"
+
+# TF-IDF weight thresholds tried in turn by the prune action
+PRUNE_STEPS = [0.01, 0.02, 0.05, 0.1, 0.2]
+
+# Containers longer than this are measured on a sample
+_SAMPLE_SIZE = 200
+
+
+class ModelBudgetExceeded(Exception):
+    """A trained model does not fit in the memory budget; the loaded model is kept"""
+
+
+def deep_bytes(obj, _seen=None):
+    """
+    Estimate the heap bytes held by an object and everything it references.
+
+    numpy arrays count their buffers, containers their items and other
+    objects their attributes. Long lists are measured on a sample.
+    """
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + deep_bytes(obj.ravel().tolist(), seen)
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    if sp.issparse(obj):
+        return matrix_bytes(obj.tocsr()) if obj.format != "csr" else matrix_bytes(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return sys.getsizeof(obj)
+    if isinstance(obj, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+        # Code is shared with the rest of the process
+        return 0
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_bytes(k, seen) + deep_bytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj)
+        if len(items) > _SAMPLE_SIZE:
+            step = len(items) // _SAMPLE_SIZE
+            sampled = sum(deep_bytes(item, seen) for item in items[::step][:_SAMPLE_SIZE])
+            return sys.getsizeof(obj) + int(sampled / _SAMPLE_SIZE * len(items))
+        return sys.getsizeof(obj) + sum(deep_bytes(item, seen) for item in items)
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + deep_bytes(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def matrix_footprint(matrix):
+    """Byte breakdown of a sparse TF-IDF matrix"""
+    matrix = matrix.tocsr()
+    return {
+        "shape": list(matrix.shape),
+        "nnz": int(matrix.nnz),
+        "dtype": str(matrix.dtype),
+        "data_bytes": int(matrix.data.nbytes),
+        "indices_bytes": int(matrix.indices.nbytes),
+        "indptr_bytes": int(matrix.indptr.nbytes),
+        "bytes": matrix_bytes(matrix),
+    }
+
+
+def vectorizer_footprint(vectorizer):
+    """Vocabulary size and bytes of a fitted vectorizer"""
+    if hasattr(vectorizer, "term_columns"):
+        vocabulary_size = len(vectorizer.term_columns)
+    elif hasattr(vectorizer, "vocabulary_"):
+        vocabulary_size = len(vectorizer.vocabulary_)
+    else:
+        vocabulary_size = None  # Hashed features have no vocabulary
+    return {
+        "type": type(vectorizer).__name__,
+        "vocabulary_size": vocabulary_size,
+        "features": int(getattr(vectorizer, "n_features", None) or vocabulary_size or 0),
+        "bytes": deep_bytes(vectorizer),
+    }
+
+
+def items_footprint(items_df):
+    """Bytes per column of the product data"""
+    usage = items_df.memory_usage(index=True, deep=True)
+    return {
+        "rows": len(items_df),
+        "index_bytes": int(usage.get("Index", 0)),
+        "columns": {str(name): int(size) for name, size in usage.items() if name != "Index"},
+        "bytes": int(usage.sum()),
+    }
+
+
+def estimate_records_bytes(items_df):
+    """Estimate the precomputed response records of a model from a sample of its rows"""
+    if len(items_df) == 0:
+        return 0
+    sample = items_df.iloc[::max(len(items_df) // _SAMPLE_SIZE, 1)]
+    return int(deep_bytes(build_item_records(sample)) / len(sample) * len(items_df))
+
+
+def model_footprint(vectorizer, matrix, items_df, lookups=None):
+    """
+    Per-component byte breakdown of a model.
+
+    Args:
+        vectorizer: Fitted vectorizer
+        matrix (scipy.sparse.csr_matrix): TF-IDF matrix
+        items_df (pandas.DataFrame): Product data
+        lookups (dict): Other in-memory structures by name (id index, item
+            records, filter, membership and suggestion indexes); None
+            estimates the item records, the largest of them, before they are
+            built (the others are passed to fit_to_budget as extra)
+
+    Returns:
+        dict: Components with their bytes, and the total
+    """
+    footprint = {
+        "vectorizer": vectorizer_footprint(vectorizer),
+        "matrix": matrix_footprint(matrix),
+        "items": items_footprint(items_df),
+    }
+    if lookups is None:
+        footprint["lookups"] = {"item_records": estimate_records_bytes(items_df)}
+    else:
+        # Lookups share objects (e.g. the delta holds the id index), count them once
+        seen = set()
+        footprint["lookups"] = {name: deep_bytes(value, seen) for name, value in lookups.items() if value is not None}
+    # Neighbors are scored per request (the export writes them to files), no table is kept
+    footprint["lookups"]["neighbor_table"] = 0
+    footprint["lookups"]["bytes"] = sum(footprint["lookups"].values())
+    footprint["total_bytes"] = sum(component["bytes"] for component in footprint.values())
+    return footprint
+
+
+def fit_to_budget(vectorizer, matrix, items_df, budget_bytes, action=REFUSE_ACTION, prune_threshold=0.0,
+                  extra=None):
+    """
+    Check a freshly trained model against a memory budget.
+
+    Args:
+        vectorizer: Fitted vectorizer
+        matrix (scipy.sparse.csr_matrix): Compacted TF-IDF matrix
+        items_df (pandas.DataFrame): Compacted product data
+        budget_bytes (int): Bytes allowed for the model, 0 disables the check
+        action (str): REFUSE_ACTION, or PRUNE_ACTION to drop small TF-IDF
+            weights (PRUNE_STEPS) until the model fits
+        prune_threshold (float): Threshold already applied to the matrix
+        extra (dict): Other structures the model keeps in memory, by name
+
+    Returns:
+        tuple: (matrix, footprint, prune_threshold) of the model to swap in
+
+    Raises:
+        ModelBudgetExceeded: If the model does not fit
+    """
+    extra_bytes = {name: deep_bytes(value) for name, value in (extra or {}).items()}
+
+    def measure(candidate):
+        footprint = model_footprint(vectorizer, candidate, items_df)
+        footprint["lookups"].update(extra_bytes)
+        footprint["lookups"]["bytes"] += sum(extra_bytes.values())
+        footprint["total_bytes"] += sum(extra_bytes.values())
+        return footprint
+
+    footprint = measure(matrix)
+    if not budget_bytes or footprint["total_bytes"] <= budget_bytes:
+        return matrix, footprint, prune_threshold
+
+    if action == PRUNE_ACTION:
+        for threshold in [step for step in PRUNE_STEPS if step > (prune_threshold or 0)]:
+            pruned = compact_matrix(matrix, threshold)
+            footprint = measure(pruned)
+            print(f"Model budget: pruning weights below {threshold} -> {footprint['total_bytes']} bytes")
+            if footprint["total_bytes"] <= budget_bytes:
+                return pruned, footprint, threshold
+
+    raise ModelBudgetExceeded(
+        f"Trained model needs {footprint['total_bytes']} bytes, over the budget of {budget_bytes} bytes "
+        f"(matrix {footprint['matrix']['bytes']}, items {footprint['items']['bytes']}, "
+        f"vectorizer {footprint['vectorizer']['bytes']}, lookups {footprint['lookups']['bytes']}); "
+        f"keeping the loaded model"
+    )
+
+
+def build_manifest(num_items, prune_threshold, footprint, budget_bytes):
+    """Describe a trained model for its bundle manifest"""
+    return {
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "items": num_items,
+        "prune_threshold": prune_threshold,
+        "budget_bytes": budget_bytes,
+        "footprint": footprint,
+    }
+
+
+def save_manifest(manifest, path):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_manifest(path):
+    """Read a bundle manifest, None for models saved without one"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
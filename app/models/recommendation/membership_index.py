@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+_EMPTY_ROWS = np.empty(0, dtype=np.int32)
+
+
+class MembershipIndex:
+    """
+    Key -> model rows lookup in CSR layout.
+
+    ``keys`` is sorted, and the rows of ``keys[i]`` are
+    ``rows[offsets[i]:offsets[i + 1]]`` in ascending order, without
+    duplicates. Three flat arrays
+    keep the index small and cheap to pickle, whatever the number of keys.
+    """
+
+    def __init__(self, keys, offsets, rows):
+        self.keys = keys
+        self.offsets = offsets
+        self.rows_ = rows
+
+    @classmethod
+    def from_values(cls, values_per_row):
+        """
+        Build the index from the keys of every row.
+
+        Args:
+            values_per_row (iterable): For each row, an iterable of its keys
+                (e.g. category IDs); None keys and repeated keys are skipped
+
+        Returns:
+            MembershipIndex: The index
+        """
+        pair_keys, pair_rows = [], []
+        for row, values in enumerate(values_per_row):
+            # A key listed twice on a row (e.g. a repeated category) maps to the row once
+            for value in dict.fromkeys(values):
+                if value is not None:
+                    pair_keys.append(value)
+                    pair_rows.append(row)
+
+        if not pair_keys:
+            return cls(np.empty(0), np.zeros(1, dtype=np.int64), _EMPTY_ROWS)
+
+        keys = np.asarray(pair_keys)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        unique_keys, starts = np.unique(sorted_keys, return_index=True)
+
+        return cls(
+            unique_keys,
+            np.append(starts, len(sorted_keys)).astype(np.int64),
+            np.asarray(pair_rows, dtype=np.int32)[order],
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, key):
+        """Get the rows holding a key (empty if the key is unknown)"""
+        if len(self.keys) == 0:
+            return _EMPTY_ROWS
+        try:
+            position = np.searchsorted(self.keys, key)
+        except (TypeError, ValueError):
+            return _EMPTY_ROWS
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.rows_[self.offsets[position]:self.offsets[position + 1]]
+        return _EMPTY_ROWS
+
+
+def build_membership_indexes(products_df):
+    """
+    Build the category -> rows and group -> rows indexes of a model.
+
+    Args:
+        products_df (pandas.DataFrame): Product data the model was trained on
+
+    Returns:
+        dict: "category" and "group" MembershipIndex, None for a missing column
+    """
+    indexes = {"category": None, "group": None}
+
+    if 'categoryIds' in products_df.columns:
+        indexes["category"] = MembershipIndex.from_values(
+            [int(cat) for cat in cats] if isinstance(cats, (list, tuple)) else []
+            for cats in products_df['categoryIds']
+        )
+    if 'groupProductId' in products_df.columns:
+        indexes["group"] = MembershipIndex.from_values(
+            [int(group)] if pd.notna(group) else []
+            for group in products_df['groupProductId']
+        )
+
+    return indexes
@@ -0,0 +1,71 @@
+import pandas as pd
+
+# Fields computed from a record instead of read from it
+DERIVED_FIELDS = {
+    "image": lambda record: next(iter(record.get("images") or []), None),
+}
+
+
+def build_item_records(items_df):
+    """
+    Precompute the response record of every product once per model.
+
+    Args:
+        items_df (pandas.DataFrame): Product data the model was trained on
+
+    Returns:
+        list: One dict per row, without the content column
+    """
+    records = items_df.drop(columns=["content"], errors="ignore").to_dict(orient="records")
+
+    for record in records:
+        # Compacted models store categories as tuples, responses use lists
+        if isinstance(record.get("categories"), tuple):
+            record["categories"] = list(record["categories"])
+        # Missing values (NaN/NaT) are serialized as null
+        for key, value in record.items():
+            if not isinstance(value, (list, tuple)) and pd.isna(value):
+                record[key] = None
+
+    return records
+
+
+def parse_fields(value):
+    """
+    Parse a ``fields=`` query parameter.
+
+    Args:
+        value (str): Comma-separated field names, e.g. "id,name,price,image"
+
+    Returns:
+        tuple: Field names, or None when every field is requested
+    """
+    if not value:
+        return None
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    return fields or None
+
+
+def make_projection(fields=None):
+    """
+    Build a function that projects a precomputed record to the requested fields.
+
+    Args:
+        fields (tuple): Field names to keep, None keeps every field
+
+    Returns:
+        callable: record -> new dict with only the requested fields
+    """
+    if fields is None:
+        return dict
+
+    def project(record):
+        projected = {}
+        for field in fields:
+            if field in record:
+                projected[field] = record[field]
+            elif field in DERIVED_FIELDS:
+                projected[field] = DERIVED_FIELDS[field](record)
+        return projected
+
+    return project
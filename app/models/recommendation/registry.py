@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def parse_catalogs(value):
+    """
+    Parse the CATALOGS setting.
+
+    Args:
+        value (str): Comma-separated ``name=model_dir`` pairs
+
+    Returns:
+        dict: Catalog name -> model directory
+    """
+    catalogs = {}
+    for entry in (value or "").split(","):
+        name, _, directory = entry.partition("=")
+        if name.strip() and directory.strip():
+            catalogs[name.strip()] = directory.strip()
+    return catalogs
+
+
+class ModelRegistry:
+    """
+    Named catalog models, loaded on first use and evicted least recently used
+    first when their resident memory exceeds the budget.
+
+    A model with upserts or deletes waiting to be folded is neither evicted
+    nor reloaded when its files change, since its changes are only in memory.
+    """
+
+    def __init__(self, memory_budget_bytes=0):
+        """
+        Args:
+            memory_budget_bytes (int): Resident memory allowed for all loaded
+                models, 0 disables eviction
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self._sources = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.evictions = 0
+
+    def register(self, source):
+        """Register a catalog source (e.g. CatalogFiles); replaces a loaded model of the same name"""
+        with self._lock:
+            self._sources[source.name] = source
+            self._load_locks.setdefault(source.name, threading.Lock())
+            self._loaded.pop(source.name, None)
+
+    def names(self):
+        return list(self._sources)
+
+    def source(self, name):
+        """Get the source of a catalog (KeyError if it is not registered)"""
+        return self._sources[name]
+
+    def _current(self, name, source):
+        """Get the loaded model if it is still current (lock held)"""
+        model = self._loaded.get(name)
+        if model is not None and (model.version == source.version() or model.has_pending_changes):
+            self._loaded.move_to_end(name)
+            return model
+        return None
+
+    def peek(self, name):
+        """Get a loaded catalog model without loading it, None if it is not loaded"""
+        with self._lock:
+            return self._loaded.get(name)
+
+    def get(self, name):
+        """
+        Get a catalog model, loading it if needed.
+
+        Raises:
+            KeyError: If the catalog is not registered
+            FileNotFoundError: If the catalog has not been trained
+        """
+        with self._lock:
+            source = self._sources[name]
+            model = self._current(name, source)
+            if model is not None:
+                return model
+
+        # One load per catalog at a time; other catalogs stay available
+        with self._load_locks[name]:
+            with self._lock:
+                model = self._current(name, source)
+                if model is not None:
+                    return model
+
+            start = time.perf_counter()
+            model = source.load()
+            model.load_seconds = time.perf_counter() - start
+
+            with self._lock:
+                self._loaded[name] = model
+                self._loaded.move_to_end(name)
+                self._evict_over_budget(keep=name)
+            return model
+
+    def publish(self, model):
+        """Serve a newly trained or folded model of a registered catalog in place of the loaded one"""
+        with self._lock:
+            self._loaded[model.name] = model
+            self._loaded.move_to_end(model.name)
+            self._evict_over_budget(keep=model.name)
+
+    def _evict_over_budget(self, keep):
+        """Evict least recently used models until the budget is met (lock held)"""
+        if not self.memory_budget_bytes:
+            return
+        for name in list(self._loaded):
+            if self.resident_bytes() <= self.memory_budget_bytes:
+                break
+            if name != keep and not self._loaded[name].has_pending_changes:
+                del self._loaded[name]
+                self.evictions += 1
+                logger.info("Model registry: evicted catalog %s (memory budget %d bytes)", name, self.memory_budget_bytes)
+
+    def evict(self, name):
+        """
+        Unload a catalog.
+
+        Returns:
+            bool: False if it was not loaded or has changes waiting to be folded
+        """
+        with self._lock:
+            model = self._loaded.get(name)
+            if model is None or model.has_pending_changes:
+                return False
+            del self._loaded[name]
+            return True
+
+    def resident_bytes(self):
+        return sum(model.resident_bytes for model in self._loaded.values())
+
+    def stats(self):
+        """Get the state of every catalog, least recently used first"""
+        with self._lock:
+            unloaded = [
+                {"name": name, "loaded": False}
+                for name in sorted(self._sources) if name not in self._loaded
+            ]
+            loaded = [{"loaded": True, **model.stats()} for model in self._loaded.values()]
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self.resident_bytes(),
+                "evictions": self.evictions,
+                "catalogs": unloaded + loaded,
+            }
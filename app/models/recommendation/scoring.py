@@ -0,0 +1,119 @@
+import numpy as np
+from app.models.recommendation.projection import make_projection
+
+
+def build_id_index(items_df):
+    """
+    Map product IDs to their row position in the model.
+
+    Args:
+        items_df (pandas.DataFrame): Product data the model was trained on
+
+    Returns:
+        dict: Product ID -> row position (first row wins for duplicate IDs)
+    """
+    ids = items_df['id'].to_numpy()
+    unique_ids, first_rows = np.unique(ids, return_index=True)
+    return dict(zip(unique_ids.tolist(), first_rows.tolist()))
+
+
+def lookup_row(id_index, product_id):
+    """Get the row position of a product, or None if it is not in the model"""
+    try:
+        return id_index.get(int(product_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def similarity_scores(query_vectors, matrix):
+    """
+    Cosine similarity of query rows with every row of the item matrix.
+
+    TF-IDF rows are L2-normalized, so the similarity is a plain sparse
+    product. Unlike sklearn's cosine_similarity it neither renormalizes nor
+    copies the item matrix, which may be memory-mapped.
+
+    Args:
+        query_vectors (scipy.sparse.csr_matrix): One L2-normalized row per query
+        matrix (scipy.sparse.csr_matrix): L2-normalized item rows
+
+    Returns:
+        numpy.ndarray: Dense (queries, items) scores
+    """
+    # matrix @ queries.T converts only the small query matrix to CSR
+    return (matrix @ query_vectors.T).T.toarray()
+
+
+def top_k_indices(scores, k, exclude=None, candidates=None):
+    """
+    Get the indices of the k highest scores, best first.
+
+    Args:
+        scores (numpy.ndarray): Similarity scores for every row
+        k (int): Number of indices to return
+        exclude (int): Row to leave out, usually the query product itself
+        candidates (numpy.ndarray): Only rank these rows (e.g. filter matches)
+
+    Returns:
+        numpy.ndarray: Row indices sorted by descending score
+    """
+    if candidates is not None:
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        top = top_k_indices(scores[candidates], k)
+        return candidates[top]
+
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        k = min(k, len(scores) - 1)
+
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def build_recommendations(item_records, scores, indices, fields=None):
+    """
+    Build the response records for the selected rows.
+
+    Args:
+        item_records (list): Precomputed product records of the model
+        scores (numpy.ndarray): Similarity scores for every row
+        indices (numpy.ndarray): Selected rows, best first
+        fields (tuple): Fields to return, None returns every field
+
+    Returns:
+        list: Projected product records with their similarity score
+    """
+    return build_ranked_recommendations(item_records, indices, scores[indices], fields)
+
+
+def build_ranked_recommendations(item_records, indices, scores, fields=None):
+    """
+    Build the response records for ranked rows.
+
+    Args:
+        item_records (list): Precomputed product records of the model
+        indices (numpy.ndarray): Selected rows, best first
+        scores (numpy.ndarray): Similarity score of each selected row
+        fields (tuple): Fields to return, None returns every field
+
+    Returns:
+        list: Projected product records with their similarity score
+    """
+    project = make_projection(fields)
+    recommended_products = []
+    for idx, score in zip(indices, scores):
+        product = project(item_records[idx])
+        product['similarity_score'] = float(score)
+        recommended_products.append(product)
+
+    return recommended_products
@@ -0,0 +1,210 @@
+import multiprocessing
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.sparse as sp
+from app.models.recommendation.scoring import similarity_scores, top_k_indices
+
+THREAD_BACKEND = "thread"
+PROCESS_BACKEND = "process"
+
+# Shared matrices attached by a worker process, by shared memory name
+_attached = {}
+_MAX_ATTACHED = 4
+
+
+def shard_bounds(num_rows, num_shards):
+    """Split rows into at most num_shards contiguous (start, end) ranges of similar size"""
+    num_shards = max(1, min(num_shards, num_rows))
+    edges = np.linspace(0, num_rows, num_shards + 1).astype(int)
+    return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:])]
+
+
+def row_range(matrix, start, end):
+    """Rows start..end of a CSR matrix, sharing its data and indices arrays"""
+    low, high = matrix.indptr[start], matrix.indptr[end]
+    return sp.csr_matrix(
+        (matrix.data[low:high], matrix.indices[low:high], matrix.indptr[start:end + 1] - low),
+        shape=(end - start, matrix.shape[1]), copy=False
+    )
+
+
+def shard_top_k(shard_matrix, start, query_vectors, k, excludes, candidates):
+    """
+    Score queries against one shard and keep the local top k.
+
+    Args:
+        shard_matrix (scipy.sparse.csr_matrix): Rows start..end of the item matrix
+        start (int): Global row of the first shard row
+        query_vectors (scipy.sparse.csr_matrix): One TF-IDF row per query
+        k (int): Number of rows to keep per query
+        excludes (list): Global row to leave out per query, or None
+        candidates (numpy.ndarray): Local rows to rank, None ranks every row
+
+    Returns:
+        list: (global rows, scores) per query, best first
+    """
+    end = start + shard_matrix.shape[0]
+    sim_scores = similarity_scores(query_vectors, shard_matrix)
+
+    results = []
+    for scores, exclude in zip(sim_scores, excludes):
+        local_exclude = exclude - start if exclude is not None and start <= exclude < end else None
+        top = top_k_indices(scores, k, exclude=local_exclude, candidates=candidates)
+        results.append((top + start, scores[top]))
+    return results
+
+
+class SharedMatrix:
+    """A CSR matrix whose arrays live in shared memory, attachable by worker processes"""
+
+    def __init__(self, matrix):
+        matrix = matrix.tocsr()
+        self.shape = matrix.shape
+        self.blocks = []
+        arrays = []
+        for array in (matrix.data, matrix.indices, matrix.indptr):
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            arrays.append((block.name, array.shape, array.dtype.str))
+        self.handle = (tuple(arrays), self.shape)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _attach(handle):
+    """Rebuild a SharedMatrix in a worker process without copying its arrays"""
+    arrays, shape = handle
+    key = arrays[0][0]
+    if key not in _attached:
+        if len(_attached) >= _MAX_ATTACHED:
+            # Drop the oldest matrix, replaced by a newer model
+            old_blocks, old_matrix = _attached.pop(next(iter(_attached)))
+            del old_matrix
+            for block in old_blocks:
+                block.close()
+
+        blocks, views = [], []
+        for name, array_shape, dtype in arrays:
+            # Workers share the parent's resource tracker, which unlinks the memory
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            views.append(np.ndarray(array_shape, dtype=np.dtype(dtype), buffer=block.buf))
+        _attached[key] = (blocks, sp.csr_matrix(tuple(views), shape=shape, copy=False))
+
+    return _attached[key][1]
+
+
+def _shared_shard_top_k(handle, start, end, query_vectors, k, excludes, candidates):
+    """Worker process entry point: score one row range of a shared matrix"""
+    return shard_top_k(row_range(_attach(handle), start, end), start, query_vectors, k, excludes, candidates)
+
+
+def _release(executor, shared):
+    executor.shutdown(wait=False, cancel_futures=True)
+    if shared is not None:
+        shared.close()
+
+
+class ShardedScorer:
+    """
+    Scatter-gather similarity scoring over a row-sharded item matrix.
+
+    The matrix is split row-wise into shards. Each query batch is scored
+    against every shard in parallel, each shard keeps its local top k, and
+    the local results are merged into the global top k. The thread backend
+    keeps the shards in this process; the process backend puts the matrix in
+    shared memory once and scores the shards in worker processes, which
+    scales past the GIL.
+    """
+
+    def __init__(self, matrix, num_shards, backend=THREAD_BACKEND):
+        """
+        Args:
+            matrix (scipy.sparse.csr_matrix): Item TF-IDF matrix
+            num_shards (int): Number of shards and workers
+            backend (str): THREAD_BACKEND or PROCESS_BACKEND
+        """
+        self.matrix = matrix
+        self.bounds = shard_bounds(matrix.shape[0], num_shards)
+        self.backend = backend
+        self.shared = None
+
+        if backend == PROCESS_BACKEND:
+            self.shared = SharedMatrix(matrix)
+            self.executor = ProcessPoolExecutor(
+                max_workers=len(self.bounds), mp_context=multiprocessing.get_context("spawn")
+            )
+        elif backend == THREAD_BACKEND:
+            self.shards = [row_range(matrix, start, end) for start, end in self.bounds]
+            self.executor = ThreadPoolExecutor(max_workers=len(self.bounds), thread_name_prefix="shard")
+        else:
+            raise ValueError(f"Unknown shard backend: {backend}")
+
+        # Workers and shared memory are released once the scorer is replaced and unused
+        self._finalizer = weakref.finalize(self, _release, self.executor, self.shared)
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def top_k(self, query_vectors, k, excludes=None, candidates=None):
+        """
+        Get the k best rows for every query.
+
+        Args:
+            query_vectors (scipy.sparse.csr_matrix): One TF-IDF row per query
+            k (int): Number of rows to return per query
+            excludes (list): Row to leave out per query (e.g. the query product), or None
+            candidates (numpy.ndarray): Sorted rows to rank, None ranks every row
+
+        Returns:
+            list: (rows, scores) per query, best first
+        """
+        num_queries = query_vectors.shape[0]
+        excludes = list(excludes) if excludes is not None else [None] * num_queries
+
+        futures = []
+        for shard, (start, end) in enumerate(self.bounds):
+            local_candidates = None
+            if candidates is not None:
+                low, high = np.searchsorted(candidates, [start, end])
+                local_candidates = candidates[low:high] - start
+
+            if self.shared is not None:
+                futures.append(self.executor.submit(
+                    _shared_shard_top_k, self.shared.handle, start, end,
+                    query_vectors, k, excludes, local_candidates
+                ))
+            else:
+                futures.append(self.executor.submit(
+                    shard_top_k, self.shards[shard], start,
+                    query_vectors, k, excludes, local_candidates
+                ))
+
+        shard_results = [future.result() for future in futures]
+
+        # Merge the local top k of every shard
+        results = []
+        for position in range(num_queries):
+            rows = np.concatenate([shard[position][0] for shard in shard_results])
+            scores = np.concatenate([shard[position][1] for shard in shard_results])
+            top = top_k_indices(scores, k)
+            results.append((rows[top], scores[top]))
+        return results
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        self._finalizer()
+
+
+def build_scorer(matrix, num_shards, backend=THREAD_BACKEND):
+    """Build a ShardedScorer, or None when sharding is disabled (one shard)"""
+    if num_shards is None or num_shards <= 1 or matrix is None:
+        return None
+    return ShardedScorer(matrix, num_shards, backend)
@@ -0,0 +1,154 @@
+import re
+from bisect import bisect_left
+import numpy as np
+from app.models.text_preprocessing import preprocess_text, remove_accents
+
+# Sorts after every character, closes the key range of a prefix
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize_prefix(prefix):
+    """Normalize typed text like indexed keys: lowercase, single spaces, a trailing space kept"""
+    text = re.sub(r"\s+", " ", preprocess_text(prefix)).lstrip()
+    return text
+
+
+class _PrefixArray:
+    """Sorted keys with the entry and weight of each, searched by prefix"""
+
+    def __init__(self, keys, entries, weights):
+        order = sorted(range(len(keys)), key=lambda i: keys[i])
+        self.keys = [keys[i] for i in order]
+        self.entries = np.asarray(entries, dtype=np.int32)[order]
+        self.weights = np.asarray(weights, dtype=np.float32)[order]
+
+    def search(self, prefix, limit):
+        """Get the entries of the best weighted keys starting with prefix, best first"""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR, lo)
+        if hi <= lo:
+            return []
+
+        weights = self.weights[lo:hi]
+        # An entry can match through several keys, take a few extra before deduplicating
+        size = min(limit * 4, hi - lo)
+        while True:
+            top = np.argpartition(-weights, size - 1)[:size] if size < hi - lo else np.arange(hi - lo)
+            # Best weight first, ties in key order
+            top = top[np.lexsort((top, -weights[top]))]
+
+            entries = []
+            for entry in self.entries[lo + top].tolist():
+                if entry not in entries:
+                    entries.append(entry)
+                    if len(entries) == limit:
+                        return entries
+            if size == hi - lo:
+                return entries
+            # The keys of a few entries filled the window, widen it
+            size = min(size * 4, hi - lo)
+
+
+class SuggestIndex:
+    """
+    Typeahead over the vocabulary of a model and the names of its products.
+
+    Keys are held in sorted arrays, so the keys starting with a prefix are one
+    range found with two binary searches. Terms are ranked by their document
+    frequency in the model, products by how early in their name the prefix
+    matches and then by name. Every key is also
+    indexed without accents, for text typed without them. Nothing here
+    touches the TF-IDF matrix at query time.
+    """
+
+    def __init__(self, terms, document_frequencies, product_ids, product_names):
+        """
+        Args:
+            terms (list): Vocabulary terms (preprocessed, as in the model)
+            document_frequencies (list): Products containing each term
+            product_ids (list): Product IDs
+            product_names (list): Product names, in the order of product_ids
+        """
+        self.terms = list(terms)
+        self.document_frequencies = np.asarray(document_frequencies, dtype=np.int32)
+        self.product_ids = list(product_ids)
+        self.product_names = list(product_names)
+
+        term_keys, term_entries, term_weights = [], [], []
+        for entry, (term, df) in enumerate(zip(self.terms, self.document_frequencies.tolist())):
+            for key in {term, remove_accents(term)}:
+                term_keys.append(key)
+                term_entries.append(entry)
+                term_weights.append(df)
+        self._terms = _PrefixArray(term_keys, term_entries, term_weights)
+
+        name_keys, name_entries, name_weights = [], [], []
+        for entry, name in enumerate(self.product_names):
+            words = normalize_prefix(name).split()
+            # Match the name from any word, e.g. "vàng" finds "nhẫn cưới vàng"
+            for start in range(len(words)):
+                text = " ".join(words[start:])
+                for key in {text, remove_accents(text)}:
+                    name_keys.append(key)
+                    name_entries.append(entry)
+                    name_weights.append(-start)  # Matches at the start of the name first
+        self._names = _PrefixArray(name_keys, name_entries, name_weights)
+
+    @classmethod
+    def from_model(cls, vectorizer, matrix, items_df):
+        """
+        Build the index of a trained model.
+
+        Args:
+            vectorizer: Fitted vectorizer; hashed features have no vocabulary,
+                so only product names are indexed then
+            matrix (scipy.sparse.csr_matrix): TF-IDF matrix, for document frequencies
+            items_df (pandas.DataFrame): Product data with id and name columns
+
+        Returns:
+            SuggestIndex: Index of the model
+        """
+        terms, document_frequencies = [], []
+        if hasattr(vectorizer, "get_feature_names_out"):
+            names = vectorizer.get_feature_names_out()
+            counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+            for column, term in enumerate(names):
+                # Leave out the generated price_, group_, city_, star_ and category_ features
+                if term is not None and "_" not in term:
+                    terms.append(term)
+                    document_frequencies.append(int(counts[column]))
+
+        ids, product_names = [], []
+        if 'name' in items_df.columns:
+            for product_id, name in zip(items_df['id'].tolist(), items_df['name'].tolist()):
+                if isinstance(name, str) and name.strip():
+                    ids.append(product_id)
+                    product_names.append(name.strip())
+
+        return cls(terms, document_frequencies, ids, product_names)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Complete a typed prefix.
+
+        Args:
+            prefix (str): Text typed so far
+            limit (int): Suggestions of each kind
+
+        Returns:
+            dict: "terms" ({"term", "df"}) and "products" ({"id", "name"}), best first
+        """
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return {"terms": [], "products": []}
+
+        return {
+            "terms": [
+                {"term": self.terms[entry], "df": int(self.document_frequencies[entry])}
+                for entry in self._terms.search(prefix, limit)
+            ],
+            "products": [
+                {"id": self.product_ids[entry], "name": self.product_names[entry]}
+                for entry in self._names.search(prefix, limit)
+            ],
+        }
@@ -0,0 +1,453 @@
+from bisect import bisect_left
+from collections import Counter
+import numbers
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from app.config import Config
+
+# Supported feature modes
+VOCABULARY_MODE = "vocabulary"
+HASHING_MODE = "hashing"
+
+# TfidfVectorizer parameters needed to rebuild the analyzer at load time
+ANALYZER_PARAMS = [
+    "input",
+    "encoding",
+    "decode_error",
+    "strip_accents",
+    "lowercase",
+    "preprocessor",
+    "tokenizer",
+    "analyzer",
+    "stop_words",
+    "token_pattern",
+    "ngram_range",
+]
+
+
+class _SortedTerms:
+    """Read-only sequence view over UTF-8 encoded terms packed in one buffer"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+
+class CompactTfidfVectorizer:
+    """
+    Query-side TF-IDF transformer built from a fitted TfidfVectorizer.
+
+    Unlike the sklearn vectorizer it does not keep ``stop_words_``, and the
+    vocabulary is kept as a sorted UTF-8 buffer with int offsets instead of
+    a dict, so it pickles small, loads fast and stays small in memory. Terms
+    are looked up by binary search over the buffer, once per distinct token
+    of a ``transform`` call. ``transform`` produces the same features and
+    weights as the original vectorizer, as float32.
+    """
+
+    def __init__(self, analyzer_params, terms, columns, idf, norm="l2",
+                 use_idf=True, sublinear_tf=False, binary=False):
+        order = sorted(range(len(terms)), key=lambda i: terms[i])
+        encoded = [terms[i].encode("utf-8") for i in order]
+
+        self.analyzer_params = analyzer_params
+        self.term_data = b"".join(encoded)
+        self.term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self.term_offsets[1:] = np.cumsum([len(term) for term in encoded])
+        self.term_columns = np.asarray(columns, dtype=np.int32)[order]
+        self.idf_ = np.asarray(idf, dtype=np.float32)
+        self.n_features = len(self.idf_)
+        self.norm = norm
+        self.use_idf = use_idf
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+        self._analyzer = None
+
+    @classmethod
+    def from_fitted(cls, vectorizer):
+        """Build a compact transformer from a fitted TfidfVectorizer"""
+        params = vectorizer.get_params()
+        vocabulary = vectorizer.vocabulary_
+
+        return cls(
+            analyzer_params={name: params[name] for name in ANALYZER_PARAMS},
+            terms=list(vocabulary.keys()),
+            columns=list(vocabulary.values()),
+            idf=vectorizer.idf_,
+            norm=vectorizer.norm,
+            use_idf=vectorizer.use_idf,
+            sublinear_tf=vectorizer.sublinear_tf,
+            binary=vectorizer.binary,
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The analyzer is a closure and is rebuilt from its parameters on load
+        state["_analyzer"] = None
+        return state
+
+    def __setstate__(self, state):
+        # Models pickled with a term -> column dict drop it
+        state.pop("_term_index", None)
+        self.__dict__.update(state)
+
+    def build_analyzer(self):
+        """Return the callable used to split a document into terms"""
+        if self._analyzer is None:
+            self._analyzer = TfidfVectorizer(**self.analyzer_params).build_analyzer()
+        return self._analyzer
+
+    def _sorted_terms(self):
+        return _SortedTerms(self.term_data, self.term_offsets)
+
+    def term_column(self, term):
+        """Get the feature column of a term, or -1 if it is not in the vocabulary"""
+        # UTF-8 bytes sort in the same order as the terms they encode
+        encoded = term.encode("utf-8")
+        terms = self._sorted_terms()
+        pos = bisect_left(terms, encoded)
+        if pos < len(terms) and terms[pos] == encoded:
+            return int(self.term_columns[pos])
+        return -1
+
+    def get_feature_names_out(self):
+        """Get the vocabulary terms ordered by feature column"""
+        terms = self._sorted_terms()
+        names = np.empty(self.n_features, dtype=object)
+        for pos in range(len(terms)):
+            names[self.term_columns[pos]] = terms[pos].decode("utf-8")
+        return names
+
+    def transform(self, raw_documents):
+        """
+        Transform documents to a TF-IDF matrix.
+
+        Args:
+            raw_documents (iterable): Documents to transform
+
+        Returns:
+            scipy.sparse.csr_matrix: float32 TF-IDF matrix
+        """
+        analyzer = self.build_analyzer()
+        # Columns of the tokens seen in this call, -1 for unknown ones
+        columns = {}
+        indptr = [0]
+        indices = []
+        values = []
+
+        for doc in raw_documents:
+            counts = Counter()
+            for term in analyzer(doc):
+                column = columns.get(term)
+                if column is None:
+                    column = columns[term] = self.term_column(term)
+                if column >= 0:
+                    counts[column] += 1
+            indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(indices))
+
+        X = csr_matrix(
+            (np.asarray(values, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, self.n_features),
+        )
+        X.sort_indices()
+
+        if self.binary:
+            X.data.fill(1)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.use_idf:
+            X.data *= self.idf_[X.indices]
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+
+        return X.astype(np.float32)
+
+
+class HashedTfidfVectorizer:
+    """
+    TF-IDF over a fixed number of hashed features.
+
+    Terms are hashed into ``n_features`` columns, so memory does not grow with
+    the vocabulary. IDF weights come from document frequency counters that can
+    be updated with ``partial_fit`` when new products arrive, without a refit.
+    Columns outside ``min_df``/``max_df`` get a zero weight, as in sklearn.
+    """
+
+    def __init__(self, n_features=2 ** 18, min_df=1, max_df=1.0, norm="l2",
+                 smooth_idf=True, sublinear_tf=False, **analyzer_params):
+        self.n_features = n_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.norm = norm
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.hasher = HashingVectorizer(
+            n_features=n_features, alternate_sign=False, norm=None, **analyzer_params
+        )
+        self.doc_freq = np.zeros(n_features, dtype=np.int32)
+        self.n_docs = 0
+        self.idf_ = np.zeros(n_features, dtype=np.float32)
+
+    def build_analyzer(self):
+        """Return the callable used to split a document into terms"""
+        return self.hasher.build_analyzer()
+
+    def _doc_count_limit(self, value):
+        return value if isinstance(value, numbers.Integral) else value * self.n_docs
+
+    def _update_idf(self):
+        smooth = int(self.smooth_idf)
+        idf = np.log((self.n_docs + smooth) / (self.doc_freq + smooth)) + 1
+        idf[self.doc_freq < self._doc_count_limit(self.min_df)] = 0
+        idf[self.doc_freq > self._doc_count_limit(self.max_df)] = 0
+        self.idf_ = idf.astype(np.float32)
+
+    def _count(self, raw_documents):
+        # HashingVectorizer accepts one-shot iterables, which keeps chunked input streaming
+        counts = self.hasher.transform(raw_documents)
+        counts.sort_indices()
+        return counts
+
+    def _add_counts(self, counts):
+        self.doc_freq += np.bincount(counts.indices, minlength=self.n_features).astype(np.int32)
+        self.n_docs += counts.shape[0]
+        self._update_idf()
+
+    def _weight(self, counts):
+        X = counts.astype(np.float64)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        X.data *= self.idf_[X.indices]
+        X.eliminate_zeros()
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X.astype(np.float32)
+
+    def partial_fit(self, raw_documents):
+        """Add documents to the document frequency counters"""
+        self._add_counts(self._count(raw_documents))
+        return self
+
+    def fit(self, raw_documents):
+        """Reset the counters and fit them on the given documents"""
+        self.doc_freq[:] = 0
+        self.n_docs = 0
+        return self.partial_fit(raw_documents)
+
+    def fit_transform(self, raw_documents):
+        """Fit the counters and return the TF-IDF matrix of the documents"""
+        self.doc_freq[:] = 0
+        self.n_docs = 0
+        counts = self._count(raw_documents)
+        self._add_counts(counts)
+        return self._weight(counts)
+
+    def fit_transform_chunks(self, document_chunks):
+        """
+        Fit the counters on chunks of documents and return their TF-IDF matrix.
+
+        Only the term counts of each chunk are kept, not its documents.
+        """
+        self.doc_freq[:] = 0
+        self.n_docs = 0
+        chunk_counts = []
+        for chunk in document_chunks:
+            counts = self._count(chunk)
+            self.doc_freq += np.bincount(counts.indices, minlength=self.n_features).astype(np.int32)
+            self.n_docs += counts.shape[0]
+            chunk_counts.append(counts.astype(np.float32))
+
+        self._update_idf()
+        return self._weight(vstack(chunk_counts, format="csr"))
+
+    def transform(self, raw_documents):
+        """
+        Transform documents to a TF-IDF matrix.
+
+        Args:
+            raw_documents (iterable): Documents to transform
+
+        Returns:
+            scipy.sparse.csr_matrix: float32 TF-IDF matrix
+        """
+        return self._weight(self._count(raw_documents))
+
+
+def fit_vectorizer(contents, params, mode=None, n_features=None):
+    """
+    Fit the TF-IDF front end shared by the database and CSV models.
+
+    Args:
+        contents (iterable): Preprocessed product content
+        params (dict): TfidfVectorizer parameters
+        mode (str): "vocabulary" (default) or "hashing"
+        n_features (int): Number of hashed features in hashing mode
+
+    Returns:
+        tuple: (vectorizer, tfidf_matrix) where vectorizer is the query-side
+            transformer to persist
+    """
+    mode = mode or Config.TFIDF_FEATURE_MODE
+
+    if mode == HASHING_MODE:
+        params = dict(params)
+        tfidf_options = {
+            name: params.pop(name)
+            for name in ["min_df", "max_df", "norm", "smooth_idf", "sublinear_tf"]
+            if name in params
+        }
+        vectorizer = HashedTfidfVectorizer(
+            n_features=n_features or Config.TFIDF_HASH_FEATURES,
+            **tfidf_options,
+            **params,
+        )
+        return vectorizer, vectorizer.fit_transform(contents)
+
+    if mode != VOCABULARY_MODE:
+        raise ValueError(f"Unknown TF-IDF feature mode: {mode}")
+
+    vectorizer = TfidfVectorizer(**params)
+    tfidf_matrix = vectorizer.fit_transform(contents)
+
+    # Keep only what the query side needs (no stop_words_, packed vocabulary)
+    return CompactTfidfVectorizer.from_fitted(vectorizer), tfidf_matrix
+
+
+def _fit_vocabulary_chunks(content_chunks, params):
+    """
+    Fit a vocabulary TF-IDF model on chunks of documents.
+
+    Gives the same vocabulary, IDF weights and matrix as
+    ``TfidfVectorizer(**params).fit_transform`` on all documents, but keeps
+    term counts instead of the documents themselves.
+    """
+    vectorizer = TfidfVectorizer(**params)
+    if vectorizer.max_features is not None or vectorizer.vocabulary is not None:
+        raise ValueError("Chunked fitting does not support max_features or a fixed vocabulary")
+    analyzer = vectorizer.build_analyzer()
+
+    # Count terms with provisional columns in order of first appearance
+    vocabulary = {}
+    chunk_counts = []
+    for chunk in content_chunks:
+        indptr, indices, values = [0], [], []
+        for doc in chunk:
+            counts = Counter(vocabulary.setdefault(term, len(vocabulary)) for term in analyzer(doc))
+            indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(indices))
+        chunk_counts.append((
+            np.asarray(values, dtype=np.float32),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(indptr, dtype=np.int64),
+        ))
+
+    n_terms = len(vocabulary)
+    counts = vstack([
+        csr_matrix((values, indices, indptr), shape=(len(indptr) - 1, n_terms))
+        for values, indices, indptr in chunk_counts
+    ], format="csr")
+    del chunk_counts
+    n_docs = counts.shape[0]
+
+    # Keep the terms within min_df/max_df, as sklearn does
+    doc_freq = np.bincount(counts.indices, minlength=n_terms)
+    max_count = vectorizer.max_df if isinstance(vectorizer.max_df, numbers.Integral) else vectorizer.max_df * n_docs
+    min_count = vectorizer.min_df if isinstance(vectorizer.min_df, numbers.Integral) else vectorizer.min_df * n_docs
+    if max_count < min_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    keep = (doc_freq >= min_count) & (doc_freq <= max_count)
+    if not keep.any():
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    # Final columns follow the sorted terms, as in sklearn
+    terms = np.array(list(vocabulary), dtype=object)
+    kept_columns = np.flatnonzero(keep)
+    order = kept_columns[np.argsort(terms[kept_columns])]
+    new_columns = np.full(n_terms, -1, dtype=np.int32)
+    new_columns[order] = np.arange(len(order), dtype=np.int32)
+
+    counts.indices = new_columns[counts.indices]
+    counts.data[counts.indices < 0] = 0
+    counts.indices[counts.indices < 0] = 0
+    counts.eliminate_zeros()
+    counts = csr_matrix((counts.data, counts.indices, counts.indptr), shape=(n_docs, len(order)))
+    counts.sum_duplicates()
+
+    # Same weighting as TfidfTransformer
+    doc_freq = doc_freq[order].astype(np.float64)
+    smooth = int(vectorizer.smooth_idf)
+    idf = np.log((n_docs + smooth) / (doc_freq + smooth)) + 1
+
+    X = counts.astype(np.float64)
+    if vectorizer.binary:
+        X.data.fill(1)
+    if vectorizer.sublinear_tf:
+        np.log(X.data, X.data)
+        X.data += 1
+    if vectorizer.use_idf:
+        X.data *= idf[X.indices]
+    if vectorizer.norm:
+        X = normalize(X, norm=vectorizer.norm, copy=False)
+
+    compact = CompactTfidfVectorizer(
+        analyzer_params={name: vectorizer.get_params()[name] for name in ANALYZER_PARAMS},
+        terms=terms[order].tolist(),
+        columns=range(len(order)),
+        idf=idf,
+        norm=vectorizer.norm,
+        use_idf=vectorizer.use_idf,
+        sublinear_tf=vectorizer.sublinear_tf,
+        binary=vectorizer.binary,
+    )
+    return compact, X
+
+
+def fit_vectorizer_chunks(content_chunks, params, mode=None, n_features=None):
+    """
+    Fit the TF-IDF front end on chunks of content, see ``fit_vectorizer``.
+
+    Each chunk is turned into term counts as it arrives, so the content
+    strings of the whole catalog are never held at once.
+
+    Args:
+        content_chunks (iterable): Iterable of lists of preprocessed product content
+        params (dict): TfidfVectorizer parameters
+        mode (str): "vocabulary" (default) or "hashing"
+        n_features (int): Number of hashed features in hashing mode
+
+    Returns:
+        tuple: (vectorizer, tfidf_matrix)
+    """
+    mode = mode or Config.TFIDF_FEATURE_MODE
+
+    if mode == HASHING_MODE:
+        params = dict(params)
+        tfidf_options = {
+            name: params.pop(name)
+            for name in ["min_df", "max_df", "norm", "smooth_idf", "sublinear_tf"]
+            if name in params
+        }
+        vectorizer = HashedTfidfVectorizer(
+            n_features=n_features or Config.TFIDF_HASH_FEATURES,
+            **tfidf_options,
+            **params,
+        )
+        return vectorizer, vectorizer.fit_transform_chunks(content_chunks)
+
+    if mode != VOCABULARY_MODE:
+        raise ValueError(f"Unknown TF-IDF feature mode: {mode}")
+
+    return _fit_vocabulary_chunks(content_chunks, params)
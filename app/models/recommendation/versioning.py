@@ -0,0 +1,21 @@
+import os
+
+
+def model_version(path):
+    """
+    Get a version string for a persisted model.
+
+    The version is derived from the modification time and size of a model
+    file, so every worker that loads the same files reports the same version.
+
+    Args:
+        path (str): Path to a model file written at the end of training
+
+    Returns:
+        str: Version string, or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
@@ -56,3 +56,19 @@ def preprocess_text(text):
     processed_text = to_lowercase(processed_text)
 
     return processed_text
+
+def remove_accents(text):
+    """
+    Remove diacritics, e.g. for matching text typed without Vietnamese accents.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        str: Text with accents removed and đ/Đ mapped to d/D
+    """
+    if not isinstance(text, str):
+        return ""
+
+    decomposed = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return unicodedata.normalize('NFC', ''.join(ch for ch in decomposed if not unicodedata.combining(ch)))
@@ -0,0 +1,89 @@
+from flask import Blueprint, request, jsonify
+from app.middleware import admission_control
+from app.services.catalog_service import CatalogService
+from app.models.recommendation.projection import parse_fields
+from app.models.recommendation.attribute_index import parse_filters
+
+catalog_bp = Blueprint("catalog", __name__)
+
+
+@catalog_bp.route("", methods=["GET"])
+def list_catalogs():
+    """Endpoint to list the catalogs and the memory used by the loaded ones"""
+    try:
+        return jsonify(CatalogService.get_stats()), 200
+    except Exception as e:
+        return jsonify({"error": f"Error listing catalogs: {str(e)}"}), 500
+
+
+@catalog_bp.route("/<catalog>/recommend", methods=["GET"])
+@admission_control("light")
+def recommend(catalog):
+    """Endpoint to get recommendations for a product of a catalog"""
+    try:
+        product_id = request.args.get("product_id")
+        num_recommendations = int(request.args.get("num", 5))
+
+        if not product_id:
+            return jsonify({"error": "Product ID is required"}), 400
+
+        try:
+            filters = parse_filters(request.args)
+        except ValueError:
+            return jsonify({"error": "min_star must be a number"}), 400
+
+        recommendations = CatalogService.get_recommendations(
+            catalog, product_id, num_recommendations, parse_fields(request.args.get("fields")), filters
+        )
+
+        if isinstance(recommendations, dict) and "error" in recommendations:
+            return jsonify(recommendations), 404
+
+        return jsonify({"data": recommendations}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Error generating recommendations: {str(e)}"}), 500
+
+
+@catalog_bp.route("/<catalog>/recommend/keywords", methods=["GET"])
+@admission_control("light")
+def recommend_by_keywords(catalog):
+    """Endpoint to get recommendations from a catalog based on keywords"""
+    try:
+        keywords = request.args.get("keywords")
+        num_recommendations = int(request.args.get("num", 5))
+
+        if not keywords:
+            return jsonify({"error": "Keywords are required"}), 400
+
+        try:
+            filters = parse_filters(request.args)
+        except ValueError:
+            return jsonify({"error": "min_star must be a number"}), 400
+
+        recommendations = CatalogService.get_keyword_recommendations(
+            catalog, keywords, num_recommendations, parse_fields(request.args.get("fields")), filters
+        )
+
+        if isinstance(recommendations, dict) and "error" in recommendations:
+            return jsonify(recommendations), 404
+
+        return jsonify({"data": recommendations}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Error generating keyword recommendations: {str(e)}"}), 500
+
+
+@catalog_bp.route("/<catalog>/evict", methods=["POST"])
+def evict(catalog):
+    """Endpoint to unload a catalog from memory"""
+    try:
+        success, message = CatalogService.evict(catalog)
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 404
+
+    except Exception as e:
+        return jsonify({"error": f"Error evicting catalog: {str(e)}"}), 500
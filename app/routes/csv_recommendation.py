@@ -1,9 +1,45 @@
-from flask import Blueprint, request, jsonify
+import base64
+import json
+from flask import Blueprint, Response, current_app, request, jsonify
+from app.config import Config
+from app.middleware import admission_control, compress_stream, is_not_modified
 from app.services.csv_recommendation_service import CSVRecommendationService
+from app.models.recommendation.projection import parse_fields
+from app.models.recommendation.attribute_index import parse_filters
 
 csv_recommendation_bp = Blueprint("csv_recommendation", __name__)
 
 
+def encode_cursor(version, offset):
+    """Encode a pagination position as an opaque cursor"""
+    payload = json.dumps({"v": version, "o": offset}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (version, offset), raising ValueError if it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return payload["v"], int(payload["o"])
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def stream_products(products, chunk_size, dumps):
+    """Serialize products as a JSON document, one chunk of products at a time"""
+    yield b'{"data": ['
+    chunk = []
+    first = True
+    for product in products:
+        chunk.append(dumps(product))
+        if len(chunk) >= chunk_size:
+            yield ((b"" if first else b",") + ",".join(chunk).encode())
+            chunk, first = [], False
+    if chunk:
+        yield ((b"" if first else b",") + ",".join(chunk).encode())
+    yield b"]}"
+
+
 @csv_recommendation_bp.route("/train", methods=["POST"])
 def train_model():
     """Endpoint to train the recommendation model with products from CSV data"""
@@ -19,22 +55,116 @@ def train_model():
         return jsonify({"error": f"Error training model: {str(e)}"}), 500
 
 
+@csv_recommendation_bp.route("/cache", methods=["GET"])
+def cache_stats():
+    """Endpoint with the hit rate and size of the recommendation caches"""
+    return jsonify(CSVRecommendationService.get_cache_stats()), 200
+
+
+@csv_recommendation_bp.route("/cache/warm", methods=["POST"])
+def warm_cache():
+    """Endpoint to precompute recommendations for lists of products and keywords and the most requested ones"""
+    try:
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get("product_ids")
+        keywords = data.get("keywords")
+
+        if any(value is not None and not isinstance(value, list) for value in (product_ids, keywords)):
+            return jsonify({"error": "product_ids and keywords must be lists"}), 400
+
+        queued = CSVRecommendationService.warm_cache(product_ids, keywords)
+        return jsonify({"message": f"Cache warm-up started for {queued} requests"}), 202
+
+    except Exception as e:
+        return jsonify({"error": f"Error warming cache: {str(e)}"}), 500
+
+
+@csv_recommendation_bp.route("/model/footprint", methods=["GET"])
+def model_footprint():
+    """Admin endpoint with the byte breakdown of the loaded model and its manifest"""
+    try:
+        footprint = CSVRecommendationService.get_model_footprint()
+
+        if "error" in footprint:
+            return jsonify(footprint), 404
+
+        return jsonify(footprint), 200
+    except Exception as e:
+        return jsonify({"error": f"Error measuring model: {str(e)}"}), 500
+
+
 @csv_recommendation_bp.route("/products", methods=["GET"])
 def get_all_products():
-    """Endpoint to get all products from CSV data"""
+    """
+    Endpoint to get products from CSV data.
+
+    With offset, limit or cursor a single page is returned, otherwise the
+    whole catalog is streamed. Both carry an ETag tied to the model version
+    and the live product updates.
+    """
     try:
-        products = CSVRecommendationService.get_all_products()
+        fields = parse_fields(request.args.get("fields"))
+
+        version = CSVRecommendationService.get_model_version()
+        if is_not_modified(version):
+            response = Response(status=304)
+            response.set_etag(version)
+            return response
 
-        if isinstance(products, dict) and "error" in products:
-            return jsonify(products), 500
+        if any(name in request.args for name in ("offset", "limit", "cursor")):
+            return get_products_page(fields, version)
 
-        return jsonify({"data": products}), 200
+        result = CSVRecommendationService.iter_products(fields)
+        if isinstance(result, dict) and "error" in result:
+            return jsonify(result), 500
+
+        products, version = result
+        chunks, encoding = compress_stream(stream_products(products, Config.PRODUCTS_PAGE_SIZE, current_app.json.dumps))
+        response = Response(chunks, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if version:
+            response.set_etag(f"{version}-{encoding}" if encoding else version)
+        return response
 
     except Exception as e:
         return jsonify({"error": f"Error getting products: {str(e)}"}), 500
 
 
+def get_products_page(fields, version):
+    """Build the response for one page of products"""
+    try:
+        limit = int(request.args.get("limit", Config.PRODUCTS_PAGE_SIZE))
+        offset = int(request.args.get("offset", 0))
+        cursor = request.args.get("cursor")
+        if cursor:
+            cursor_version, offset = decode_cursor(cursor)
+            if cursor_version != version:
+                return jsonify({"error": "Cursor is no longer valid, the catalog has changed"}), 400
+    except ValueError:
+        return jsonify({"error": "Invalid offset, limit or cursor"}), 400
+
+    if offset < 0 or limit <= 0:
+        return jsonify({"error": "Offset must be >= 0 and limit must be > 0"}), 400
+    limit = min(limit, Config.PRODUCTS_MAX_PAGE_SIZE)
+
+    page = CSVRecommendationService.get_products_page(offset, limit, fields)
+    if "error" in page:
+        return jsonify(page), 500
+
+    next_offset = offset + limit
+    response = jsonify({
+        "data": page["data"],
+        "total": page["total"],
+        "next_cursor": encode_cursor(page["version"], next_offset) if next_offset < page["total"] else None,
+    })
+    if page["version"]:
+        response.set_etag(page["version"])
+    return response
+
+
 @csv_recommendation_bp.route("/recommend", methods=["GET"])
+@admission_control("light")
 def recommend():
     """Endpoint to get content-based recommendations for a product from CSV data"""
     try:
@@ -44,8 +174,13 @@ def recommend():
         if not product_id:
             return jsonify({"error": "Product ID is required"}), 400
 
+        try:
+            filters = parse_filters(request.args)
+        except ValueError:
+            return jsonify({"error": "min_star must be a number"}), 400
+
         recommendations = CSVRecommendationService.get_recommendations(
-            product_id, num_recommendations
+            product_id, num_recommendations, parse_fields(request.args.get("fields")), filters
         )
 
         if isinstance(recommendations, dict) and "error" in recommendations:
@@ -58,6 +193,7 @@ def recommend():
 
 
 @csv_recommendation_bp.route("/recommend/keywords", methods=["GET"])
+@admission_control("light")
 def recommend_by_keywords():
     """Endpoint to get recommendations based on keywords"""
     try:
@@ -67,8 +203,13 @@ def recommend_by_keywords():
         if not keywords:
             return jsonify({"error": "Keywords are required"}), 400
 
+        try:
+            filters = parse_filters(request.args)
+        except ValueError:
+            return jsonify({"error": "min_star must be a number"}), 400
+
         recommendations = CSVRecommendationService.get_keyword_recommendations(
-            keywords, num_recommendations
+            keywords, num_recommendations, parse_fields(request.args.get("fields")), filters
         )
 
         if isinstance(recommendations, dict) and "error" in recommendations:
@@ -78,3 +219,80 @@ def recommend_by_keywords():
 
     except Exception as e:
         return jsonify({"error": f"Error generating keyword recommendations: {str(e)}"}), 500
+
+
+@csv_recommendation_bp.route("/suggest", methods=["GET"])
+def suggest():
+    """Endpoint to complete a search prefix with vocabulary terms and product names"""
+    try:
+        prefix = request.args.get("prefix", "")
+
+        if not prefix.strip():
+            return jsonify({"error": "Prefix is required"}), 400
+
+        try:
+            limit = int(request.args.get("limit", Config.SUGGEST_LIMIT))
+        except ValueError:
+            return jsonify({"error": "Limit must be a number"}), 400
+        if limit <= 0:
+            return jsonify({"error": "Limit must be > 0"}), 400
+
+        suggestions = CSVRecommendationService.suggest(prefix, min(limit, Config.SUGGEST_MAX_LIMIT))
+
+        if "error" in suggestions:
+            return jsonify(suggestions), 404
+
+        return jsonify(suggestions), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Error getting suggestions: {str(e)}"}), 500
+
+
+@csv_recommendation_bp.route("/products/upsert", methods=["POST"])
+def upsert_products():
+    """Endpoint to add or replace products in the CSV model without retraining"""
+    try:
+        payload = request.get_json(silent=True)
+
+        if payload is None:
+            return jsonify({"error": "A JSON product or list of products is required"}), 400
+
+        success, message = CSVRecommendationService.upsert_products(payload)
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 400
+
+    except Exception as e:
+        return jsonify({"error": f"Error upserting products: {str(e)}"}), 500
+
+
+@csv_recommendation_bp.route("/products/<int:product_id>", methods=["DELETE"])
+def delete_product(product_id):
+    """Endpoint to remove a product from the CSV model without retraining"""
+    try:
+        success, message = CSVRecommendationService.delete_product(product_id)
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 404
+
+    except Exception as e:
+        return jsonify({"error": f"Error deleting product: {str(e)}"}), 500
+
+
+@csv_recommendation_bp.route("/products/fold", methods=["POST"])
+def fold_products():
+    """Endpoint to merge upserted and deleted products into the main CSV model"""
+    try:
+        success, message = CSVRecommendationService.fold_delta()
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 500
+
+    except Exception as e:
+        return jsonify({"error": f"Error folding product changes: {str(e)}"}), 500
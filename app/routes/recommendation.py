@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify
+from app.config import Config
+from app.middleware import admission_control, admission_controller
+from app.services.admission import DeadlineExceeded
 from app.services.recommendation_service import RecommendationService
-from app.models.database import execute_query
+from app.models.database import execute_query, get_pool_status
+from app.models.recommendation.projection import parse_fields
+from app.models.recommendation.attribute_index import parse_filters
 
 recommendation_bp = Blueprint("recommendation", __name__)
 
@@ -36,6 +41,7 @@ def refresh_model():
 
 
 @recommendation_bp.route("/recommend", methods=["GET"])
+@admission_control("light")
 def recommend():
     """Endpoint to get content-based recommendations for a product"""
     try:
@@ -45,8 +51,13 @@ def recommend():
         if not product_id:
             return jsonify({"error": "Product ID is required"}), 400
 
+        try:
+            filters = parse_filters(request.args)
+        except ValueError:
+            return jsonify({"error": "min_star must be a number"}), 400
+
         recommendations = RecommendationService.get_content_based_recommendations(
-            product_id, num_recommendations
+            product_id, num_recommendations, parse_fields(request.args.get("fields")), filters
         )
 
         if isinstance(recommendations, dict) and "error" in recommendations:
@@ -59,6 +70,7 @@ def recommend():
 
 
 @recommendation_bp.route("/recommend/category", methods=["GET"])
+@admission_control("heavy")
 def recommend_by_category():
     """Endpoint to get recommendations for products in a specific category"""
     try:
@@ -69,7 +81,7 @@ def recommend_by_category():
             return jsonify({"error": "Category ID is required"}), 400
 
         recommendations = RecommendationService.get_category_recommendations(
-            category_id, num_recommendations
+            category_id, num_recommendations, parse_fields(request.args.get("fields"))
         )
 
         if isinstance(recommendations, dict) and "error" in recommendations:
@@ -77,11 +89,15 @@ def recommend_by_category():
 
         return jsonify({"recommendations": recommendations}), 200
 
+    except DeadlineExceeded:
+        # Answered by admission control with 503
+        raise
     except Exception as e:
         return jsonify({"error": f"Error generating category recommendations: {str(e)}"}), 500
 
 
 @recommendation_bp.route("/recommend/group", methods=["GET"])
+@admission_control("heavy")
 def recommend_by_group():
     """Endpoint to get recommendations for products in a specific group"""
     try:
@@ -92,7 +108,7 @@ def recommend_by_group():
             return jsonify({"error": "Group ID is required"}), 400
 
         recommendations = RecommendationService.get_group_recommendations(
-            group_id, num_recommendations
+            group_id, num_recommendations, parse_fields(request.args.get("fields"))
         )
 
         if isinstance(recommendations, dict) and "error" in recommendations:
@@ -100,10 +116,100 @@ def recommend_by_group():
 
         return jsonify({"recommendations": recommendations}), 200
 
+    except DeadlineExceeded:
+        # Answered by admission control with 503
+        raise
     except Exception as e:
         return jsonify({"error": f"Error generating group recommendations: {str(e)}"}), 500
 
 
+@recommendation_bp.route("/products/upsert", methods=["POST"])
+def upsert_products():
+    """Endpoint to add or replace products in the recommendation model without retraining"""
+    try:
+        payload = request.get_json(silent=True)
+
+        if payload is None:
+            return jsonify({"error": "A JSON product or list of products is required"}), 400
+
+        success, message = RecommendationService.upsert_products(payload)
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 400
+
+    except Exception as e:
+        return jsonify({"error": f"Error upserting products: {str(e)}"}), 500
+
+
+@recommendation_bp.route("/products/<int:product_id>", methods=["DELETE"])
+def delete_product(product_id):
+    """Endpoint to remove a product from the recommendation model without retraining"""
+    try:
+        success, message = RecommendationService.delete_product(product_id)
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 404
+
+    except Exception as e:
+        return jsonify({"error": f"Error deleting product: {str(e)}"}), 500
+
+
+@recommendation_bp.route("/products/fold", methods=["POST"])
+def fold_products():
+    """Endpoint to merge upserted and deleted products into the main model"""
+    try:
+        success, message = RecommendationService.fold_delta()
+
+        if success:
+            return jsonify({"message": message}), 200
+        else:
+            return jsonify({"error": message}), 500
+
+    except Exception as e:
+        return jsonify({"error": f"Error folding product changes: {str(e)}"}), 500
+
+
+@recommendation_bp.route("/cache", methods=["GET"])
+def cache_stats():
+    """Endpoint with the hit rate and size of the recommendation cache"""
+    return jsonify(RecommendationService.get_cache_stats()), 200
+
+
+@recommendation_bp.route("/cache/warm", methods=["POST"])
+def warm_cache():
+    """Endpoint to precompute recommendations for a list of products and the most requested ones"""
+    try:
+        data = request.get_json(silent=True) or {}
+        product_ids = data.get("product_ids")
+
+        if product_ids is not None and not isinstance(product_ids, list):
+            return jsonify({"error": "product_ids must be a list"}), 400
+
+        queued = RecommendationService.warm_cache(product_ids)
+        return jsonify({"message": f"Cache warm-up started for {queued} requests"}), 202
+
+    except Exception as e:
+        return jsonify({"error": f"Error warming cache: {str(e)}"}), 500
+
+
+@recommendation_bp.route("/model/footprint", methods=["GET"])
+def model_footprint():
+    """Admin endpoint with the byte breakdown of the loaded model and its manifest"""
+    try:
+        footprint = RecommendationService.get_model_footprint()
+
+        if "error" in footprint:
+            return jsonify(footprint), 404
+
+        return jsonify(footprint), 200
+    except Exception as e:
+        return jsonify({"error": f"Error measuring model: {str(e)}"}), 500
+
+
 @recommendation_bp.route("/debug/db", methods=["GET"])
 def debug_db():
     """Debug endpoint to check database connection and schema"""
@@ -141,3 +247,15 @@ def debug_db():
 
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+
+@recommendation_bp.route("/debug/pool", methods=["GET"])
+def debug_pool():
+    """Debug endpoint to check the database connection pool"""
+    return jsonify(get_pool_status()), 200
+
+
+@recommendation_bp.route("/debug/admission", methods=["GET"])
+def debug_admission():
+    """Debug endpoint with the admission limits, queues and rejection counts per endpoint class"""
+    return jsonify({"enabled": Config.ADMISSION_ENABLED, "classes": admission_controller.stats()}), 200
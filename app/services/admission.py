@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+# Deadline (time.monotonic()) of the request being served, None without one
+_deadline = contextvars.ContextVar("admission_deadline", default=None)
+
+
+class AdmissionRejected(Exception):
+    """A request that was shed; carries its HTTP status and Retry-After seconds"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(AdmissionRejected):
+    """A request's deadline passed before its work could finish"""
+
+    def __init__(self, message="Request deadline exceeded", retry_after=1):
+        super().__init__(message, 503, retry_after)
+
+
+def check_deadline():
+    """Abort the current request's work once its deadline has passed"""
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded()
+
+
+class EndpointLimiter:
+    """
+    Concurrency limit with a bounded wait queue for one class of endpoints.
+
+    Up to ``max_concurrent`` requests run at once and up to ``max_queue``
+    more wait for a slot. A request arriving to a full queue is rejected
+    right away (429); a queued request whose deadline passes before it gets
+    a slot is rejected with 503. Admitted requests carry their deadline so
+    long-running work can stop early with ``check_deadline``.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, deadline_ms=0):
+        """
+        Args:
+            name (str): Endpoint class name, used in messages and stats
+            max_concurrent (int): Requests running at once
+            max_queue (int): Requests waiting for a slot
+            deadline_ms (float): Time a request may take from arrival, queue
+                wait included (0 disables deadlines)
+        """
+        self.name = name
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_queue = max(max_queue, 0)
+        self.deadline = deadline_ms / 1000 if deadline_ms else None
+        self._slot_free = threading.Condition()
+        # Queued requests of async routes wait for their slot here, one thread each
+        self._queue_executor = ThreadPoolExecutor(
+            max_workers=max(self.max_queue, 1), thread_name_prefix=f"admission-{name}"
+        )
+        self._service_seconds = None
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+        self.deadline_exceeded = 0
+
+    def _retry_after(self):
+        """Seconds until the queue ahead is likely drained (lock held)"""
+        service_seconds = self._service_seconds or 1.0
+        return max(1, math.ceil(service_seconds * (self.queued + 1) / self.max_concurrent))
+
+    def _acquire(self, deadline):
+        """
+        Take a slot, waiting in the queue for one.
+
+        Raises:
+            AdmissionRejected: If the queue is full (429) or the deadline
+                passes while waiting (503)
+        """
+        with self._slot_free:
+            if self.running >= self.max_concurrent:
+                if self.queued >= self.max_queue:
+                    self.rejected_queue_full += 1
+                    raise AdmissionRejected(f"Too many {self.name} requests, retry later", 429, self._retry_after())
+
+                self.queued += 1
+                try:
+                    while self.running >= self.max_concurrent:
+                        remaining = deadline - time.monotonic() if deadline else None
+                        if remaining is not None and remaining <= 0:
+                            self.rejected_queue_timeout += 1
+                            raise AdmissionRejected(
+                                f"Timed out waiting for a {self.name} request slot", 503, self._retry_after()
+                            )
+                        self._slot_free.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.running += 1
+            self.admitted += 1
+
+    def _try_acquire(self):
+        """Take a slot if one is free right now, without queueing"""
+        with self._slot_free:
+            if self.running >= self.max_concurrent:
+                return False
+            self.running += 1
+            self.admitted += 1
+            return True
+
+    @contextmanager
+    def _holding_slot(self, deadline):
+        """Run the admitted request with its deadline and give the slot back after it"""
+        token = _deadline.set(deadline)
+        start = time.monotonic()
+        try:
+            yield
+        except DeadlineExceeded:
+            with self._slot_free:
+                self.deadline_exceeded += 1
+            raise
+        finally:
+            _deadline.reset(token)
+            self._release(time.monotonic() - start)
+
+    def _release(self, elapsed=None):
+        """Give a slot back; elapsed is the time the request held it"""
+        with self._slot_free:
+            self.running -= 1
+            if elapsed is not None:
+                # Moving average of the time a request holds a slot, for Retry-After
+                self._service_seconds = elapsed if self._service_seconds is None else (
+                    0.8 * self._service_seconds + 0.2 * elapsed
+                )
+            self._slot_free.notify()
+
+    @contextmanager
+    def admit(self):
+        """
+        Run a request under the limits.
+
+        Raises:
+            AdmissionRejected: If the queue is full (429) or the deadline
+                passes while waiting (503)
+        """
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        self._acquire(deadline)
+        with self._holding_slot(deadline):
+            yield
+
+    @asynccontextmanager
+    async def admit_async(self):
+        """
+        Run a request of an async route under the limits.
+
+        A queued request waits for its slot in a worker thread, so the event
+        loop keeps serving. The deadline is set in the calling task's context;
+        work sent to other threads must run in a copy of that context
+        (``contextvars.copy_context().run``) to see it.
+
+        Raises:
+            AdmissionRejected: If the queue is full (429) or the deadline
+                passes while waiting (503)
+        """
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        if not self._try_acquire():
+            waiting = self._queue_executor.submit(self._acquire, deadline)
+            try:
+                await asyncio.wrap_future(waiting)
+            except asyncio.CancelledError:
+                # The client went away; a slot granted after that goes straight back
+                waiting.add_done_callback(
+                    lambda future: future.cancelled() or future.exception() or self._release()
+                )
+                raise
+        with self._holding_slot(deadline):
+            yield
+
+    def stats(self):
+        with self._slot_free:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "deadline_ms": self.deadline * 1000 if self.deadline else 0,
+                "running": self.running,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_queue_timeout": self.rejected_queue_timeout,
+                "deadline_exceeded": self.deadline_exceeded,
+            }
+
+
+class AdmissionController:
+    """Admission limits per endpoint class, e.g. cheap single-product lookups and expensive category scans"""
+
+    def __init__(self, limiters):
+        """
+        Args:
+            limiters (list): EndpointLimiter per endpoint class
+        """
+        self.limiters = {limiter.name: limiter for limiter in limiters}
+
+    def admit(self, endpoint_class):
+        return self.limiters[endpoint_class].admit()
+
+    def admit_async(self, endpoint_class):
+        return self.limiters[endpoint_class].admit_async()
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
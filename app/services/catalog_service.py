@@ -0,0 +1,472 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from app.config import Config
+from app.models.csv_data_loader import get_price_range as csv_price_range
+from app.models.recommendation.catalog import CatalogFiles
+from app.models.recommendation.compaction import compact_matrix
+from app.models.recommendation.constants import (
+    MODEL_DIR, TFIDF_MODEL_PATH, MATRIX_PATH, ITEMS_PATH, MEMBERSHIP_PATH, MANIFEST_PATH,
+    CSV_TFIDF_MODEL_PATH, CSV_MATRIX_PATH, CSV_ITEMS_PATH, CSV_MANIFEST_PATH, CSV_SUGGEST_PATH
+)
+from app.models.recommendation.content_based import get_price_range
+from app.models.recommendation.footprint import ModelBudgetExceeded
+from app.models.recommendation.registry import ModelRegistry, parse_catalogs
+from app.services.micro_batcher import MicroBatcher, recommendation_batch_fn
+from app.services.recommendation_cache import (
+    RecommendationCache, HitCounter, warm_cache, start_warm_up, warm_up_keys
+)
+
+logger = logging.getLogger(__name__)
+
+# Catalogs trained by the app
+DB_CATALOG = "db"
+CSV_CATALOG = "csv"
+
+# Memory-mapped copies of the catalog matrices
+MMAP_DIR = os.path.join(MODEL_DIR, "mmap")
+
+
+def build_registry():
+    """Register the database and CSV catalogs plus the ones configured in CATALOGS"""
+    mmap_dir = MMAP_DIR if Config.MODEL_MMAP else None
+    registry = ModelRegistry(Config.MODEL_MEMORY_BUDGET_MB * 1024 * 1024)
+
+    registry.register(CatalogFiles(
+        DB_CATALOG, TFIDF_MODEL_PATH, MATRIX_PATH, ITEMS_PATH, get_price_range, mmap_dir,
+        membership_path=MEMBERSHIP_PATH, manifest_path=MANIFEST_PATH,
+    ))
+    registry.register(CatalogFiles(
+        CSV_CATALOG, CSV_TFIDF_MODEL_PATH, CSV_MATRIX_PATH, CSV_ITEMS_PATH, csv_price_range, mmap_dir,
+        manifest_path=CSV_MANIFEST_PATH, suggest_path=CSV_SUGGEST_PATH, label="in CSV data",
+    ))
+
+    # Extra catalogs use the database model file layout
+    for name, directory in parse_catalogs(Config.CATALOGS).items():
+        registry.register(CatalogFiles(
+            name,
+            os.path.join(directory, os.path.basename(TFIDF_MODEL_PATH)),
+            os.path.join(directory, os.path.basename(MATRIX_PATH)),
+            os.path.join(directory, os.path.basename(ITEMS_PATH)),
+            get_price_range,
+            mmap_dir,
+            membership_path=os.path.join(directory, os.path.basename(MEMBERSHIP_PATH)),
+            manifest_path=os.path.join(directory, os.path.basename(MANIFEST_PATH)),
+            label=f"in catalog {name}",
+        ))
+
+    return registry
+
+
+class CatalogCaches:
+    """Recommendation caches, request counts and micro-batcher of one catalog"""
+
+    def __init__(self, name):
+        # The database catalog keeps the file names it had before catalogs existed
+        prefix = "" if name == DB_CATALOG else f"{name}_"
+        self.recommend = RecommendationCache(Config.RECOMMEND_CACHE_SIZE)
+        self.keywords = RecommendationCache(Config.RECOMMEND_CACHE_SIZE)
+        self.recommend_hits = HitCounter(
+            os.path.join(MODEL_DIR, f"{prefix}recommend_hits.json"), save_every=Config.HIT_COUNTER_SAVE_EVERY
+        )
+        self.keyword_hits = HitCounter(
+            os.path.join(MODEL_DIR, f"{prefix}keyword_hits.json"), save_every=Config.HIT_COUNTER_SAVE_EVERY
+        )
+        # Batches concurrent single-product recommendation calls (opt-in)
+        self.batcher = MicroBatcher(
+            recommendation_batch_fn(partial(CatalogService.recommend_batch, name)),
+            window_ms=Config.MICRO_BATCH_WINDOW_MS,
+            max_batch_size=Config.MICRO_BATCH_MAX_SIZE,
+        )
+        # Serializes upserts, deletes, folds and model swaps of the catalog
+        self.update_lock = threading.RLock()
+        # Warms new models and swaps them in, one at a time and in order
+        self.publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"publish-{name}")
+        self._publications = itertools.count(1)
+        self.published = 0
+        self.pending_fold = None
+        self._warmed_model = None
+        self._warmed_lock = threading.Lock()
+
+    def stats(self):
+        return {"recommend": self.recommend.stats(), "keywords": self.keywords.stats()}
+
+    def next_publication(self):
+        """Number a publication, later publications win (update_lock held)"""
+        return next(self._publications)
+
+    def claim_warm_up(self, model):
+        """
+        Mark a served model as warmed.
+
+        Returns:
+            bool: False if the model was already warmed (or claimed)
+        """
+        warmed = self._warmed_model
+        if warmed is not None and warmed() is model:
+            return False
+        with self._warmed_lock:
+            warmed = self._warmed_model
+            if warmed is not None and warmed() is model:
+                return False
+            # A weak reference, so an evicted model is not kept in memory
+            self._warmed_model = weakref.ref(model)
+            return True
+
+    def warm_up_groups(self, product_ids=None, keywords=None):
+        """
+        Keys to warm for each cache: the supplied products and keyword
+        queries, then the most requested ones.
+
+        Args:
+            product_ids (list): Products to warm first with the default
+                request options (WARMUP_PRODUCT_IDS when None)
+            keywords (list): Keyword queries to warm first (WARMUP_KEYWORDS when None)
+
+        Returns:
+            list: (kind, cache, keys) for the "recommend" and "keywords" caches
+        """
+        if product_ids is None:
+            product_ids = Config.WARMUP_PRODUCT_IDS.split(",")
+        if keywords is None:
+            keywords = Config.WARMUP_KEYWORDS.split(",")
+        return [
+            ("recommend", self.recommend, warm_up_keys(
+                product_ids, self.recommend_hits, Config.WARMUP_NUM_RECOMMENDATIONS, Config.WARMUP_TOP_N
+            )),
+            ("keywords", self.keywords, warm_up_keys(
+                keywords, self.keyword_hits, Config.WARMUP_NUM_RECOMMENDATIONS, Config.WARMUP_TOP_N
+            )),
+        ]
+
+
+class CatalogService:
+    """Service for recommendations from any registered catalog"""
+
+    @staticmethod
+    def load(catalog):
+        """
+        Get a catalog model, loading it if needed.
+
+        Returns:
+            CatalogModel: The model, or None if the catalog is not trained yet
+
+        Raises:
+            KeyError: If the catalog is not registered
+        """
+        try:
+            model = model_registry.get(catalog)
+        except (FileNotFoundError, EOFError):
+            return None
+
+        # A model loaded from disk (at startup or after an eviction) is warmed
+        # in the background from the request counts saved before
+        if catalog_caches[catalog].claim_warm_up(model):
+            CatalogService.warm_cache(catalog)
+        return model
+
+    @staticmethod
+    def _get_model(catalog):
+        """Get a loaded catalog model, or an error dict"""
+        try:
+            model = CatalogService.load(catalog)
+        except KeyError:
+            return {"error": f"Catalog {catalog} not found"}
+        if model is None:
+            return {"error": f"Catalog {catalog} is not trained yet"}
+        return model
+
+    @staticmethod
+    def get_generation(catalog):
+        """Get the generation of the served model of a catalog, None when it is not loaded"""
+        model = model_registry.peek(catalog)
+        return model.generation() if model is not None else None
+
+    @staticmethod
+    def publish(catalog, model, refold=False):
+        """
+        Save and serve a trained or folded model once its cache is warm.
+
+        While another model is served, the hot keys are scored with the new
+        model in a background thread, within WARMUP_MAX_SECONDS, and the old
+        model keeps serving; the new model is then saved and swapped in with
+        the warmed results. Publications of a catalog are applied in order. A
+        first model, or any model when the cache is disabled, is served right
+        away (and warmed in the background like a loaded model).
+
+        Args:
+            catalog (str): Catalog name
+            model (CatalogModel): Model built by the catalog source
+            refold (bool): The model folds the changes of the served model;
+                changes made during the warm-up are folded again at the swap
+
+        Returns:
+            concurrent.futures.Future: Resolves to the served model once the
+                swap is done
+        """
+        caches = catalog_caches[catalog]
+        with caches.update_lock:
+            publication = caches.next_publication()
+            served = model_registry.peek(catalog)
+            if served is None or not caches.recommend.max_entries:
+                CatalogService._swap(catalog, model, publication)
+                future = Future()
+                future.set_result(model)
+                return future
+
+            future = caches.publisher.submit(
+                CatalogService._warm_and_swap, catalog, model, publication, served, served.generation(), refold
+            )
+            if refold:
+                caches.pending_fold = future
+            return future
+
+    @staticmethod
+    def _swap(catalog, model, publication, staged=()):
+        """Save and serve a model with its warmed results (update_lock held)"""
+        caches = catalog_caches[catalog]
+        model_registry.source(catalog).save(model)
+        model_registry.publish(model)
+        caches.published = publication
+        for cache, staged_cache in staged:
+            cache.install(staged_cache)
+        if caches.claim_warm_up(model) and not staged:
+            CatalogService.warm_cache(catalog)
+
+    @staticmethod
+    def _warm_and_swap(catalog, model, publication, served, served_generation, refold):
+        """Warm the caches of a model, then swap it in unless a later publication was served"""
+        caches = catalog_caches[catalog]
+        try:
+            staged = []
+            score_batches = {"recommend": model.recommend_batch, "keywords": model.recommend_keywords_batch}
+            for kind, cache, keys in caches.warm_up_groups():
+                if not keys:
+                    continue
+                start = time.perf_counter()
+                staged_cache = RecommendationCache(cache.max_entries)
+                warmed = warm_cache(
+                    staged_cache, model.generation, [(keys, recommendation_batch_fn(score_batches[kind]))],
+                    Config.WARMUP_MAX_SECONDS, Config.WARMUP_CPU_SHARE, Config.WARMUP_BATCH_SIZE,
+                )
+                logger.info(f"Cache warm-up ({catalog}_{kind}): {warmed} results in {time.perf_counter() - start:.1f}s")
+                staged.append((cache, staged_cache))
+
+            with caches.update_lock:
+                if publication < caches.published:
+                    return model_registry.peek(catalog)
+
+                current = model_registry.peek(catalog)
+                if refold and (current is not served or current.generation() != served_generation):
+                    # Products changed during the warm-up: fold them too, the warmed results predate them
+                    if current is None or not current.has_pending_changes:
+                        return current
+                    model, staged = model_registry.source(catalog).fold(current), []
+                CatalogService._swap(catalog, model, publication, staged)
+                return model
+        except Exception as e:
+            logger.error(f"Catalog {catalog}: could not publish the new model, keeping the served one: {str(e)}")
+            raise
+
+    @staticmethod
+    def recommend_batch(catalog, product_ids, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for several products of a catalog with one sparse matrix product"""
+        model = CatalogService._get_model(catalog)
+        if isinstance(model, dict):
+            return [model for _ in product_ids]
+        return model.recommend_batch(product_ids, num_recommendations, fields, filters)
+
+    @staticmethod
+    def recommend_keywords_batch(catalog, keywords_list, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for several keyword queries from a catalog"""
+        model = CatalogService._get_model(catalog)
+        if isinstance(model, dict):
+            return [model for _ in keywords_list]
+        return model.recommend_keywords_batch(keywords_list, num_recommendations, fields, filters)
+
+    @staticmethod
+    def get_recommendations(catalog, product_id, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations for a product of a catalog, through its cache"""
+        try:
+            model = CatalogService._get_model(catalog)
+            if isinstance(model, dict):
+                return model
+
+            caches = catalog_caches[catalog]
+            key = (str(product_id), num_recommendations, fields, filters)
+            caches.recommend_hits.record(key)
+            generation = model.generation()
+            recommendations = caches.recommend.get(generation, key)
+            if recommendations is not None:
+                return recommendations
+
+            if Config.MICRO_BATCH_ENABLED:
+                recommendations = caches.batcher.submit(key)
+            else:
+                recommendations = model.recommend(product_id, num_recommendations, fields, filters)
+            caches.recommend.put(generation, key, recommendations)
+            return recommendations
+        except Exception as e:
+            error_message = f"Error getting catalog recommendations: {str(e)}"
+            print(error_message)
+            return {"error": error_message}
+
+    @staticmethod
+    def get_keyword_recommendations(catalog, keywords, num_recommendations=5, fields=None, filters=None):
+        """Generate keyword recommendations from a catalog, through its cache"""
+        try:
+            model = CatalogService._get_model(catalog)
+            if isinstance(model, dict):
+                return model
+
+            caches = catalog_caches[catalog]
+            key = (keywords, num_recommendations, fields, filters)
+            caches.keyword_hits.record(key)
+            generation = model.generation()
+            recommendations = caches.keywords.get(generation, key)
+            if recommendations is not None:
+                return recommendations
+
+            recommendations = model.recommend_keywords(keywords, num_recommendations, fields, filters)
+            caches.keywords.put(generation, key, recommendations)
+            return recommendations
+        except Exception as e:
+            error_message = f"Error getting catalog keyword recommendations: {str(e)}"
+            print(error_message)
+            return {"error": error_message}
+
+    @staticmethod
+    def warm_cache(catalog, product_ids=None, keywords=None):
+        """
+        Precompute the recommendations of the most requested products and
+        keyword queries of a catalog in the background.
+
+        Args:
+            catalog (str): Catalog name
+            product_ids (list): Products to warm first with the default
+                request options (WARMUP_PRODUCT_IDS when None)
+            keywords (list): Keyword queries to warm first (WARMUP_KEYWORDS when None)
+
+        Returns:
+            int: Number of keys queued for the warm-up
+        """
+        caches = catalog_caches[catalog]
+        if not caches.recommend.max_entries:
+            return 0
+
+        score_batches = {
+            "recommend": partial(CatalogService.recommend_batch, catalog),
+            "keywords": partial(CatalogService.recommend_keywords_batch, catalog),
+        }
+        queued = 0
+        for kind, cache, keys in caches.warm_up_groups(product_ids, keywords):
+            if keys:
+                start_warm_up(
+                    f"{catalog}_{kind}", cache, partial(CatalogService.get_generation, catalog),
+                    [(keys, recommendation_batch_fn(score_batches[kind]))],
+                    Config.WARMUP_MAX_SECONDS, Config.WARMUP_CPU_SHARE, Config.WARMUP_BATCH_SIZE,
+                )
+                queued += len(keys)
+        return queued
+
+    @staticmethod
+    def get_cache_stats(catalog):
+        """Get the hit rate and size of the recommendation caches of a catalog"""
+        return catalog_caches[catalog].stats()
+
+    @staticmethod
+    def upsert_products(catalog, products, prepare_products):
+        """
+        Add or replace products of a catalog without retraining.
+
+        Args:
+            catalog (str): Catalog name
+            products (list): Product dicts, each with an integer ``id``
+            prepare_products (callable): Builds the product rows with their
+                content column from the product dicts
+
+        Returns:
+            int: Number of products waiting in the delta, None if the catalog is not trained
+        """
+        with catalog_caches[catalog].update_lock:
+            model = CatalogService.load(catalog)
+            if model is None:
+                return None
+
+            products_df = prepare_products(products)
+            matrix = compact_matrix(
+                model.vectorizer.transform(products_df['content']), Config.TFIDF_PRUNE_THRESHOLD
+            )
+            size = model.delta_index.upsert(products_df.drop(columns=['content']), matrix)
+            if size >= Config.DELTA_MAX_SIZE:
+                try:
+                    CatalogService.fold_delta(catalog)
+                    # Products stay in the delta until the folded model is swapped in
+                    size = len(model_registry.peek(catalog).delta_index)
+                except ModelBudgetExceeded as e:
+                    # The upsert is applied; the products stay in the delta until a fold fits
+                    logger.warning(f"Catalog {catalog}: {str(e)}")
+        return size
+
+    @staticmethod
+    def delete_product(catalog, product_id):
+        """
+        Delete a product of a catalog without retraining.
+
+        Returns:
+            bool: False if the product is unknown or already deleted, None if
+                the catalog is not trained
+        """
+        with catalog_caches[catalog].update_lock:
+            model = CatalogService.load(catalog)
+            if model is None:
+                return None
+            return model.delta_index.delete(product_id)
+
+    @staticmethod
+    def fold_delta(catalog):
+        """
+        Merge the upserted and deleted products of a catalog into a new model, save and serve it.
+
+        The folded model is served once its cache is warm, see publish.
+        Changes made until then are folded at the swap.
+
+        Returns:
+            bool: False if the catalog is not trained
+        """
+        caches = catalog_caches[catalog]
+        with caches.update_lock:
+            model = CatalogService.load(catalog)
+            if model is None:
+                return False
+            if caches.pending_fold is not None and not caches.pending_fold.done():
+                return True
+            if model.has_pending_changes:
+                CatalogService.publish(catalog, model_registry.source(catalog).fold(model), refold=True)
+        return True
+
+    @staticmethod
+    def get_stats():
+        """Get the registered catalogs and their memory usage"""
+        return model_registry.stats()
+
+    @staticmethod
+    def evict(catalog):
+        """Unload a catalog, it is reloaded on its next request"""
+        if catalog not in model_registry.names():
+            return False, f"Catalog {catalog} not found"
+        if not model_registry.evict(catalog):
+            model = model_registry.peek(catalog)
+            if model is not None and model.has_pending_changes:
+                return False, f"Catalog {catalog} has product changes waiting to be folded"
+            return False, f"Catalog {catalog} is not loaded"
+        return True, f"Catalog {catalog} evicted"
+
+
+model_registry = build_registry()
+catalog_caches = {name: CatalogCaches(name) for name in model_registry.names()}
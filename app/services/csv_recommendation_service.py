@@ -1,75 +1,50 @@
-import pickle
-import os
 import pandas as pd
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from app.models.csv_data_loader import load_csv_data
-
-# Global variables to store models
-csv_tfidf_vectorizer = None
-csv_tfidf_matrix = None
-csv_items_df = None
-
-# Path to save/load model files
-MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
-os.makedirs(MODEL_DIR, exist_ok=True)
-CSV_TFIDF_MODEL_PATH = os.path.join(MODEL_DIR, "csv_tfidf_vectorizer.pkl")
-CSV_MATRIX_PATH = os.path.join(MODEL_DIR, "csv_tfidf_matrix.pkl")
-CSV_ITEMS_PATH = os.path.join(MODEL_DIR, "csv_items.pkl")
-
-# TF-IDF parameters
-TFIDF_PARAMS = {
-    "analyzer": "word",
-    "stop_words": None,  # Removed English stopwords for Vietnamese text
-    "min_df": 0.01,
-    "max_df": 0.95,
-    "ngram_range": (1, 2)  # Include bigrams for better feature extraction
-}
+from app.config import Config
+from app.models.csv_data_loader import iter_csv_data, prepare_content_features
+from app.models.recommendation.content_based import fit_content_frames
+from app.models.recommendation.delta_index import normalize_products
+from app.models.recommendation.projection import make_projection
+from app.services.catalog_service import CSV_CATALOG, CatalogService, model_registry
+
+
+def prepare_products(products):
+    """Build the product rows, with their content, of new or changed CSV products"""
+    return prepare_content_features(pd.DataFrame(products))
 
 
 class CSVRecommendationService:
-    """Service for handling product recommendations based on CSV data"""
+    """Service for handling product recommendations based on CSV data (the "csv" catalog)"""
 
     @staticmethod
-    def load_models():
-        """Load pre-trained models if they exist"""
-        global csv_tfidf_vectorizer, csv_tfidf_matrix, csv_items_df
-
-        try:
-            with open(CSV_TFIDF_MODEL_PATH, 'rb') as f:
-                csv_tfidf_vectorizer = pickle.load(f)
-            with open(CSV_MATRIX_PATH, 'rb') as f:
-                csv_tfidf_matrix = pickle.load(f)
-            with open(CSV_ITEMS_PATH, 'rb') as f:
-                csv_items_df = pickle.load(f)
-            return True
-        except (FileNotFoundError, EOFError):
-            return False
+    def load_model():
+        """
+        Get the CSV model, training it from the CSV data on first use.
+
+        Returns:
+            CatalogModel: The model, or an error dict
+        """
+        model = CatalogService.load(CSV_CATALOG)
+        if model is not None:
+            return model
+
+        success, message = CSVRecommendationService.train_model()
+        if not success:
+            return {"error": message}
+        return CatalogService.load(CSV_CATALOG)
 
     @staticmethod
     def train_model():
         """Train a content-based recommendation model using CSV data"""
-        global csv_tfidf_vectorizer, csv_tfidf_matrix, csv_items_df
-
         try:
-            # Load CSV data
-            csv_items_df = load_csv_data()
+            # Stream the CSV data chunk by chunk into the TF-IDF matrix
+            fitted = fit_content_frames(iter_csv_data())
 
-            if csv_items_df is None or len(csv_items_df) == 0:
+            if fitted is None:
                 return False, "No products found in CSV data"
 
-            # Create TF-IDF matrix
-            csv_tfidf_vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
-            csv_tfidf_matrix = csv_tfidf_vectorizer.fit_transform(csv_items_df['content'])
-
-            # Save models
-            with open(CSV_TFIDF_MODEL_PATH, 'wb') as f:
-                pickle.dump(csv_tfidf_vectorizer, f)
-            with open(CSV_MATRIX_PATH, 'wb') as f:
-                pickle.dump(csv_tfidf_matrix, f)
-            with open(CSV_ITEMS_PATH, 'wb') as f:
-                pickle.dump(csv_items_df, f)
+            # Keep the loaded model if the new one does not fit in the budget
+            model = model_registry.source(CSV_CATALOG).train(*fitted)
+            CatalogService.publish(CSV_CATALOG, model)
 
             return True, "CSV-based recommendation model trained successfully"
         except Exception as e:
@@ -78,104 +53,185 @@ class CSVRecommendationService:
             return False, error_message
 
     @staticmethod
-    def get_recommendations(product_id, num_recommendations=5):
+    def get_model_footprint():
+        """Get the byte breakdown of the loaded model and the manifest it was saved with"""
+        model = CatalogService.load(CSV_CATALOG)
+        if model is None:
+            return {"error": "CSV recommendation model not trained yet"}
+        return {
+            "footprint": model.footprint(),
+            "manifest": model.manifest,
+            "budget_bytes": int(Config.MODEL_TRAIN_BUDGET_MB * 1024 * 1024),
+            "budget_action": Config.MODEL_BUDGET_ACTION,
+        }
+
+    @staticmethod
+    def get_recommendations(product_id, num_recommendations=5, fields=None, filters=None):
         """Generate recommendations for a given product"""
-        global csv_tfidf_matrix, csv_items_df
+        model = CSVRecommendationService.load_model()
+        if isinstance(model, dict):
+            return model
+        return CatalogService.get_recommendations(CSV_CATALOG, product_id, num_recommendations, fields, filters)
 
-        if csv_tfidf_matrix is None or csv_items_df is None:
-            if not CSVRecommendationService.load_models():
-                success, message = CSVRecommendationService.train_model()
-                if not success:
-                    return {"error": message}
+    @staticmethod
+    def get_keyword_recommendations(keywords, num_recommendations=5, fields=None, filters=None):
+        """Generate recommendations based on keywords"""
+        model = CSVRecommendationService.load_model()
+        if isinstance(model, dict):
+            return model
+        return CatalogService.get_keyword_recommendations(
+            CSV_CATALOG, keywords, num_recommendations, fields, filters
+        )
 
-        # Find the index of the product in the dataframe
-        try:
-            product_id = int(product_id)  # Ensure product_id is an integer
-            idx = csv_items_df[csv_items_df['id'] == product_id].index[0]
-        except (IndexError, KeyError, ValueError):
-            return {"error": f"Product with ID {product_id} not found in CSV data"}
+    @staticmethod
+    def warm_cache(product_ids=None, keywords=None):
+        """
+        Precompute the recommendations of the most requested products and
+        keyword queries in the background.
 
-        # Calculate cosine similarity between the product and all other products
-        sim_scores = cosine_similarity(csv_tfidf_matrix[idx], csv_tfidf_matrix).flatten()
+        Args:
+            product_ids (list): Products to warm first with the default
+                request options (WARMUP_PRODUCT_IDS when None)
+            keywords (list): Keyword queries to warm first (WARMUP_KEYWORDS when None)
 
-        # Get indices of top similar products (excluding the product itself)
-        sim_indices = sim_scores.argsort()[::-1]
-        sim_indices = sim_indices[sim_indices != idx][:num_recommendations]
+        Returns:
+            int: Number of keys queued for the warm-up
+        """
+        return CatalogService.warm_cache(CSV_CATALOG, product_ids, keywords)
 
-        # Get the products with similarity scores
-        recommended_products = []
-        for i, idx in enumerate(sim_indices):
-            product = csv_items_df.iloc[idx].to_dict()
-            product['similarity_score'] = float(sim_scores[idx])
+    @staticmethod
+    def suggest(prefix, limit=10):
+        """
+        Complete a search prefix from the model vocabulary and product names.
 
-            # Remove content field as it's not needed in the response
-            if 'content' in product:
-                del product['content']
+        Products upserted since the last fold are suggested once folded.
 
-            recommended_products.append(product)
+        Args:
+            prefix (str): Text typed so far
+            limit (int): Suggestions of each kind
 
-        return recommended_products
+        Returns:
+            dict: Matching terms with their document frequency and matching products
+        """
+        model = CatalogService.load(CSV_CATALOG)
+        if model is None:
+            return {"error": "CSV recommendation model not trained yet"}
+        return {"prefix": prefix, **model.suggest(prefix, limit)}
 
     @staticmethod
-    def get_keyword_recommendations(keywords, num_recommendations=5):
-        """Generate recommendations based on keywords"""
-        global csv_tfidf_vectorizer, csv_tfidf_matrix, csv_items_df
-
-        if csv_tfidf_vectorizer is None or csv_tfidf_matrix is None or csv_items_df is None:
-            if not CSVRecommendationService.load_models():
-                success, message = CSVRecommendationService.train_model()
-                if not success:
-                    return {"error": message}
+    def get_cache_stats():
+        """Get the hit rate and size of the recommendation caches"""
+        return CatalogService.get_cache_stats(CSV_CATALOG)
 
+    @staticmethod
+    def upsert_products(products):
+        """Add or replace products in the CSV model without retraining"""
         try:
-            # Transform keywords to TF-IDF vector
-            keywords_vector = csv_tfidf_vectorizer.transform([keywords])
-
-            # Calculate cosine similarity between keywords and all products
-            sim_scores = cosine_similarity(keywords_vector, csv_tfidf_matrix).flatten()
-
-            # Get indices of top similar products
-            sim_indices = sim_scores.argsort()[::-1][:num_recommendations]
-
-            # Get the products with similarity scores
-            recommended_products = []
-            for i, idx in enumerate(sim_indices):
-                product = csv_items_df.iloc[idx].to_dict()
-                product['similarity_score'] = float(sim_scores[idx])
-
-                # Remove content field as it's not needed in the response
-                if 'content' in product:
-                    del product['content']
+            products = normalize_products(products)
+
+            size = CatalogService.upsert_products(CSV_CATALOG, products, prepare_products)
+            if size is None:
+                return False, "CSV recommendation model not trained yet"
+            return True, f"{len(products)} product(s) upserted, {size} product(s) waiting to be folded"
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            error_message = f"Error upserting products: {str(e)}"
+            print(error_message)
+            return False, error_message
 
-                recommended_products.append(product)
+    @staticmethod
+    def delete_product(product_id):
+        """Remove a product from the CSV model without retraining"""
+        try:
+            deleted = CatalogService.delete_product(CSV_CATALOG, product_id)
+            if deleted is None:
+                return False, "CSV recommendation model not trained yet"
+            if not deleted:
+                return False, f"Product with ID {product_id} not found in CSV data"
+            return True, f"Product with ID {product_id} deleted"
+        except Exception as e:
+            error_message = f"Error deleting product: {str(e)}"
+            print(error_message)
+            return False, error_message
 
-            return recommended_products
+    @staticmethod
+    def fold_delta():
+        """Merge upserted and deleted products into the main CSV model"""
+        try:
+            if not CatalogService.fold_delta(CSV_CATALOG):
+                return False, "CSV recommendation model not trained yet"
+            return True, "Product changes folded into the CSV recommendation model"
         except Exception as e:
-            error_message = f"Error generating keyword recommendations: {str(e)}"
+            error_message = f"Error folding product changes: {str(e)}"
             print(error_message)
-            return {"error": error_message}
+            return False, error_message
 
     @staticmethod
-    def get_all_products():
+    def get_all_products(fields=None):
         """Get all products from CSV data"""
-        global csv_items_df
-
-        if csv_items_df is None:
-            if not CSVRecommendationService.load_models():
-                success, message = CSVRecommendationService.train_model()
-                if not success:
-                    return {"error": message}
+        model = CSVRecommendationService.load_model()
+        if isinstance(model, dict):
+            return model
 
         try:
-            products = csv_items_df.to_dict(orient="records")
+            project = make_projection(fields)
+            records, _ = model.served_records()
+            return [project(record) for record in records]
+        except Exception as e:
+            error_message = f"Error getting all products: {str(e)}"
+            print(error_message)
+            return {"error": error_message}
 
-            # Remove content field as it's not needed in the response
-            for product in products:
-                if 'content' in product:
-                    del product['content']
+    @staticmethod
+    def get_products_page(offset=0, limit=100, fields=None):
+        """
+        Get one page of products from CSV data.
+
+        Args:
+            offset (int): Row position of the first product
+            limit (int): Maximum number of products to return
+            fields (tuple): Fields to return, None returns every field
+
+        Returns:
+            dict: Products of the page, total product count and version of the product list
+        """
+        model = CSVRecommendationService.load_model()
+        if isinstance(model, dict):
+            return model
 
-            return products
+        try:
+            project = make_projection(fields)
+            records, version = model.served_records()
+            return {
+                "data": [project(record) for record in records[offset:offset + limit]],
+                "total": len(records),
+                "version": version,
+            }
         except Exception as e:
-            error_message = f"Error getting all products: {str(e)}"
+            error_message = f"Error getting products: {str(e)}"
             print(error_message)
             return {"error": error_message}
+
+    @staticmethod
+    def iter_products(fields=None):
+        """
+        Get a generator over all products from CSV data.
+
+        Returns:
+            tuple: (generator of projected products, version of the product list), or an error dict
+        """
+        model = CSVRecommendationService.load_model()
+        if isinstance(model, dict):
+            return model
+
+        # Keep the records served now, so a retrain or a product update does not change the stream
+        records, version = model.served_records()
+        project = make_projection(fields)
+        return (project(record) for record in records), version
+
+    @staticmethod
+    def get_model_version():
+        """Get the version of the products served by the CSV model, it changes with every product update"""
+        model = CatalogService.load(CSV_CATALOG)
+        return model.served_records()[1] if model is not None else None
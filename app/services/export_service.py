@@ -0,0 +1,243 @@
+import io
+import json
+import os
+import re
+from sqlalchemy import bindparam, text
+from app.config import Config
+from app.models.database import engine
+from app.services.catalog_service import DB_CATALOG, CatalogService
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only Parquet exports need it
+    pa = pq = None
+
+EXPORT_COLUMNS = ["productId", "rank", "recommendedProductId", "score"]
+
+
+class CsvExportWriter:
+    """Write the neighbors to one CSV file, appending a chunk at a time"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def start(self, checkpoint):
+        if checkpoint:
+            # Drop anything written after the last finished chunk
+            self._file = open(self.path, "r+b")
+            self._file.truncate(checkpoint["offset"])
+            self._file.seek(checkpoint["offset"])
+        else:
+            self._file = open(self.path, "wb")
+            self._file.write((",".join(EXPORT_COLUMNS) + "\n").encode())
+
+    def write(self, product_ids, rows):
+        self._file.write("".join(
+            f"{product_id},{rank},{neighbor_id},{score:.6g}\n" for product_id, rank, neighbor_id, score in rows
+        ).encode())
+        self._file.flush()
+
+    def checkpoint(self):
+        return {"offset": self._file.tell()}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetExportWriter:
+    """Write the neighbors to a directory of Parquet files, one per chunk (part-00000.parquet, ...)"""
+
+    def __init__(self, directory):
+        if pa is None:
+            raise RuntimeError("Parquet exports need pyarrow: pip install pyarrow")
+        self.directory = directory
+        self.schema = pa.schema([
+            ("productId", pa.int64()), ("rank", pa.int16()),
+            ("recommendedProductId", pa.int64()), ("score", pa.float32()),
+        ])
+        self.parts = 0
+
+    def _part_path(self, part):
+        return os.path.join(self.directory, f"part-{part:05d}.parquet")
+
+    def start(self, checkpoint):
+        os.makedirs(self.directory, exist_ok=True)
+        self.parts = checkpoint["parts"] if checkpoint else 0
+        # Parts past the checkpoint belong to an unfinished or earlier run
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r"part-(\d+)\.parquet(\.tmp)?", name)
+            if match and (match.group(2) or int(match.group(1)) >= self.parts):
+                os.remove(os.path.join(self.directory, name))
+
+    def write(self, product_ids, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema
+        )
+        path = self._part_path(self.parts)
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self.parts += 1
+
+    def checkpoint(self):
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+class TableExportWriter:
+    """
+    Write the neighbors to a database table with batched inserts, or COPY on
+    PostgreSQL with psycopg2.
+
+    Each chunk replaces the rows of its products in one transaction, so a
+    chunk that is written again on resume leaves no duplicates.
+    """
+
+    def __init__(self, table_name="ProductRecommendation", batch_size=None):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table_name):
+            raise ValueError(f"Invalid table name: {table_name}")
+        self.table_name = table_name
+        self.batch_size = batch_size or Config.EXPORT_INSERT_BATCH_SIZE
+        self.use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+    def start(self, checkpoint):
+        with engine.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS "{self.table_name}" (
+                    "productId" INTEGER NOT NULL,
+                    "rank" INTEGER NOT NULL,
+                    "recommendedProductId" INTEGER NOT NULL,
+                    "score" REAL NOT NULL,
+                    PRIMARY KEY ("productId", "rank")
+                )
+            """))
+            if not checkpoint:
+                connection.execute(text(f'DELETE FROM "{self.table_name}"'))
+
+    def _copy(self, connection, rows):
+        buffer = io.StringIO("".join(
+            f"{product_id},{rank},{neighbor_id},{score:.6g}\n" for product_id, rank, neighbor_id, score in rows
+        ))
+        columns = ", ".join(f'"{column}"' for column in EXPORT_COLUMNS)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY "{self.table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+
+    def write(self, product_ids, rows):
+        if not product_ids:
+            return
+        delete = text(f'DELETE FROM "{self.table_name}" WHERE "productId" IN :product_ids').bindparams(
+            bindparam("product_ids", expanding=True)
+        )
+        insert = text(
+            f'INSERT INTO "{self.table_name}" ("productId", "rank", "recommendedProductId", "score") '
+            f'VALUES (:product_id, :rank, :neighbor_id, :score)'
+        )
+        with engine.begin() as connection:
+            connection.execute(delete, {"product_ids": product_ids})
+            if self.use_copy:
+                self._copy(connection, rows)
+                return
+            for start in range(0, len(rows), self.batch_size):
+                connection.execute(insert, [
+                    {"product_id": product_id, "rank": rank, "neighbor_id": neighbor_id, "score": score}
+                    for product_id, rank, neighbor_id, score in rows[start:start + self.batch_size]
+                ])
+
+    def checkpoint(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_checkpoint(path, checkpoint):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class ExportService:
+    """Materialize every product's top neighbors for bulk consumers"""
+
+    @staticmethod
+    def export_recommendations(writer, checkpoint_path, num_neighbors=None, chunk_size=None, resume=True):
+        """
+        Export the top neighbors of every product of the database model.
+
+        Progress is saved to a checkpoint after every chunk. A run with the
+        same checkpoint continues after the last finished chunk, unless the
+        model, its live product changes or the number of neighbors changed
+        since.
+
+        Args:
+            writer: CsvExportWriter, ParquetExportWriter or TableExportWriter
+            checkpoint_path (str): JSON file recording the progress
+            num_neighbors (int): Neighbors per product (EXPORT_TOP_K when None)
+            chunk_size (int): Products scored at a time (EXPORT_CHUNK_SIZE when None)
+            resume (bool): False starts over even if a checkpoint exists
+
+        Returns:
+            tuple: (success, message)
+        """
+        num_neighbors = num_neighbors or Config.EXPORT_TOP_K
+        chunk_size = chunk_size or Config.EXPORT_CHUNK_SIZE
+
+        # Keep a reference to this model so a retrain does not change the export
+        model = CatalogService.load(DB_CATALOG)
+        if model is None:
+            return False, "Recommendation model not trained yet"
+
+        # Rank every chunk with the same deletes, and resume only with those deletes
+        delta = model.delta_index.state
+        version = model.version
+        delta_generation = None if delta.is_empty else delta.tag
+        checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+        if checkpoint and (checkpoint.get("model_version") != version
+                           or checkpoint.get("delta_generation") != delta_generation
+                           or checkpoint.get("num_neighbors") != num_neighbors):
+            print("Export checkpoint belongs to another model, delta or number of neighbors, starting over")
+            checkpoint = None
+        if checkpoint and checkpoint.get("complete"):
+            return True, f"Export already complete ({checkpoint['products']} products)"
+
+        products = checkpoint["products"] if checkpoint else 0
+        start_row = checkpoint["next_row"] if checkpoint else 0
+        if checkpoint:
+            print(f"Resuming export at model row {start_row}")
+
+        writer.start(checkpoint)
+        try:
+            state = {
+                "model_version": version, "delta_generation": delta_generation,
+                "num_neighbors": num_neighbors, "next_row": start_row,
+            }
+            for next_row, product_ids, rows in model.iter_neighbors(num_neighbors, start_row, chunk_size, delta):
+                writer.write(product_ids, rows)
+                products += len(product_ids)
+                state.update(writer.checkpoint(), next_row=next_row, products=products)
+                _save_checkpoint(checkpoint_path, state)
+
+            state.update(writer.checkpoint(), products=products, complete=True)
+            _save_checkpoint(checkpoint_path, state)
+        finally:
+            writer.close()
+
+        return True, f"Exported {num_neighbors} neighbors for {products} products"
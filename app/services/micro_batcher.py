@@ -0,0 +1,115 @@
+import threading
+
+
+class _PendingCall:
+    """A call waiting for its batch to be computed"""
+
+    __slots__ = ("key", "result", "error", "done")
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Collect concurrent calls and run them as one batch.
+
+    The first caller of a batch becomes its leader. When no other batch is
+    being computed the leader runs right away, so a lone request pays no extra
+    latency. Under load the leader waits up to ``window_ms`` (or until
+    ``max_batch_size`` calls are queued) for other callers to join, runs
+    ``batch_fn`` once for all of them and hands each caller its own result.
+    """
+
+    def __init__(self, batch_fn, window_ms=2, max_batch_size=32):
+        """
+        Args:
+            batch_fn (callable): Takes a list of keys, returns a list of results in the same order
+            window_ms (float): Maximum time a leader waits for other callers
+            max_batch_size (int): Batch size that triggers an early run
+        """
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._batch_full = threading.Condition(self._lock)
+        self._pending = []
+        self._collecting = False
+        self._running = 0
+
+    def submit(self, key):
+        """Run a single call through the batcher and return its result"""
+        call = _PendingCall(key)
+
+        with self._lock:
+            self._pending.append(call)
+
+            if self._collecting:
+                # A leader is collecting this batch, wake it up early once it is full
+                if len(self._pending) >= self.max_batch_size:
+                    self._batch_full.notify()
+                batch = None
+            else:
+                self._collecting = True
+                if self._running:
+                    self._batch_full.wait_for(
+                        lambda: len(self._pending) >= self.max_batch_size, timeout=self.window
+                    )
+                batch, self._pending = self._pending, []
+                self._collecting = False
+                self._running += 1
+
+        if batch is not None:
+            try:
+                self._run(batch)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, batch):
+        try:
+            results = self.batch_fn([call.key for call in batch])
+            for call, result in zip(batch, results):
+                call.result = result
+        except Exception as e:
+            for call in batch:
+                call.error = e
+        finally:
+            for call in batch:
+                call.done.set()
+
+
+def recommendation_batch_fn(recommend_batch):
+    """
+    Adapt a ``recommend_batch(product_ids, num_recommendations, *options)``
+    function to ``(product_id, num_recommendations, *options)`` keys, where
+    options are hashable (e.g. fields and filters).
+
+    Calls with the same options are scored together with the largest
+    requested size, and each result is cut down to the size its caller asked for.
+    """
+    def batch_fn(keys):
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(tuple(key[2:]), []).append(position)
+
+        results = [None] * len(keys)
+        for options, positions in groups.items():
+            num_recommendations = max(keys[position][1] for position in positions)
+            product_ids = [keys[position][0] for position in positions]
+            group_results = recommend_batch(product_ids, num_recommendations, *options)
+            for position, result in zip(positions, group_results):
+                num = keys[position][1]
+                results[position] = result[:num] if isinstance(result, list) else result
+
+        return results
+
+    return batch_fn
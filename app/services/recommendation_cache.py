@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class RecommendationCache:
+    """
+    LRU cache of recommendation results for the served model.
+
+    Entries belong to a model generation: a number that increases whenever
+    the served results can change (a model swap or a live product update).
+    A lookup with a newer generation empties the cache, so results of an
+    older model are never served; a lookup or result from an older
+    generation (a request that started before the change) is a miss.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        Args:
+            max_entries (int): Results kept, 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+
+    def _use_generation(self, generation):
+        """
+        Drop the entries of an older generation (lock held).
+
+        Returns:
+            bool: False if the generation is older than the cached one
+        """
+        if self._generation is None or generation > self._generation:
+            self._entries.clear()
+            self._generation = generation
+        return generation == self._generation
+
+    def get(self, generation, key):
+        """Get a cached result, None on a miss"""
+        if not self.max_entries:
+            return None
+        with self._lock:
+            result = self._entries.get(key) if self._use_generation(generation) else None
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, generation, key, result, warm=False):
+        """
+        Cache a result computed with a generation of the model.
+
+        Returns:
+            bool: False if the model has changed since (the result is dropped)
+        """
+        if not self.max_entries or (isinstance(result, dict) and "error" in result):
+            return True
+        with self._lock:
+            if not self._use_generation(generation):
+                return False
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.warmed += warm
+            return True
+
+    def use_generation(self, generation):
+        """Switch to the generation of a newly served model"""
+        with self._lock:
+            self._use_generation(generation)
+
+    def install(self, staged):
+        """
+        Take over the entries of a cache warmed for a model before it was
+        served, unless a newer generation is already cached.
+
+        Returns:
+            bool: False if the staged entries are outdated (they are dropped)
+        """
+        with staged._lock:
+            generation, entries = staged._generation, OrderedDict(staged._entries)
+        if generation is None:
+            return False
+        with self._lock:
+            if not self._use_generation(generation):
+                return False
+            self._entries.update(entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.warmed += len(entries)
+            return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "warmed": self.warmed,
+            }
+
+
+def _as_key(value):
+    """Turn a key read back from JSON into the tuple it was recorded as"""
+    if isinstance(value, list):
+        return tuple(_as_key(item) for item in value)
+    return value
+
+
+class HitCounter:
+    """
+    Request counts per cache key, persisted to a JSON file so the hot keys
+    survive restarts and retrains. Periodic saves run in a background thread,
+    off the request path.
+    """
+
+    def __init__(self, path, max_keys=10000, save_every=1000):
+        """
+        Args:
+            path (str): JSON file the counts are loaded from and saved to
+            max_keys (int): Keys kept; the least requested are dropped beyond it
+            save_every (int): Requests recorded between saves
+        """
+        self.path = path
+        self.max_keys = max_keys
+        self.save_every = save_every
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._save_requested = threading.Event()
+        self._saver = None
+        self.load()
+
+    def record(self, key):
+        with self._lock:
+            self._counts[key] += 1
+            self._unsaved += 1
+            if len(self._counts) > 2 * self.max_keys:
+                self._counts = Counter(dict(self._counts.most_common(self.max_keys)))
+            if self.save_every and self._unsaved >= self.save_every:
+                self._request_save()
+
+    def _request_save(self):
+        """Wake the saver thread, starting it on first use (lock held)"""
+        if self._saver is None:
+            self._saver = threading.Thread(
+                target=self._save_loop, name=f"hit-counter-{os.path.basename(self.path)}", daemon=True
+            )
+            self._saver.start()
+        self._save_requested.set()
+
+    def _save_loop(self):
+        while True:
+            self._save_requested.wait()
+            self._save_requested.clear()
+            self.save()
+
+    def most_common(self, n):
+        """Get the n most requested keys"""
+        with self._lock:
+            return [key for key, _ in self._counts.most_common(n)]
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                counts = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        with self._lock:
+            for key, count in counts:
+                self._counts[_as_key(key)] += count
+
+    def save(self):
+        with self._lock:
+            counts = self._counts.most_common(self.max_keys)
+            self._unsaved = 0
+        try:
+            # Write a new file and swap it in, so readers never see half a file
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump([[list(key), count] for key, count in counts], f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving request counts: {str(e)}")
+
+
+def warm_up_keys(values, hits, num_recommendations, top_n):
+    """
+    Keys to warm: the supplied products or queries with the default request
+    options first, then the most requested keys.
+
+    Args:
+        values (list): Product IDs or keyword queries
+        hits (HitCounter): Request counts, saved so they survive a restart
+        num_recommendations (int): Recommendations per supplied value
+        top_n (int): Most requested keys to add
+
+    Returns:
+        list: (value, num_recommendations, fields, filters) keys
+    """
+    keys = [(str(value).strip(), num_recommendations, None, None) for value in values if str(value).strip()]
+    supplied = set(keys)
+    keys += [key for key in hits.most_common(top_n) if key not in supplied]
+    hits.save()
+    return keys
+
+
+def warm_cache(cache, generation_fn, key_groups, max_seconds=30, cpu_share=0.5, batch_size=64):
+    """
+    Precompute recommendations for hot keys into the cache.
+
+    Args:
+        cache (RecommendationCache): Cache to fill
+        generation_fn (callable): Returns the model generation; warming
+            stops when it changes (a newer model will be warmed on its own)
+        key_groups (list): (keys, score_batch) pairs, where score_batch takes
+            a list of keys and returns their results through the batch
+            scoring path
+        max_seconds (float): Time budget of the warm-up
+        cpu_share (float): Share of one CPU the warm-up may use; it sleeps
+            between batches for the rest
+        batch_size (int): Keys scored per batch
+
+    Returns:
+        int: Number of results cached
+    """
+    generation = generation_fn()
+    if generation is None:
+        return 0
+    cache.use_generation(generation)
+    deadline = time.monotonic() + max_seconds
+    warmed = 0
+
+    for keys, score_batch in key_groups:
+        for start in range(0, len(keys), batch_size):
+            if time.monotonic() >= deadline or generation_fn() != generation:
+                return warmed
+
+            batch = keys[start:start + batch_size]
+            started = time.monotonic()
+            for key, result in zip(batch, score_batch(batch)):
+                if not cache.put(generation, key, result, warm=True):
+                    return warmed
+                warmed += 1
+
+            if 0 < cpu_share < 1:
+                time.sleep((time.monotonic() - started) * (1 - cpu_share) / cpu_share)
+
+    return warmed
+
+
+def start_warm_up(name, cache, generation_fn, key_groups, max_seconds, cpu_share, batch_size):
+    """Warm a cache in a background thread"""
+    def run():
+        try:
+            start = time.perf_counter()
+            warmed = warm_cache(cache, generation_fn, key_groups, max_seconds, cpu_share, batch_size)
+            print(f"Cache warm-up ({name}): {warmed} results in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"Error warming {name} cache: {str(e)}")
+
+    thread = threading.Thread(target=run, name=f"warm-up-{name}", daemon=True)
+    thread.start()
+    return thread
@@ -1,5 +1,10 @@
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import Config
 from app.models.recommendation.content_based import ContentBasedRecommender
-from app.models.database import get_all_products, get_product_by_id, get_products_by_category, get_products_by_group
+from app.models.recommendation.delta_index import normalize_products
+from app.models.database import iter_product_chunks, get_product_by_id, get_products_by_category, get_products_by_group
+from app.services.admission import DeadlineExceeded, check_deadline
+from app.services.catalog_service import DB_CATALOG, CatalogService, model_registry
 
 
 class RecommendationService:
@@ -9,21 +14,21 @@ class RecommendationService:
     def train_content_based_model():
         """Train content-based recommendation model with product data from database"""
         try:
-            # Fetch all products from database
-            products = get_all_products()
-
-            if not products:
+            # Stream products from the database in chunks
+            fitted = ContentBasedRecommender.fit_chunks(iter_product_chunks())
+            if fitted is None:
                 return False, "No products found in database"
 
-            success = ContentBasedRecommender.train(products)
-            return success, "Content-based recommendation model trained successfully" if success else "Failed to train model"
+            # Keep the loaded model if the new one does not fit in the budget
+            CatalogService.publish(DB_CATALOG, model_registry.source(DB_CATALOG).train(*fitted))
+            return True, "Content-based recommendation model trained successfully"
         except Exception as e:
             error_message = f"Error training recommendation model: {str(e)}"
             print(error_message)
             return False, error_message
 
     @staticmethod
-    def get_content_based_recommendations(product_id, num_recommendations=5):
+    def get_content_based_recommendations(product_id, num_recommendations=5, fields=None, filters=None):
         """Get content-based recommendations for a product"""
         try:
             # Check if product exists in database
@@ -31,92 +36,155 @@ class RecommendationService:
             if not product:
                 return {"error": f"Product with ID {product_id} not found in database"}
 
-            recommendations = ContentBasedRecommender.recommend(product_id, num_recommendations)
-            return recommendations
+            return RecommendationService.score_product(product_id, num_recommendations, fields, filters)
+        except SQLAlchemyError:
+            # Database failures are server errors, not missing products
+            raise
         except Exception as e:
             error_message = f"Error getting recommendations: {str(e)}"
             print(error_message)
             return {"error": error_message}
 
     @staticmethod
-    def get_category_recommendations(category_id, num_recommendations=5):
-        """Get recommendations for products in a specific category"""
-        try:
-            # Get products in the category
-            category_products = get_products_by_category(category_id)
-
-            if not category_products:
-                return {"error": f"No products found in category ID {category_id}"}
-
-            # Train model if not already trained
-            if not ContentBasedRecommender.load_models():
-                success, _ = RecommendationService.train_content_based_model()
-                if not success:
-                    return {"error": "Failed to train recommendation model"}
+    def score_product(product_id, num_recommendations=5, fields=None, filters=None):
+        """Score a product known to exist against the model (CPU-bound, no database access)"""
+        if CatalogService.load(DB_CATALOG) is None:
+            return {"error": "Recommendation model not trained yet"}
+        return CatalogService.get_recommendations(DB_CATALOG, product_id, num_recommendations, fields, filters)
 
-            # Get recommendations for each product in the category
-            all_recommendations = []
-            seen_products = set()
+    @staticmethod
+    def warm_cache(product_ids=None):
+        """
+        Precompute the recommendations of the most requested products in the background.
 
-            for product in category_products:
-                product_id = product['id']
-                recommendations = ContentBasedRecommender.recommend(product_id, num_recommendations)
+        Args:
+            product_ids (list): Products to warm first with the default
+                request options (WARMUP_PRODUCT_IDS when None)
 
-                if isinstance(recommendations, list):
-                    for rec in recommendations:
-                        rec_id = rec['id']
-                        if rec_id not in seen_products:
-                            seen_products.add(rec_id)
-                            all_recommendations.append(rec)
+        Returns:
+            int: Number of keys queued for the warm-up
+        """
+        return CatalogService.warm_cache(DB_CATALOG, product_ids, keywords=[])
 
-            # Sort by similarity score and take top N
-            all_recommendations.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-            return all_recommendations[:num_recommendations]
+    @staticmethod
+    def get_cache_stats():
+        """Get the hit rate and size of the recommendation cache"""
+        return CatalogService.get_cache_stats(DB_CATALOG)["recommend"]
 
+    @staticmethod
+    def get_category_recommendations(category_id, num_recommendations=5, fields=None):
+        """Get recommendations for products in a specific category"""
+        try:
+            return RecommendationService._get_member_recommendations(
+                "category", category_id, num_recommendations, fields
+            )
+        except (SQLAlchemyError, DeadlineExceeded):
+            # Database failures and shed requests are not missing products
+            raise
         except Exception as e:
             error_message = f"Error getting category recommendations: {str(e)}"
             print(error_message)
             return {"error": error_message}
 
     @staticmethod
-    def get_group_recommendations(group_id, num_recommendations=5):
+    def get_group_recommendations(group_id, num_recommendations=5, fields=None):
         """Get recommendations for products in a specific group"""
         try:
-            # Get products in the group
-            group_products = get_products_by_group(group_id)
-
-            if not group_products:
-                return {"error": f"No products found in group ID {group_id}"}
-
-            # Train model if not already trained
-            if not ContentBasedRecommender.load_models():
-                success, _ = RecommendationService.train_content_based_model()
-                if not success:
-                    return {"error": "Failed to train recommendation model"}
-
-            # Get recommendations for each product in the group
-            all_recommendations = []
-            seen_products = set()
+            return RecommendationService._get_member_recommendations(
+                "group", group_id, num_recommendations, fields
+            )
+        except (SQLAlchemyError, DeadlineExceeded):
+            # Database failures and shed requests are not missing products
+            raise
+        except Exception as e:
+            error_message = f"Error getting group recommendations: {str(e)}"
+            print(error_message)
+            return {"error": error_message}
 
-            for product in group_products:
-                product_id = product['id']
-                recommendations = ContentBasedRecommender.recommend(product_id, num_recommendations)
+    @staticmethod
+    def _get_member_recommendations(kind, key, num_recommendations, fields):
+        """Get merged recommendations for the products of a category or group"""
+        # Train model if not already trained
+        model = CatalogService.load(DB_CATALOG)
+        if model is None:
+            success, _ = RecommendationService.train_content_based_model()
+            if not success:
+                return {"error": "Failed to train recommendation model"}
+            model = CatalogService.load(DB_CATALOG)
+
+        member_rows = model.member_rows(kind, key)
+        if member_rows is None:
+            # Model trained before the membership index, look the members up in the database
+            fetch_members = get_products_by_category if kind == "category" else get_products_by_group
+            check_deadline()
+            member_rows = model.lookup_rows(
+                [product['id'] for product in fetch_members(key) or []]
+            )
+
+        if len(member_rows) == 0:
+            return {"error": f"No products found in {kind} ID {key}"}
+
+        # Stop scoring a large category once its request can no longer finish in time
+        return model.recommend_for_rows(
+            member_rows, num_recommendations, fields, before_chunk=check_deadline
+        )
 
-                if isinstance(recommendations, list):
-                    for rec in recommendations:
-                        rec_id = rec['id']
-                        if rec_id not in seen_products:
-                            seen_products.add(rec_id)
-                            all_recommendations.append(rec)
+    @staticmethod
+    def upsert_products(products):
+        """Add or replace products in the recommendation model without retraining"""
+        try:
+            products = normalize_products(products)
+
+            size = CatalogService.upsert_products(DB_CATALOG, products, ContentBasedRecommender.prepare_products)
+            if size is None:
+                return False, "Recommendation model not trained yet"
+            return True, f"{len(products)} product(s) upserted, {size} product(s) waiting to be folded"
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            error_message = f"Error upserting products: {str(e)}"
+            print(error_message)
+            return False, error_message
 
-            # Sort by similarity score and take top N
-            all_recommendations.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-            return all_recommendations[:num_recommendations]
+    @staticmethod
+    def delete_product(product_id):
+        """Remove a product from the recommendation model without retraining"""
+        try:
+            deleted = CatalogService.delete_product(DB_CATALOG, product_id)
+            if deleted is None:
+                return False, "Recommendation model not trained yet"
+            if not deleted:
+                return False, f"Product with ID {product_id} not found"
+            return True, f"Product with ID {product_id} deleted"
+        except Exception as e:
+            error_message = f"Error deleting product: {str(e)}"
+            print(error_message)
+            return False, error_message
 
+    @staticmethod
+    def fold_delta():
+        """Merge upserted and deleted products into the main recommendation model"""
+        try:
+            if not CatalogService.fold_delta(DB_CATALOG):
+                return False, "Recommendation model not trained yet"
+            return True, "Product changes folded into the recommendation model"
         except Exception as e:
-            error_message = f"Error getting group recommendations: {str(e)}"
+            error_message = f"Error folding product changes: {str(e)}"
             print(error_message)
-            return {"error": error_message}
+            return False, error_message
+
+    @staticmethod
+    def get_model_footprint():
+        """Get the memory footprint of the recommendation model"""
+        model = CatalogService.load(DB_CATALOG)
+        if model is None:
+            return {"error": "Recommendation model not trained yet"}
+        return {
+            "footprint": model.footprint(),
+            "manifest": model.manifest,
+            "budget_bytes": int(Config.MODEL_TRAIN_BUDGET_MB * 1024 * 1024),
+            "budget_action": Config.MODEL_BUDGET_ACTION,
+        }
 
     @staticmethod
     def refresh_recommendation_model():
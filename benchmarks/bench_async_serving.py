@@ -0,0 +1,127 @@
+"""
+Compare the threaded Flask server with the ASGI serving mode under concurrency.
+
+Builds a SQLite stand-in for the product database (see benchmarks.fixtures),
+starts ``run.py``'s Flask app with the threaded development server and
+``app.asgi`` with uvicorn (aiosqlite as the async driver), and sends
+``/api/recommend`` requests for random products at each concurrency level.
+Reports throughput and latency percentiles per server. Models are trained
+into a temporary MODEL_DIR, so the committed model files are not touched.
+
+Needs the packages in requirements-async.txt.
+
+Usage:
+    python -m benchmarks.bench_async_serving [--concurrency 8 64 256] [--requests 2000] [--scale 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+from benchmarks.fixtures import build_sqlite_catalog
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "flask": lambda port: [
+        sys.executable, "-c",
+        f"from app import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)",
+    ],
+    "asgi": lambda port: [
+        sys.executable, "-m", "uvicorn", "app.asgi:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        # Busy clients may take longer than the default 5s to reuse a connection
+        "--timeout-keep-alive", "60",
+    ],
+}
+
+
+def start_server(name, port, env, timeout=300):
+    """Start a server and wait until it answers (it trains the model on startup)"""
+    process = subprocess.Popen(
+        SERVERS[name](port), cwd=REPO_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/debug/pool", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{name} server did not start within {timeout}s")
+
+
+async def load(base_url, concurrency, num_requests, product_ids):
+    """Send requests from N concurrent clients and return (throughput, p50 ms, p99 ms, errors)"""
+    latencies, errors = [], 0
+    remaining = iter(range(num_requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            rng = random.Random()
+            while next(remaining, None) is not None:
+                start = time.perf_counter()
+                response = await client.get(
+                    "/api/recommend", params={"product_id": rng.choice(product_ids), "num": 10, "fields": "id"}
+                )
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return num_requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--scale", type=int, default=5, help="Copies of the CSV dataset in the database")
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--port", type=int, default=6100)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    db_path = os.path.join(work_dir, "products.db")
+    num_products = build_sqlite_catalog(db_path, args.scale)
+    env = dict(
+        os.environ,
+        DB_URL=f"sqlite:///{db_path}",
+        MODEL_DIR=os.path.join(work_dir, "models"),
+        PYTHONPATH=REPO_DIR,
+    )
+    product_ids = list(range(1, num_products + 1))
+
+    print(f"{num_products} products, {args.requests} requests per level")
+    print(f"{'server':<8}{'clients':>9}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for offset, name in enumerate(args.servers):
+        port = args.port + offset
+        process = start_server(name, port, env)
+        try:
+            for concurrency in args.concurrency:
+                throughput, p50, p99, errors = asyncio.run(
+                    load(f"http://127.0.0.1:{port}", concurrency, args.requests, product_ids)
+                )
+                print(f"{name:<8}{concurrency:>9}{throughput:>10.1f}{p50:>10.1f}{p99:>10.1f}{errors:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare loading every product into a list against streaming chunks for training.
+
+Builds a SQLite stand-in for the product database (see benchmarks.fixtures),
+then fits the content-based model twice: from ``get_all_products()`` as one
+list, and from ``iter_product_chunks()`` with the chunked trainer. Reports
+time and the Python heap peak of each, and checks that both give the same
+matrix. The trained models are not saved.
+
+Usage:
+    python -m benchmarks.bench_db_ingestion [--scale 20] [--chunk-size 1000] [--mode vocabulary]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from benchmarks.common import format_bytes
+from benchmarks.fixtures import build_sqlite_catalog
+
+
+def measure(fn):
+    """Run fn and return (seconds, traced heap peak in bytes)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="Copies of the CSV dataset in the database")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--mode", choices=["vocabulary", "hashing"], default="vocabulary")
+    args = parser.parse_args()
+
+    # The app reads its settings at import time
+    db_path = os.path.join(tempfile.mkdtemp(), "products.db")
+    os.environ["DB_URL"] = f"sqlite:///{db_path}"
+    os.environ["TFIDF_FEATURE_MODE"] = args.mode
+    num_products = build_sqlite_catalog(db_path, args.scale)
+
+    from app.models import database
+    from app.models.recommendation.content_based import ContentBasedRecommender
+
+    print(f"{num_products} products, chunks of {args.chunk_size}, {args.mode} features")
+    print(f"{'path':<10}{'seconds':>10}{'heap peak':>14}")
+
+    fitted = {}
+    list_seconds, list_peak = measure(
+        lambda: fitted.update(list=ContentBasedRecommender.fit(database.get_all_products()))
+    )
+    print(f"{'list':<10}{list_seconds:>10.2f}{format_bytes(list_peak):>14}")
+
+    stream_seconds, stream_peak = measure(
+        lambda: fitted.update(streamed=ContentBasedRecommender.fit_chunks(database.iter_product_chunks(args.chunk_size)))
+    )
+    print(f"{'streamed':<10}{stream_seconds:>10.2f}{format_bytes(stream_peak):>14}")
+
+    expected, matrix = fitted["list"][1], fitted["streamed"][1]
+    assert expected.shape == matrix.shape
+    assert np.allclose((expected - matrix).data, 0, atol=1e-6)
+
+
+if __name__ == "__main__":
+    main()
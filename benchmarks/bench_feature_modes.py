@@ -0,0 +1,70 @@
+"""
+Compare the vocabulary and hashed TF-IDF feature modes.
+
+For each mode this reports train time, persisted vectorizer size, matrix
+size and the overlap of every product's top-k recommendations with the
+vocabulary mode. ``--scale`` repeats the catalog to simulate growth.
+
+Usage:
+    python -m benchmarks.bench_feature_modes [--k 10] [--scale 1] [--n-features 262144]
+"""
+import argparse
+import pickle
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+from app.models.csv_data_loader import load_csv_data
+from app.models.recommendation.compaction import matrix_bytes
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.vectorizer import HASHING_MODE, VOCABULARY_MODE, fit_vectorizer
+from benchmarks.common import format_bytes
+
+
+def top_k(matrix, k):
+    """Get the top-k neighbors of every row, excluding the row itself"""
+    scores = cosine_similarity(matrix, dense_output=True)
+    np.fill_diagonal(scores, -1)
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def overlap(expected, actual):
+    """Mean fraction of shared neighbors between two top-k tables"""
+    shared = [len(set(a) & set(b)) / len(a) for a, b in zip(expected, actual)]
+    return float(np.mean(shared))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="app/data/product_data.csv")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--n-features", type=int, default=2 ** 18)
+    args = parser.parse_args()
+
+    df = load_csv_data(args.csv)
+    contents = pd.concat([df["content"]] * args.scale, ignore_index=True)
+    print(f"documents: {len(contents)}")
+    print(f"{'mode':<12}{'train':>10}{'peak alloc':>14}{'vectorizer':>14}{'matrix':>14}{'overlap@' + str(args.k):>12}")
+
+    neighbors = {}
+    for mode in [VOCABULARY_MODE, HASHING_MODE]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        vectorizer, matrix = fit_vectorizer(contents, TFIDF_PARAMS, mode=mode, n_features=args.n_features)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Overlap is computed on the original catalog only, duplicates would tie
+        neighbors[mode] = top_k(matrix[:len(df)], args.k)
+        print(
+            f"{mode:<12}{elapsed * 1000:>7.0f} ms{format_bytes(peak):>14}"
+            f"{format_bytes(len(pickle.dumps(vectorizer))):>14}{format_bytes(matrix_bytes(matrix)):>14}"
+            f"{overlap(neighbors[VOCABULARY_MODE], neighbors[mode]):>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measure single-product CSV recommendation calls with and without micro-batching.
+
+The recommendation cache is disabled, so every call is scored.
+
+Usage:
+    python -m benchmarks.bench_micro_batching [--concurrency 1 8 32] [--requests 2000]
+"""
+import argparse
+import random
+import threading
+import time
+import numpy as np
+from app.config import Config
+from app.services.catalog_service import CSV_CATALOG, catalog_caches
+from app.services.csv_recommendation_service import CSVRecommendationService
+
+
+def run(concurrency, num_requests, product_ids):
+    """Send requests from N threads and return (throughput, p50 ms, p99 ms)"""
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(num_requests))
+
+    def worker():
+        rng = random.Random()
+        local = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            result = CSVRecommendationService.get_recommendations(rng.choice(product_ids), 10)
+            local.append(time.perf_counter() - start)
+            assert isinstance(result, list)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return num_requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--window-ms", type=float, default=Config.MICRO_BATCH_WINDOW_MS)
+    args = parser.parse_args()
+
+    model = CSVRecommendationService.load_model()
+    product_ids = model.items_df["id"].tolist()
+    caches = catalog_caches[CSV_CATALOG]
+    caches.batcher.window = args.window_ms / 1000
+    # Every request must reach the scorer; the cache would answer the repeated ids
+    caches.recommend.max_entries = 0
+
+    print(f"{'batching':<10}{'threads':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for concurrency in args.concurrency:
+        for enabled in [False, True]:
+            Config.MICRO_BATCH_ENABLED = enabled
+            throughput, p50, p99 = run(concurrency, args.requests, product_ids)
+            print(f"{'on' if enabled else 'off':<10}{concurrency:>8}{throughput:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
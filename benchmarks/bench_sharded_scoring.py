@@ -0,0 +1,92 @@
+"""
+Measure sharded scatter-gather scoring against a single similarity pass.
+
+Scores a batch of query rows against a synthetic TF-IDF matrix with 1..N
+shards for each backend, checks that the results match the single pass, and
+prints the latency and speedup.
+
+Usage:
+    python -m benchmarks.bench_sharded_scoring [--rows 200000] [--shards 1 2 4 8] [--backends thread process]
+"""
+import argparse
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from app.models.recommendation.scoring import top_k_indices
+from app.models.recommendation.sharding import ShardedScorer
+
+
+def synthetic_matrix(num_rows, num_features, nnz_per_row, seed=0):
+    """Build a random L2-normalized float32 CSR matrix shaped like a TF-IDF model"""
+    rng = np.random.default_rng(seed)
+    # Zipf-like feature popularity, like words in product descriptions
+    popularity = 1 / np.arange(1, num_features + 1)
+    popularity /= popularity.sum()
+    indices = rng.choice(num_features, size=num_rows * nnz_per_row, p=popularity).astype(np.int32)
+    indptr = np.arange(0, num_rows * nnz_per_row + 1, nnz_per_row, dtype=np.int32)
+    data = rng.random(num_rows * nnz_per_row, dtype=np.float32)
+    matrix = sp.csr_matrix((data, indices, indptr), shape=(num_rows, num_features))
+    matrix.sum_duplicates()
+    return normalize(matrix).astype(np.float32)
+
+
+def single_pass(matrix, rows, k):
+    """The unsharded path used by the recommenders"""
+    sim_scores = cosine_similarity(matrix[rows], matrix)
+    results = []
+    for idx, scores in zip(rows, sim_scores):
+        top = top_k_indices(scores, k, exclude=idx)
+        results.append((top, scores[top]))
+    return results
+
+
+def timed(fn, repeat):
+    fn()  # Warm up (starts worker processes, attaches shared memory)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--features", type=int, default=2 ** 18)
+    parser.add_argument("--nnz", type=int, default=40, help="Stored weights per row")
+    parser.add_argument("--batch", type=int, default=8, help="Query products per call")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--shards", type=int, nargs="+")
+    parser.add_argument("--backends", nargs="+", default=["thread", "process"])
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    shard_counts = args.shards or sorted({1, *[2 ** i for i in range(1, cpus.bit_length()) if 2 ** i <= cpus], cpus})
+
+    matrix = synthetic_matrix(args.rows, args.features, args.nnz)
+    rows = np.random.default_rng(1).choice(args.rows, size=args.batch, replace=False).tolist()
+    print(f"{args.rows} rows, {matrix.nnz} weights, batch of {args.batch}, top {args.k}, {cpus} CPUs")
+
+    baseline_ms, expected = timed(lambda: single_pass(matrix, rows, args.k), args.repeat)
+    print(f"{'backend':<10}{'shards':>8}{'ms/batch':>12}{'speedup':>10}")
+    print(f"{'single':<10}{1:>8}{baseline_ms:>12.1f}{1:>10.2f}")
+
+    for backend in args.backends:
+        for num_shards in shard_counts:
+            scorer = ShardedScorer(matrix, num_shards, backend)
+            try:
+                elapsed_ms, ranked = timed(lambda: scorer.top_k(matrix[rows], args.k, rows), args.repeat)
+            finally:
+                scorer.close()
+
+            for (_, scores), (_, sharded_scores) in zip(expected, ranked):
+                # Tied rows may be picked in a different order, the scores must match
+                assert np.allclose(scores, sharded_scores)
+            print(f"{backend:<10}{num_shards:>8}{elapsed_ms:>12.1f}{baseline_ms / elapsed_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
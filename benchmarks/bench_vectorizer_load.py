@@ -0,0 +1,105 @@
+"""
+Compare the persisted sklearn TfidfVectorizer with CompactTfidfVectorizer.
+
+Usage:
+    python -m benchmarks.bench_vectorizer_load [--csv app/data/product_data.csv] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app.models.csv_data_loader import load_csv_data
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.vectorizer import CompactTfidfVectorizer
+from benchmarks.common import format_bytes
+
+# Runs in a fresh interpreter so that load time and RSS are not skewed by the parent
+# A first query is transformed too, so lookup structures built on first use are counted
+LOAD_SCRIPT = """
+import json, pickle, sys, time
+from benchmarks.common import current_rss_bytes
+import app.models.recommendation.vectorizer
+before = current_rss_bytes()
+start = time.perf_counter()
+with open(sys.argv[1], 'rb') as f:
+    vectorizer = pickle.load(f)
+elapsed = time.perf_counter() - start
+loaded_rss = current_rss_bytes() - before
+start = time.perf_counter()
+vectorizer.transform([sys.argv[2]])
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_bytes": loaded_rss,
+    "query_seconds": time.perf_counter() - start,
+    "query_rss_bytes": current_rss_bytes() - before,
+}))
+"""
+
+
+def measure_load(path, query, repeat):
+    """Load a pickled vectorizer and transform a query in a subprocess, return the best of N runs"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", LOAD_SCRIPT, path, query],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output))
+    return min(runs, key=lambda run: run["seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="app/data/product_data.csv")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = load_csv_data(args.csv)
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    vectorizer.fit(df["content"])
+    compact = CompactTfidfVectorizer.from_fitted(vectorizer)
+
+    # Both transform paths must agree before their load cost is compared
+    expected = vectorizer.transform(df["content"])
+    expected.sort_indices()
+    actual = compact.transform(df["content"])
+    assert np.array_equal(expected.indices, actual.indices)
+    assert np.array_equal(expected.indptr, actual.indptr)
+    max_error = float(np.abs(expected.data - actual.data).max())
+
+    print(f"vocabulary: {len(vectorizer.vocabulary_)} terms, stop_words_: {len(vectorizer.stop_words_)} terms")
+    print(f"max transform difference: {max_error:.2e}")
+    print(
+        f"{'vectorizer':<28}{'pickle':>12}{'load time':>14}{'load RSS':>14}"
+        f"{'1st query':>14}{'RSS after':>14}"
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, model in [("TfidfVectorizer", vectorizer), ("CompactTfidfVectorizer", compact)]:
+            path = os.path.join(tmp_dir, f"{name}.pkl")
+            with open(path, "wb") as f:
+                pickle.dump(model, f)
+            result = results[name] = measure_load(path, df["content"].iloc[0], args.repeat)
+            print(
+                f"{name:<28}{format_bytes(os.path.getsize(path)):>12}"
+                f"{result['seconds'] * 1000:>11.2f} ms{format_bytes(result['rss_bytes']):>14}"
+                f"{result['query_seconds'] * 1000:>11.2f} ms{format_bytes(result['query_rss_bytes']):>14}"
+            )
+
+    # The compact vectorizer must stay smaller in memory once it serves queries, not only on disk
+    compact_rss = results["CompactTfidfVectorizer"]["query_rss_bytes"]
+    sklearn_rss = results["TfidfVectorizer"]["query_rss_bytes"]
+    status = "OK" if compact_rss <= sklearn_rss else "FAILED"
+    print(f"RSS check: {format_bytes(compact_rss)} <= {format_bytes(sklearn_rss)} after the first query: {status}")
+    if status != "OK":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
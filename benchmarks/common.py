@@ -0,0 +1,23 @@
+import os
+import resource
+import sys
+
+
+def current_rss_bytes():
+    """Get the resident set size of the current process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (FileNotFoundError, ValueError, OSError):
+        # Peak RSS is the best we can do without procfs (bytes on macOS, KiB elsewhere)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def format_bytes(num_bytes):
+    """Format a byte count for printing"""
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GiB"
@@ -0,0 +1,112 @@
+"""
+Offline database fixtures for the benchmarks.
+
+Builds a SQLite file with the tables and columns the recommendation queries
+read (Product, GroupProduct, City, Category, _CategoryToProduct, Image),
+filled from the CSV dataset and repeated ``scale`` times. Point DB_URL at it
+before importing the app, e.g. ``DB_URL=sqlite:////tmp/products.db``.
+
+Usage:
+    python -m benchmarks.fixtures /tmp/products.db [--scale 10]
+"""
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "app", "data", "product_data.csv")
+
+SCHEMA = """
+CREATE TABLE "City" ("id" INTEGER PRIMARY KEY, "name" TEXT NOT NULL);
+CREATE TABLE "GroupProduct" ("id" INTEGER PRIMARY KEY, "name" TEXT NOT NULL);
+CREATE TABLE "Category" ("id" INTEGER PRIMARY KEY, "name" TEXT NOT NULL);
+CREATE TABLE "Product" (
+    "id" INTEGER PRIMARY KEY,
+    "name" TEXT NOT NULL,
+    "description" TEXT,
+    "price" INTEGER,
+    "star" INTEGER,
+    "quantity" INTEGER,
+    "groupProductId" INTEGER REFERENCES "GroupProduct"("id"),
+    "cityId" INTEGER REFERENCES "City"("id"),
+    "isActive" BOOLEAN NOT NULL DEFAULT 1,
+    "createdAt" TEXT,
+    "updatedAt" TEXT,
+    "deletedAt" TEXT
+);
+CREATE TABLE "_CategoryToProduct" ("A" INTEGER NOT NULL, "B" INTEGER NOT NULL);
+CREATE INDEX "_CategoryToProduct_B_index" ON "_CategoryToProduct"("B");
+CREATE TABLE "Image" ("id" INTEGER PRIMARY KEY, "productId" INTEGER NOT NULL, "publicUrl" TEXT);
+CREATE INDEX "Image_productId_index" ON "Image"("productId");
+"""
+
+
+def _ids(values):
+    """Assign a stable ID to every distinct non-empty name"""
+    names = {value for value in values if isinstance(value, str) and value}
+    return {value: position + 1 for position, value in enumerate(sorted(names))}
+
+
+def build_sqlite_catalog(db_path, scale=1, csv_path=DEFAULT_CSV_PATH):
+    """
+    Write a SQLite product database built from the CSV dataset.
+
+    Args:
+        db_path (str): SQLite file to create (replaced if it exists)
+        scale (int): Number of copies of the dataset
+        csv_path (str): CSV dataset
+
+    Returns:
+        int: Number of products written
+    """
+    from app.models.csv_data_loader import load_csv_data
+
+    df = load_csv_data(csv_path, use_cache=False)
+    cities = _ids(df["cityName"])
+    groups = _ids(df["groupName"])
+    categories = _ids(category for values in df["categories"] for category in values)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany('INSERT INTO "City" VALUES (?, ?)', [(i, n) for n, i in cities.items()])
+        connection.executemany('INSERT INTO "GroupProduct" VALUES (?, ?)', [(i, n) for n, i in groups.items()])
+        connection.executemany('INSERT INTO "Category" VALUES (?, ?)', [(i, n) for n, i in categories.items()])
+
+        now = datetime(2024, 1, 1).isoformat()
+        product_id = 0
+        for copy in range(scale):
+            products, links, images = [], [], []
+            for row in df.itertuples(index=False):
+                product_id += 1
+                name = row.name if copy == 0 else f"{row.name} {copy + 1}"
+                products.append((
+                    product_id, name, row.description, int(row.price), int(row.star), int(row.quantity),
+                    groups.get(row.groupName), cities.get(row.cityName), True, now, now, None,
+                ))
+                links.extend((categories[category], product_id) for category in row.categories if category in categories)
+                images.append((product_id, f"https://example.com/images/{product_id}.jpg"))
+            connection.executemany(f'INSERT INTO "Product" VALUES ({", ".join("?" * 12)})', products)
+            connection.executemany('INSERT INTO "_CategoryToProduct" VALUES (?, ?)', links)
+            connection.executemany('INSERT INTO "Image" ("productId", "publicUrl") VALUES (?, ?)', images)
+        connection.commit()
+    finally:
+        connection.close()
+
+    return product_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path")
+    parser.add_argument("--scale", type=int, default=1, help="Copies of the CSV dataset")
+    args = parser.parse_args()
+
+    count = build_sqlite_catalog(args.db_path, args.scale)
+    print(f"Wrote {count} products to {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Replay a recorded request log against the service and report latency per endpoint.
+
+The log is JSONL, one request per line:
+
+    {"method": "GET", "path": "/api/recommend", "params": {"product_id": 12, "num": 5}}
+
+``method`` defaults to GET; ``params`` are sent as the query string and an
+optional ``json`` value as the request body. Requests are sent in log order
+by ``--concurrency`` workers, as fast as possible or at ``--rate`` requests
+per second. With ``--rate``, latency is measured from each request's
+scheduled send time, so a server that falls behind shows it in the tail.
+
+Without ``--url`` the app runs in this process against offline fixtures: a
+SQLite copy of the CSV dataset (see benchmarks.fixtures) and a temporary
+MODEL_DIR, so nothing but this machine is needed and the committed models
+are not touched. ``generate`` writes a log with a skewed mix of product,
+category, group and keyword requests matching those fixtures.
+
+Usage:
+    python -m benchmarks.replay generate requests.log.jsonl [--requests 5000] [--scale 1]
+    python -m benchmarks.replay run requests.log.jsonl [--concurrency 16] [--rate 200] [--url http://localhost:6000]
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+from benchmarks.fixtures import build_sqlite_catalog
+
+# Share of each request kind in generated logs
+GENERATED_MIX = [
+    ("product", 0.55),
+    ("category", 0.15),
+    ("group", 0.1),
+    ("keywords", 0.2),
+]
+
+PERCENTILES = [50, 90, 99]
+
+
+def load_log(path):
+    """Read a JSONL request log"""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "path" not in entry:
+                raise ValueError(f"{path}:{line_number}: request without a path")
+            entries.append(entry)
+    return entries
+
+
+def endpoint_key(entry):
+    """Group requests by method and path, with numeric path segments as <id>"""
+    path = re.sub(r"/\d+(?=/|$)", "/<id>", entry["path"])
+    return f"{entry.get('method', 'GET').upper()} {path}"
+
+
+def _zipf_choice(rng, values, exponent=1.1):
+    """Pick values with a Zipf-like skew, the first values being the most popular"""
+    weights = 1 / np.arange(1, len(values) + 1) ** exponent
+    return values[rng.choice(len(values), p=weights / weights.sum())]
+
+
+def generate_log(path, num_requests, db_path, seed=0):
+    """
+    Write a request log with a skewed mix of endpoints over the products of a fixture database.
+
+    Popular products, categories and groups get most of the traffic, like
+    production logs.
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        product_ids = [row[0] for row in connection.execute('SELECT "id" FROM "Product" ORDER BY "id"')]
+        category_ids = [row[0] for row in connection.execute('SELECT "id" FROM "Category" ORDER BY "id"')]
+        group_ids = [row[0] for row in connection.execute('SELECT "id" FROM "GroupProduct" ORDER BY "id"')]
+        names = [row[0] for row in connection.execute('SELECT "name" FROM "Product" ORDER BY "id"')]
+    finally:
+        connection.close()
+
+    rng = np.random.default_rng(seed)
+    # Shuffle once so popularity is not tied to IDs
+    for values in (product_ids, category_ids, group_ids, names):
+        rng.shuffle(values)
+
+    kinds = [kind for kind, _ in GENERATED_MIX]
+    shares = np.array([share for _, share in GENERATED_MIX])
+    with open(path, "w", encoding="utf-8") as f:
+        for kind in rng.choice(kinds, size=num_requests, p=shares / shares.sum()):
+            num = int(rng.choice([5, 10, 20]))
+            if kind == "product":
+                entry = {"method": "GET", "path": "/api/recommend", "params": {"product_id": int(_zipf_choice(rng, product_ids)), "num": num}}
+            elif kind == "category":
+                entry = {"method": "GET", "path": "/api/recommend/category", "params": {"category_id": int(_zipf_choice(rng, category_ids)), "num": num}}
+            elif kind == "group":
+                entry = {"method": "GET", "path": "/api/recommend/group", "params": {"group_id": int(_zipf_choice(rng, group_ids)), "num": num}}
+            else:
+                words = _zipf_choice(rng, names).split()
+                keywords = " ".join(words[:int(rng.integers(1, min(3, len(words)) + 1))])
+                entry = {"method": "GET", "path": "/api/csv/recommend/keywords", "params": {"keywords": keywords, "num": num}}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class HttpTarget:
+    """Send requests to a running server, one keep-alive connection per worker"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.local = threading.local()
+
+    def _connection(self, fresh=False):
+        if fresh or getattr(self.local, "connection", None) is None:
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self.local.connection
+
+    def send(self, method, path, params, body):
+        url = f"{path}?{urlencode(params, doseq=True)}" if params else path
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            connection = self._connection(fresh=attempt > 0)
+            try:
+                connection.request(method, url, body=payload, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection, retry on a new one
+                connection.close()
+        return 0
+
+
+class AppTarget:
+    """Call the Flask app in this process, one test client per worker"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method, path, params, body):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, query_string=params, json=body)
+        return response.status_code
+
+
+def replay(target, entries, concurrency, rate=None):
+    """
+    Send every entry and time it.
+
+    Returns:
+        tuple: ([(endpoint, status, seconds)], elapsed seconds)
+    """
+    results = []
+    lock = threading.Lock()
+    pending = iter(enumerate(entries))
+    start = time.perf_counter()
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            index, entry = item
+
+            sent = time.perf_counter()
+            if rate:
+                # Open loop: keep the schedule even when responses are slow
+                scheduled = start + index / rate
+                if scheduled > sent:
+                    time.sleep(scheduled - sent)
+                sent = scheduled
+
+            try:
+                status = target.send(
+                    entry.get("method", "GET").upper(), entry["path"],
+                    entry.get("params") or {}, entry.get("json")
+                )
+            except Exception as e:
+                print(f"Request {index} failed: {str(e)}")
+                status = 0
+            local.append((endpoint_key(entry), status, time.perf_counter() - sent))
+
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """Per-endpoint request counts, throughput, status classes and latency percentiles (ms)"""
+    by_endpoint = defaultdict(list)
+    for endpoint, status, seconds in results:
+        by_endpoint[endpoint].append((status, seconds))
+    by_endpoint["ALL"] = [(status, seconds) for _, status, seconds in results]
+
+    report = {}
+    for endpoint, samples in by_endpoint.items():
+        statuses = np.array([status for status, _ in samples])
+        latencies = np.array([seconds for _, seconds in samples]) * 1000
+        report[endpoint] = {
+            "requests": len(samples),
+            "throughput": len(samples) / elapsed if elapsed else 0.0,
+            "ok": int(((statuses >= 200) & (statuses < 400)).sum()),
+            "client_errors": int(((statuses >= 400) & (statuses < 500)).sum()),
+            "server_errors": int(((statuses >= 500) | (statuses == 0)).sum()),
+            **{f"p{p}_ms": float(np.percentile(latencies, p)) for p in PERCENTILES},
+            "max_ms": float(latencies.max()),
+        }
+    return report
+
+
+def print_report(report):
+    columns = ["requests", "throughput", "ok", "client_errors", "server_errors"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    width = max(len(endpoint) for endpoint in report) + 2
+    print(f"{'endpoint':<{width}}{'reqs':>7}{'req/s':>9}{'2xx':>7}{'4xx':>7}{'5xx':>7}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'max ms':>10}")
+    for endpoint in sorted(report, key=lambda name: (name == "ALL", name)):
+        row = report[endpoint]
+        print(f"{endpoint:<{width}}{row['requests']:>7}{row['throughput']:>9.1f}{row['ok']:>7}"
+              f"{row['client_errors']:>7}{row['server_errors']:>7}"
+              + "".join(f"{row[column]:>10.1f}" for column in columns[5:]))
+
+
+def offline_app(work_dir, scale):
+    """Build the fixture database and create the app against it"""
+    db_path = os.path.join(work_dir, "products.db")
+    # The app reads its settings at import time
+    os.environ["DB_URL"] = f"sqlite:///{db_path}"
+    os.environ["MODEL_DIR"] = os.path.join(work_dir, "models")
+    build_sqlite_catalog(db_path, scale)
+
+    from app import create_app
+    return create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write a skewed request log for the offline fixtures")
+    generate.add_argument("log")
+    generate.add_argument("--requests", type=int, default=5000)
+    generate.add_argument("--scale", type=int, default=1, help="Copies of the CSV dataset in the fixture database")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", help="Replay a request log")
+    run.add_argument("log")
+    run.add_argument("--url", help="Running server to replay against, e.g. http://localhost:6000")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--rate", type=float, help="Requests per second (default: as fast as possible)")
+    run.add_argument("--repeat", type=int, default=1, help="Times to replay the log")
+    run.add_argument("--warmup", type=int, default=50, help="Requests sent first and left out of the report")
+    run.add_argument("--scale", type=int, default=1, help="Copies of the CSV dataset in the offline database")
+    run.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        db_path = os.path.join(tempfile.mkdtemp(), "products.db")
+        build_sqlite_catalog(db_path, args.scale)
+        generate_log(args.log, args.requests, db_path, args.seed)
+        print(f"Wrote {args.requests} requests to {args.log}")
+        return
+
+    entries = load_log(args.log) * args.repeat
+    target = HttpTarget(args.url) if args.url else AppTarget(offline_app(tempfile.mkdtemp(), args.scale))
+
+    # Load models and fill caches before measuring
+    replay(target, entries[:args.warmup], args.concurrency)
+    results, elapsed = replay(target, entries, args.concurrency, args.rate)
+
+    print(f"{len(results)} requests in {elapsed:.1f}s, {args.concurrency} workers"
+          + (f", {args.rate:g} req/s offered" if args.rate else ""))
+    report = summarize(results, elapsed)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Export every product's top neighbors from the trained database model.
+
+Writes (productId, rank, recommendedProductId, score) rows for bulk consumers
+that would otherwise call /api/recommend for every product:
+
+    python export_recommendations.py csv recommendations.csv [--top-k 20]
+    python export_recommendations.py parquet recommendations/          (needs pyarrow)
+    python export_recommendations.py table [--table ProductRecommendation]
+
+Products are scored and written a chunk at a time. An interrupted export
+continues where it stopped when run again with the same arguments; pass
+--restart to start over.
+"""
+import argparse
+import os
+import sys
+from app.config import Config
+from app.models.recommendation.constants import MODEL_DIR
+from app.services.export_service import ExportService, CsvExportWriter, ParquetExportWriter, TableExportWriter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("format", choices=["csv", "parquet", "table"])
+    parser.add_argument("output", nargs="?", help="CSV file or Parquet directory")
+    parser.add_argument("--table", default="ProductRecommendation", help="Table written by the table format")
+    parser.add_argument("--top-k", type=int, default=Config.EXPORT_TOP_K, help="Neighbors per product")
+    parser.add_argument("--chunk-size", type=int, default=Config.EXPORT_CHUNK_SIZE, help="Products scored at a time")
+    parser.add_argument("--checkpoint", help="Progress file (default: next to the output)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress of an earlier run")
+    args = parser.parse_args()
+
+    if args.format == "table":
+        writer = TableExportWriter(args.table)
+        checkpoint = args.checkpoint or os.path.join(MODEL_DIR, f"export_{args.table}.checkpoint.json")
+    elif not args.output:
+        parser.error(f"{args.format} exports need an output path")
+    else:
+        output = args.output.rstrip("/\\")
+        writer = CsvExportWriter(output) if args.format == "csv" else ParquetExportWriter(output)
+        checkpoint = args.checkpoint or f"{output}.checkpoint.json"
+
+    success, message = ExportService.export_recommendations(
+        writer, checkpoint, args.top_k, args.chunk_size, resume=not args.restart
+    )
+    print(message)
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
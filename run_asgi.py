@@ -0,0 +1,6 @@
+from app.asgi import app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=6000)
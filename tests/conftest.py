@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# The app reads its settings and creates its model directory at import time;
+# keep the tests away from the committed model files
+os.environ.setdefault("MODEL_DIR", tempfile.mkdtemp(prefix="recommendation-tests-"))
@@ -0,0 +1,55 @@
+import asyncio
+import contextvars
+import time
+import pytest
+from app.services.admission import AdmissionRejected, DeadlineExceeded, EndpointLimiter, check_deadline
+
+
+def test_full_queue_is_rejected():
+    limiter = EndpointLimiter("light", max_concurrent=1, max_queue=0)
+
+    with limiter.admit():
+        with pytest.raises(AdmissionRejected) as rejected:
+            with limiter.admit():
+                pass
+
+    assert rejected.value.status == 429
+    assert limiter.stats()["running"] == 0
+
+
+def test_async_deadline_reaches_the_scoring_thread():
+    limiter = EndpointLimiter("heavy", max_concurrent=1, max_queue=1, deadline_ms=10)
+
+    async def request():
+        async with limiter.admit_async():
+            await asyncio.sleep(0.02)
+            context = contextvars.copy_context()
+            await asyncio.get_running_loop().run_in_executor(None, context.run, check_deadline)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(request())
+    assert limiter.stats()["deadline_exceeded"] == 1
+
+
+def test_async_request_waits_for_a_slot():
+    limiter = EndpointLimiter("light", max_concurrent=1, max_queue=1)
+    order = []
+
+    async def request(name, seconds):
+        async with limiter.admit_async():
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    async def both():
+        first = asyncio.create_task(request("first", 0.05))
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        await request("second", 0)
+        await first
+        return time.monotonic() - start
+
+    waited = asyncio.run(both())
+
+    assert order == ["first", "second"]
+    assert waited >= 0.04
+    assert limiter.stats()["running"] == 0
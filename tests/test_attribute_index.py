@@ -0,0 +1,31 @@
+import pandas as pd
+from app.models.recommendation.attribute_index import AttributeIndex
+from app.models.recommendation.membership_index import MembershipIndex
+
+
+def price_range(price):
+    return "low" if price < 100 else "high"
+
+
+ITEMS = pd.DataFrame({
+    "cityName": ["Hanoi", "Hanoi", "Hue", "Hanoi"],
+    "groupName": ["Tour", "Tour", "Hotel", "Hotel"],
+    "price": [50, 150, 50, 50],
+    "star": [3, 4, 5, 2],
+    "categories": [["Beach", "beach"], ["Beach"], ["Beach", "Spa"], ["Spa", "Spa"]],
+})
+
+
+def test_repeated_keys_map_to_the_row_once():
+    index = MembershipIndex.from_values([["a", "a"], ["a", "b"], ["b", None, "b"]])
+
+    assert index.rows("a").tolist() == [0, 1]
+    assert index.rows("b").tolist() == [1, 2]
+
+
+def test_filters_with_repeated_categories_intersect_to_unique_rows():
+    index = AttributeIndex(ITEMS, price_range)
+
+    assert index.candidates({"category": "beach"}).tolist() == [0, 1, 2]
+    assert index.candidates({"category": "beach", "city": "hanoi"}).tolist() == [0, 1]
+    assert index.candidates({"category": "spa", "price_range": "low", "min_star": 2}).tolist() == [2, 3]
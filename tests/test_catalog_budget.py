@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+from app.config import Config
+from app.models.recommendation.catalog import CatalogFiles
+from app.models.recommendation.compaction import compact_matrix
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import get_price_range, prepare_content_features
+from app.models.recommendation.footprint import ModelBudgetExceeded
+from app.models.recommendation.vectorizer import fit_vectorizer
+
+
+def make_products(ids):
+    return pd.DataFrame([{
+        "id": product_id,
+        "name": f"hoa cuoi {product_id}",
+        "description": "hoa cuoi do" if product_id % 2 else "banh cuoi ngot",
+        "price": 100000 * product_id,
+        "star": 3 + product_id % 3,
+        "cityName": "Ha Noi" if product_id % 2 else "Hue",
+        "groupName": "Hoa cuoi",
+        "categories": ["Hoa"],
+    } for product_id in ids])
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "MODEL_TRAIN_BUDGET_MB", 0)
+    monkeypatch.setattr(Config, "MODEL_BUDGET_ACTION", "refuse")
+    return CatalogFiles(
+        "test", str(tmp_path / "vectorizer.pkl"), str(tmp_path / "matrix.pkl"), str(tmp_path / "items.pkl"),
+        get_price_range, manifest_path=str(tmp_path / "manifest.json"),
+    )
+
+
+def train(catalog, ids):
+    products_df = prepare_content_features(make_products(ids))
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
+    return catalog.train(vectorizer, matrix, products_df)
+
+
+def upsert(model, ids):
+    products_df = prepare_content_features(make_products(ids))
+    matrix = compact_matrix(model.vectorizer.transform(products_df['content']))
+    model.delta_index.upsert(products_df.drop(columns=['content']), matrix)
+
+
+def test_train_over_budget_is_refused(catalog, monkeypatch):
+    monkeypatch.setattr(Config, "MODEL_TRAIN_BUDGET_MB", 0.001)
+
+    with pytest.raises(ModelBudgetExceeded):
+        train(catalog, range(1, 9))
+
+
+def test_fold_writes_a_new_manifest(catalog):
+    model = train(catalog, range(1, 9))
+    upsert(model, [20, 21])
+
+    folded = catalog.fold(model)
+
+    assert folded.manifest["items"] == 10
+    assert folded.manifest["footprint"]["total_bytes"] > 0
+    assert folded.manifest is not model.manifest
+
+
+def test_fold_over_budget_is_refused(catalog, monkeypatch):
+    model = train(catalog, range(1, 9))
+    upsert(model, [20, 21])
+    monkeypatch.setattr(Config, "MODEL_TRAIN_BUDGET_MB", 0.001)
+
+    with pytest.raises(ModelBudgetExceeded):
+        catalog.fold(model)
+
+
+def test_budget_counts_every_resident_lookup(catalog):
+    model = train(catalog, range(1, 9))
+
+    lookups = model.manifest["footprint"]["lookups"]
+    assert {"item_records", "id_index", "attribute_index"} <= set(lookups)
+    assert lookups["id_index"] > 0 and lookups["attribute_index"] > 0
+    assert lookups["neighbor_table"] == 0
+    assert model.footprint()["lookups"]["neighbor_table"] == 0
+    # The trained model keeps the indexes that were measured
+    assert model.id_index == {product_id: row for row, product_id in enumerate(range(1, 9))}
@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+from app.config import Config
+from app.services import catalog_service
+from app.services.catalog_service import CSV_CATALOG, CatalogService, catalog_caches, model_registry
+from app.services.csv_recommendation_service import CSVRecommendationService
+
+HOT_KEYS = [(product_id, 5, None, None) for product_id in ["1", "2", "3"]]
+
+
+@pytest.fixture
+def served_model(monkeypatch):
+    monkeypatch.setattr(Config, "WARMUP_CPU_SHARE", 1.0)
+    monkeypatch.setattr(Config, "WARMUP_TOP_N", len(HOT_KEYS))
+    monkeypatch.setattr(Config, "MODEL_TRAIN_BUDGET_MB", 0)
+    success, message = CSVRecommendationService.train_model()
+    assert success, message
+    wait_for_publications()
+    for product_id, num, _, _ in HOT_KEYS:
+        CSVRecommendationService.get_recommendations(product_id, num)
+    return model_registry.peek(CSV_CATALOG)
+
+
+def hold_warm_up(monkeypatch):
+    """Make the warm-up of new models wait until the returned event is set"""
+    release = threading.Event()
+    warm_cache = catalog_service.warm_cache
+
+    def held_warm_cache(*args, **kwargs):
+        release.wait(10)
+        return warm_cache(*args, **kwargs)
+
+    monkeypatch.setattr(catalog_service, "warm_cache", held_warm_cache)
+    return release
+
+
+def wait_for_publications():
+    catalog_caches[CSV_CATALOG].publisher.submit(lambda: None).result(timeout=30)
+
+
+def test_retrained_model_is_served_after_its_warm_up(served_model, monkeypatch):
+    release = hold_warm_up(monkeypatch)
+
+    success, _ = CSVRecommendationService.train_model()
+    assert success
+    # The old model keeps serving, and updates are not held up by the warm-up
+    assert model_registry.peek(CSV_CATALOG) is served_model
+    assert CSVRecommendationService.delete_product(5)[0]
+
+    release.set()
+    wait_for_publications()
+    model = model_registry.peek(CSV_CATALOG)
+    assert model is not served_model
+    for key in HOT_KEYS:
+        assert catalog_caches[CSV_CATALOG].recommend.get(model.generation(), key) is not None
+
+
+def test_changes_during_a_fold_warm_up_are_folded(served_model, monkeypatch):
+    release = hold_warm_up(monkeypatch)
+    num_products = len(served_model.items_df)
+
+    assert CSVRecommendationService.upsert_products([{"id": 900001, "name": "banh mi thit"}])[0]
+    assert CSVRecommendationService.fold_delta()[0]
+    assert model_registry.peek(CSV_CATALOG) is served_model
+    assert CSVRecommendationService.upsert_products([{"id": 900002, "name": "pho bo"}])[0]
+    assert CSVRecommendationService.delete_product(1)[0]
+
+    release.set()
+    wait_for_publications()
+    model = model_registry.peek(CSV_CATALOG)
+    assert not model.has_pending_changes
+    assert len(model.items_df) == num_products + 1
+    assert {900001, 900002} <= set(model.id_index) and 1 not in model.id_index
+
+
+def test_model_loaded_from_disk_is_warmed(served_model):
+    assert CatalogService.evict(CSV_CATALOG)[0]
+
+    model = CatalogService.load(CSV_CATALOG)
+    assert model is not served_model
+
+    cache = catalog_caches[CSV_CATALOG].recommend
+    deadline = time.monotonic() + 10
+    while cache.get(model.generation(), HOT_KEYS[0]) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for key in HOT_KEYS:
+        assert cache.get(model.generation(), key) is not None
+
+
+def test_product_listing_follows_live_updates(served_model):
+    version = CSVRecommendationService.get_model_version()
+    total = CSVRecommendationService.get_products_page(0, 10)["total"]
+
+    assert CSVRecommendationService.upsert_products([{"id": 2, "name": "ten moi"}, {"id": 900003, "name": "xoi"}])[0]
+    assert CSVRecommendationService.delete_product(1)[0]
+
+    page = CSVRecommendationService.get_products_page(0, 10)
+    assert page["version"] != version and page["version"] == CSVRecommendationService.get_model_version()
+    assert page["total"] == total
+    assert [product["id"] for product in page["data"]][:2] == [3, 4]
+
+    last_page = CSVRecommendationService.get_products_page(total - 2, 10)
+    assert [(product["id"], product["name"]) for product in last_page["data"]] == [(2, "ten moi"), (900003, "xoi")]
+
+    products, stream_version = CSVRecommendationService.iter_products(("id",))
+    ids = [product["id"] for product in products]
+    assert stream_version == page["version"]
+    assert len(ids) == total and 1 not in ids and ids[-2:] == [2, 900003]
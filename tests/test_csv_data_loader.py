@@ -0,0 +1,49 @@
+import pandas as pd
+from app.models import csv_data_loader
+from app.models.csv_data_loader import CSVCache, iter_csv_data, load_csv_data
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import fit_content_frames
+from app.models.recommendation.vectorizer import fit_vectorizer
+
+CSV_PATH = "app/data/product_data.csv"
+
+
+def copy_csv(tmp_path, rows=60):
+    path = tmp_path / "products.csv"
+    pd.read_csv(CSV_PATH, nrows=rows).to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunks_match_a_single_parse(tmp_path):
+    csv_path = copy_csv(tmp_path)
+
+    chunks = list(iter_csv_data(csv_path, use_cache=False, chunk_size=25))
+    whole = load_csv_data(csv_path, use_cache=False, chunk_size=1000)
+
+    assert [len(chunk) for chunk in chunks] == [25, 25, 10]
+    assert pd.concat(chunks, ignore_index=True)['id'].tolist() == whole['id'].tolist()
+    assert pd.concat(chunks, ignore_index=True)['content'].tolist() == whole['content'].tolist()
+
+
+def test_streamed_training_keeps_the_cache_whole(tmp_path, monkeypatch):
+    csv_path = copy_csv(tmp_path)
+
+    vectorizer, matrix, products_df = fit_content_frames(iter_csv_data(csv_path, use_cache=True, chunk_size=25))
+    cached = CSVCache(csv_path).load()
+
+    # Training drops the content of its compacted rows, not of the chunks written to the cache
+    assert 'content' not in products_df.columns
+    assert len(cached) == 60 and cached['content'].str.len().gt(0).all()
+
+    _, expected_matrix = fit_vectorizer(cached['content'], TFIDF_PARAMS)
+    assert matrix.shape == expected_matrix.shape
+    assert abs(matrix - expected_matrix).max() < 1e-6
+
+    # The next read is served from the cache, in chunks
+    monkeypatch.setattr(csv_data_loader, "iter_csv_chunks", None)
+    assert [len(chunk) for chunk in iter_csv_data(csv_path, use_cache=True, chunk_size=25)] == [25, 25, 10]
+
+
+def test_missing_file_has_no_chunks(tmp_path):
+    assert list(iter_csv_data(str(tmp_path / "missing.csv"), use_cache=False)) == []
+    assert fit_content_frames(iter_csv_data(str(tmp_path / "missing.csv"), use_cache=False)) is None
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.models.recommendation.catalog import CatalogModel
+from app.models.recommendation.compaction import compact_matrix
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import get_price_range, prepare_content_features
+from app.models.recommendation.delta_index import DELTA, MAIN
+from app.models.recommendation.vectorizer import fit_vectorizer
+
+DESCRIPTIONS = ["hoa cuoi do tuoi", "banh cuoi ngot", "ao dai cuoi do", "nhan cuoi vang", "thiep cuoi do"]
+
+
+def make_products(ids, city=None, description=None):
+    return [{
+        "id": product_id,
+        "name": f"san pham {product_id}",
+        "description": description or DESCRIPTIONS[product_id % len(DESCRIPTIONS)],
+        "price": 100000 * product_id,
+        "star": 3 + product_id % 3,
+        "cityName": city or ("Ha Noi" if product_id % 2 else "Hue"),
+        "groupName": "Cuoi",
+        "categories": [],
+    } for product_id in ids]
+
+
+@pytest.fixture
+def model():
+    products_df = prepare_content_features(pd.DataFrame(make_products(range(1, 11))))
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
+    return CatalogModel("test", vectorizer, compact_matrix(matrix), products_df, get_price_range)
+
+
+def upsert(model, products):
+    products_df = prepare_content_features(pd.DataFrame(products))
+    matrix = compact_matrix(model.vectorizer.transform(products_df['content']))
+    return model.delta_index.upsert(products_df.drop(columns=['content']), matrix)
+
+
+def recommended_ids(recommendations):
+    return [product["id"] for product in recommendations]
+
+
+def test_upsert_of_a_main_product_hides_its_old_row(model):
+    upsert(model, make_products([2], description="nhan cuoi vang"))
+    state = model.delta_index.state
+
+    assert state.tombstones[model.id_index[2]]
+    assert state.lookup(model.id_index, 2) == (DELTA, 0)
+    assert state.lookup(model.id_index, 3) == (MAIN, model.id_index[3])
+
+    # Only the new version of the product is served
+    results = model.recommend_keywords("nhan vang", 10)
+    assert recommended_ids(results).count(2) == 1
+    assert {product["id"] for product in results if product["similarity_score"] > 0} == {2, 3, 8}
+    assert [product["description"] for product in results if product["id"] == 2] == ["nhan cuoi vang"]
+    old_text = model.recommend_keywords("ao dai", 10)
+    assert {product["id"] for product in old_text if product["similarity_score"] > 0} == {7}
+
+
+def test_last_version_of_a_product_sent_twice_wins(model):
+    size = upsert(model, make_products([20], description="banh mi") + make_products([20], description="xoi xeo"))
+
+    assert size == 1
+    assert model.delta_index.state.records[0]["description"] == "xoi xeo"
+
+
+def test_delete_of_a_delta_only_product(model):
+    upsert(model, make_products([20, 21]))
+
+    assert model.delta_index.delete(20)
+    assert model.delta_index.state.lookup(model.id_index, 20) is None
+    assert len(model.delta_index) == 1
+    assert "error" in model.recommend(20)
+    assert 20 not in recommended_ids(model.recommend(21, 20))
+    assert not model.delta_index.delete(20)
+    assert not model.delta_index.delete(999)
+
+
+def test_fold_equals_a_model_built_from_the_merged_rows(model):
+    upsert(model, make_products([2, 20], description="thiep cuoi vang") + make_products([21]))
+    model.delta_index.delete(5)
+    before_fold = [model.recommend(product_id, 5) for product_id in (1, 2, 20)]
+
+    matrix, items_df = model.delta_index.fold(model.matrix, model.items_df)
+
+    merged = make_products([1, 3, 4, 6, 7, 8, 9, 10]) + make_products([2, 20], description="thiep cuoi vang") \
+        + make_products([21])
+    merged_df = prepare_content_features(pd.DataFrame(merged))
+    assert items_df['id'].tolist() == merged_df['id'].tolist()
+    expected = compact_matrix(model.vectorizer.transform(merged_df['content']))
+    assert np.allclose(matrix.toarray(), expected.toarray(), atol=1e-6)
+
+    folded = CatalogModel("test", model.vectorizer, matrix, items_df, get_price_range)
+    for product_id, recommendations in zip((1, 2, 20), before_fold):
+        after = folded.recommend(product_id, 5)
+        assert np.allclose([p["similarity_score"] for p in after], [p["similarity_score"] for p in recommendations])
+        assert {p["id"] for p in after if p["similarity_score"] > 0} == \
+            {p["id"] for p in recommendations if p["similarity_score"] > 0}
+
+
+def test_filters_apply_to_delta_rows(model):
+    upsert(model, make_products([20], city="Da Nang") + make_products([21], city="Hue"))
+
+    assert recommended_ids(model.recommend(1, 10, filters=(("city", "da nang"),))) == [20]
+    hue = recommended_ids(model.recommend_keywords("cuoi", 20, filters=(("city", "hue"),)))
+    assert 21 in hue and 20 not in hue
+    assert all(product_id % 2 == 0 or product_id == 21 for product_id in hue)
+    min_star = model.recommend_keywords("cuoi", 20, filters=(("min_star", 5),))
+    assert min_star and all(product["star"] >= 5 for product in min_star)
@@ -0,0 +1,112 @@
+import os
+import pandas as pd
+import pytest
+from app.models.recommendation.catalog import CatalogModel
+from app.models.recommendation.compaction import compact_matrix
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import get_price_range, prepare_content_features
+from app.models.recommendation.vectorizer import fit_vectorizer
+from app.services import export_service
+from app.services.export_service import CsvExportWriter, ExportService, ParquetExportWriter
+
+WORDS = ["hoa", "cuoi", "banh", "ngot", "ao", "dai", "nhan", "vang", "thiep", "do"]
+CHUNK_SIZE = 4
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(writer, chunks):
+    """Make the writer fail right after writing its chunks-th chunk, before the checkpoint is saved"""
+    write = writer.write
+    written = []
+
+    def failing_write(product_ids, rows):
+        write(product_ids, rows)
+        written.append(product_ids)
+        if len(written) == chunks:
+            raise Interrupted()
+
+    writer.write = failing_write
+    return writer
+
+
+@pytest.fixture
+def model(monkeypatch):
+    products_df = prepare_content_features(pd.DataFrame([{
+        "id": product_id,
+        "name": f"san pham {product_id}",
+        "description": " ".join(WORDS[(product_id * step) % len(WORDS)] for step in (1, 3, 7)),
+        "price": 100000 * product_id,
+        "star": 3 + product_id % 3,
+        "cityName": "Hue",
+        "groupName": "Cuoi",
+        "categories": [],
+    } for product_id in range(1, 15)]))
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
+    model = CatalogModel("test", vectorizer, compact_matrix(matrix), products_df, get_price_range)
+    monkeypatch.setattr(export_service.CatalogService, "load", lambda catalog: model)
+    return model
+
+
+def export(writer, checkpoint_path):
+    return ExportService.export_recommendations(writer, str(checkpoint_path), 3, CHUNK_SIZE)
+
+
+def read_parquet(directory):
+    return pd.concat([pd.read_parquet(os.path.join(directory, name)) for name in sorted(os.listdir(directory))],
+                     ignore_index=True)
+
+
+def test_resumed_csv_export_drops_the_unfinished_chunk(model, tmp_path):
+    expected_path = tmp_path / "expected.csv"
+    assert export(CsvExportWriter(str(expected_path)), tmp_path / "expected.json")[0]
+
+    path = tmp_path / "export.csv"
+    with pytest.raises(Interrupted):
+        export(interrupt_after(CsvExportWriter(str(path)), 3), tmp_path / "export.json")
+    # The third chunk reached the file but not the checkpoint
+    assert os.path.getsize(path) > export_service._load_checkpoint(tmp_path / "export.json")["offset"]
+
+    success, message = export(CsvExportWriter(str(path)), tmp_path / "export.json")
+
+    assert success and message == "Exported 3 neighbors for 14 products"
+    assert path.read_text() == expected_path.read_text()
+    assert export(CsvExportWriter(str(path)), tmp_path / "export.json")[1] == "Export already complete (14 products)"
+
+
+def test_resumed_parquet_export_removes_stale_parts(model, tmp_path):
+    expected_dir = tmp_path / "expected"
+    assert export(ParquetExportWriter(str(expected_dir)), tmp_path / "expected.json")[0]
+
+    directory = tmp_path / "export"
+    with pytest.raises(Interrupted):
+        export(interrupt_after(ParquetExportWriter(str(directory)), 3), tmp_path / "export.json")
+    assert export_service._load_checkpoint(tmp_path / "export.json")["parts"] == 2
+    # Leftovers of the interrupted write and of an earlier, longer run
+    (directory / "part-00002.parquet.tmp").write_bytes(b"partial")
+    (directory / "part-00009.parquet").write_bytes(b"stale")
+
+    assert export(ParquetExportWriter(str(directory)), tmp_path / "export.json")[0]
+
+    assert sorted(os.listdir(directory)) == sorted(os.listdir(expected_dir))
+    pd.testing.assert_frame_equal(read_parquet(directory), read_parquet(expected_dir))
+
+
+def test_export_starts_over_when_the_delta_changes(model, tmp_path):
+    path, checkpoint_path = tmp_path / "export.csv", tmp_path / "export.json"
+    with pytest.raises(Interrupted):
+        export(interrupt_after(CsvExportWriter(str(path)), 2), checkpoint_path)
+
+    assert model.delta_index.delete(14)
+    success, message = export(CsvExportWriter(str(path)), checkpoint_path)
+
+    assert success and message == "Exported 3 neighbors for 13 products"
+    rows = pd.read_csv(path)
+    assert 14 not in set(rows['productId']) | set(rows['recommendedProductId'])
+    assert export_service._load_checkpoint(checkpoint_path)["delta_generation"] == model.delta_index.state.tag
+
+    # A finished export is redone after the next change too
+    assert model.delta_index.delete(13)
+    assert export(CsvExportWriter(str(path)), checkpoint_path)[1] == "Exported 3 neighbors for 12 products"
@@ -0,0 +1,86 @@
+import time
+from app.services.recommendation_cache import RecommendationCache, HitCounter, warm_cache
+
+KEY = ("1", 5, None, None)
+RESULT = [{"id": 2, "similarity_score": 0.5}]
+
+
+def test_newer_generation_clears_entries():
+    cache = RecommendationCache(10)
+    cache.put(1, KEY, RESULT)
+
+    assert cache.get(1, KEY) == RESULT
+    assert cache.get(2, KEY) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_older_generation_is_a_miss_and_keeps_entries():
+    cache = RecommendationCache(10)
+    cache.put(2, KEY, RESULT)
+
+    assert cache.get(1, KEY) is None
+    assert cache.get(2, KEY) == RESULT
+
+
+def test_result_of_an_older_generation_is_dropped():
+    cache = RecommendationCache(10)
+    cache.put(2, KEY, RESULT)
+
+    assert cache.put(1, ("3", 5, None, None), RESULT) is False
+    assert cache.get(2, ("3", 5, None, None)) is None
+    assert cache.get(2, KEY) == RESULT
+
+
+def test_errors_are_not_cached():
+    cache = RecommendationCache(10)
+    cache.put(1, KEY, {"error": "Product with ID 1 not found"})
+
+    assert cache.get(1, KEY) is None
+
+
+def test_install_takes_over_a_staged_newer_generation():
+    cache = RecommendationCache(10)
+    cache.put(1, KEY, RESULT)
+
+    staged = RecommendationCache(10)
+    warmed = warm_cache(staged, lambda: 2, [([("2", 5, None, None)], lambda keys: [RESULT for _ in keys])],
+                        max_seconds=10, cpu_share=1)
+
+    assert warmed == 1
+    assert cache.install(staged) is True
+    assert cache.get(2, ("2", 5, None, None)) == RESULT
+    assert cache.get(2, KEY) is None
+
+
+def test_install_drops_an_outdated_staged_generation():
+    cache = RecommendationCache(10)
+    cache.put(3, KEY, RESULT)
+
+    staged = RecommendationCache(10)
+    staged.put(2, ("2", 5, None, None), RESULT)
+
+    assert cache.install(staged) is False
+    assert cache.get(3, KEY) == RESULT
+
+
+def test_warm_up_stops_when_the_generation_changes():
+    cache = RecommendationCache(10)
+    generations = iter([1, 1, 2])
+    keys = [(str(product_id), 5, None, None) for product_id in range(4)]
+
+    warmed = warm_cache(cache, lambda: next(generations), [(keys, lambda batch: [RESULT for _ in batch])],
+                        max_seconds=10, cpu_share=1, batch_size=2)
+
+    assert warmed == 2
+
+
+def test_hit_counter_saves_in_the_background(tmp_path):
+    path = tmp_path / "hits.json"
+    hits = HitCounter(str(path), save_every=2)
+    hits.record(KEY)
+    hits.record(KEY)
+
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert HitCounter(str(path)).most_common(1) == [KEY]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.config import Config
+from app.models.recommendation.catalog import CatalogModel
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import get_price_range
+from app.models.recommendation.sharding import THREAD_BACKEND, shard_bounds
+from app.models.recommendation.vectorizer import fit_vectorizer
+
+WORDS = [f"tu{number}" for number in range(40)]
+NUM_PRODUCTS = 50
+
+
+def make_products():
+    # Random word counts, so products rarely tie on score and the order is well defined
+    rng = np.random.default_rng(7)
+    return pd.DataFrame([{
+        "id": product_id,
+        "name": f"san pham {product_id}",
+        "cityName": ["Ha Noi", "Hue", "Da Nang"][product_id % 3],
+        "groupName": "Hoa",
+        "price": 10000 * product_id,
+        "star": 3 + product_id % 3,
+        "categories": [],
+        "content": " ".join(rng.choice(WORDS, size=12)),
+    } for product_id in range(1, NUM_PRODUCTS + 1)])
+
+
+def build_model(monkeypatch, num_shards):
+    monkeypatch.setattr(Config, "SCORING_SHARDS", num_shards)
+    monkeypatch.setattr(Config, "SCORING_SHARD_BACKEND", THREAD_BACKEND)
+    products_df = make_products()
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
+    return CatalogModel("test", vectorizer, matrix.tocsr(), products_df, get_price_range)
+
+
+def assert_same_recommendations(actual, expected):
+    assert len(actual) == len(expected)
+    for sharded, unsharded in zip(actual, expected):
+        # Products that do not match the query at all tie at 0, in no particular order
+        assert [item["id"] for item in sharded if item["similarity_score"] > 0] == \
+            [item["id"] for item in unsharded if item["similarity_score"] > 0]
+        assert np.allclose([item["similarity_score"] for item in sharded],
+                           [item["similarity_score"] for item in unsharded], atol=1e-6)
+
+
+def test_shard_bounds_cover_every_row_once():
+    bounds = shard_bounds(10, 4)
+
+    assert bounds[0][0] == 0 and bounds[-1][1] == 10
+    assert all(end == start for (_, end), (start, _) in zip(bounds, bounds[1:]))
+    assert shard_bounds(2, 4) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize("filters", [None, (("city", "hue"),), (("min_star", 4.0), ("city", "ha noi"))])
+def test_sharded_recommendations_match_unsharded(monkeypatch, filters):
+    unsharded = build_model(monkeypatch, 1)
+    sharded = build_model(monkeypatch, 3)
+    assert unsharded.sharded_scorer is None and len(sharded.sharded_scorer) == 3
+
+    product_ids = [1, 17, 34, 50, 999]
+    assert_same_recommendations(
+        sharded.recommend_batch(product_ids[:-1], 8, filters=filters),
+        unsharded.recommend_batch(product_ids[:-1], 8, filters=filters),
+    )
+    assert "error" in sharded.recommend_batch(product_ids)[-1]
+
+    keywords = ["tu1 tu2", "tu30", "khong co"]
+    assert_same_recommendations(
+        sharded.recommend_keywords_batch(keywords, 8, filters=filters),
+        unsharded.recommend_keywords_batch(keywords, 8, filters=filters),
+    )
+    sharded.sharded_scorer.close()
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.content_based import prepare_content_features
+from app.models.recommendation.suggest_index import SuggestIndex, _PrefixArray
+from app.models.recommendation.vectorizer import HASHING_MODE, fit_vectorizer
+
+NAMES = ["Nhẫn cưới vàng", "Hoa cưới đỏ", "Bánh cưới ngọt", "Thiệp cưới đẹp", "Nhẫn bạc"]
+
+
+@pytest.fixture
+def products_df():
+    return prepare_content_features(pd.DataFrame([{
+        "id": product_id,
+        "name": name,
+        "description": f"{name} Hà Nội",
+        "price": 100000 * product_id,
+        "star": 4,
+        "cityName": "Hà Nội" if product_id % 2 else "Đà Nẵng",
+        "groupName": "Đồ cưới",
+        "categories": ["Trang sức"],
+    } for product_id, name in enumerate(NAMES, 1)]))
+
+
+def suggested_terms(suggestions):
+    return [suggestion["term"] for suggestion in suggestions["terms"]]
+
+
+def suggested_ids(suggestions):
+    return [suggestion["id"] for suggestion in suggestions["products"]]
+
+
+def test_prefixes_typed_without_accents_match(products_df):
+    index = SuggestIndex.from_model(*fit_vectorizer(products_df['content'], TFIDF_PARAMS), products_df)
+
+    terms = suggested_terms(index.suggest("nhan"))
+    assert terms[0] == "nhẫn" and sorted(terms[1:]) == ["nhẫn bạc", "nhẫn cưới"]
+    assert suggested_terms(index.suggest("NHẪN C")) == ["nhẫn cưới"]
+    assert suggested_ids(index.suggest("nhan")) == [5, 1]
+    assert suggested_ids(index.suggest("  cuoi   v")) == [1]
+    assert suggested_ids(index.suggest("da")) == []
+    # Only the accents typed are checked
+    assert index.suggest("nhân") == {"terms": [], "products": []}
+
+
+def test_generated_features_are_not_suggested(products_df):
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS)
+    assert any("_" in term for term in vectorizer.get_feature_names_out())
+
+    index = SuggestIndex.from_model(vectorizer, matrix, products_df)
+
+    assert index.terms and not any("_" in term for term in index.terms)
+    for prefix in ["price", "group", "city", "star", "category"]:
+        assert suggested_terms(index.suggest(prefix)) == []
+    # "trang" is only in the category_ feature
+    assert suggested_terms(index.suggest("trang")) == []
+    assert "nhẫn" in suggested_terms(index.suggest("nh"))
+
+
+def test_hashed_models_suggest_product_names_only(products_df):
+    vectorizer, matrix = fit_vectorizer(products_df['content'], TFIDF_PARAMS, mode=HASHING_MODE, n_features=2 ** 10)
+
+    index = SuggestIndex.from_model(vectorizer, matrix, products_df)
+
+    assert index.terms == []
+    assert index.suggest("nhan") == {
+        "terms": [], "products": [{"id": 5, "name": "Nhẫn bạc"}, {"id": 1, "name": "Nhẫn cưới vàng"}],
+    }
+
+
+def test_entries_matching_through_several_keys_are_listed_once():
+    index = SuggestIndex(["hoa", "hoà"], [3, 1], [1, 2, 3], ["hoa hoa hoa", "hoa hồng", "bó hoa"])
+
+    suggestions = index.suggest("hoa", 2)
+
+    assert suggested_terms(suggestions) == ["hoa", "hoà"]
+    assert suggested_ids(suggestions) == [1, 2]
+    assert suggested_ids(index.suggest("hoa")) == [1, 2, 3]
+
+
+def test_keys_of_one_entry_do_not_crowd_out_the_others():
+    # Entry 0 has more matching keys than the first limit * 4 window holds
+    keys = [f"ab{number}" for number in range(9)] + ["abz"]
+    array = _PrefixArray(keys, [0] * 9 + [1], [5] * 9 + [1])
+
+    assert array.search("ab", 2) == [0, 1]
+    assert array.search("ab", 1) == [0]
+    assert array.search("abz", 2) == [1]
+    assert array.search("b", 2) == []
+
+    index = SuggestIndex([], [], [1, 2], ["hoa " * 12, "a b c d e f g h i hoa"])
+    assert suggested_ids(index.suggest("hoa", 2)) == [1, 2]
@@ -0,0 +1,65 @@
+import pickle
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app.models.recommendation.constants import TFIDF_PARAMS
+from app.models.recommendation.vectorizer import CompactTfidfVectorizer, fit_vectorizer, fit_vectorizer_chunks
+
+DOCUMENTS = [
+    "hoa cuoi do price_low city_ha_noi",
+    "hoa cuoi trang price_medium city_ha_noi",
+    "banh cuoi ngot price_low city_hue",
+    "ao dai cuoi do price_high city_hue",
+    "nhan cuoi vang price_very_high city_ha_noi",
+    "thiep cuoi do price_very_low city_da_nang",
+] * 3
+
+QUERIES = ["hoa cuoi do", "thiep cuoi", "banh ngot hue", "khong co tu nao", ""]
+
+
+def assert_same_matrix(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.allclose(actual.toarray(), expected.toarray(), atol=1e-6)
+
+
+def test_compact_transform_matches_sklearn():
+    sklearn_vectorizer = TfidfVectorizer(**TFIDF_PARAMS).fit(DOCUMENTS)
+    compact = pickle.loads(pickle.dumps(CompactTfidfVectorizer.from_fitted(sklearn_vectorizer)))
+
+    assert compact.transform(QUERIES).dtype == np.float32
+    assert_same_matrix(compact.transform(QUERIES), sklearn_vectorizer.transform(QUERIES))
+    assert list(compact.get_feature_names_out()) == list(sklearn_vectorizer.get_feature_names_out())
+
+
+def test_term_column_matches_the_sklearn_vocabulary():
+    sklearn_vectorizer = TfidfVectorizer(**TFIDF_PARAMS).fit(DOCUMENTS)
+    compact = CompactTfidfVectorizer.from_fitted(sklearn_vectorizer)
+
+    for term, column in sklearn_vectorizer.vocabulary_.items():
+        assert compact.term_column(term) == column
+    assert compact.term_column("khong") == -1
+
+
+def test_loaded_vectorizer_keeps_no_term_dict():
+    compact, _ = fit_vectorizer(DOCUMENTS, TFIDF_PARAMS, mode="vocabulary")
+    loaded = pickle.loads(pickle.dumps(compact))
+    loaded.transform(QUERIES)
+
+    assert [name for name, value in vars(loaded).items() if isinstance(value, dict)] == ["analyzer_params"]
+    assert_same_matrix(loaded.transform(QUERIES), compact.transform(QUERIES))
+
+    # Models pickled with the term dict load without it
+    state = {**compact.__getstate__(), "_term_index": {"hoa": 0}}
+    old = CompactTfidfVectorizer.__new__(CompactTfidfVectorizer)
+    old.__setstate__(state)
+    assert "_term_index" not in vars(old)
+    assert_same_matrix(old.transform(QUERIES), compact.transform(QUERIES))
+
+
+def test_chunked_fit_matches_sklearn():
+    sklearn_matrix = TfidfVectorizer(**TFIDF_PARAMS).fit_transform(DOCUMENTS)
+    chunks = [DOCUMENTS[start:start + 4] for start in range(0, len(DOCUMENTS), 4)]
+
+    vectorizer, matrix = fit_vectorizer_chunks(iter(chunks), TFIDF_PARAMS, mode="vocabulary")
+
+    assert_same_matrix(matrix, sklearn_matrix)
+    assert_same_matrix(vectorizer.transform(QUERIES), TfidfVectorizer(**TFIDF_PARAMS).fit(DOCUMENTS).transform(QUERIES))